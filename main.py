@@ -1,18 +1,52 @@
+import itertools
+import json
 import os.path
 import random
 import shutil
 import time
 import threading
-from multiprocessing import Pool
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from multiprocessing import Manager, Pool
 from google.oauth2.service_account import Credentials
-from typing import Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
+from src.google.adaptive_concurrency import download_concurrency
 from src.google.gadmin import GAdmin
 from src.google.gdrive import GDrive, DRIVE_TYPE
-from src.aws.s3 import S3
-from src.utils.compressor import Compressor
+from src.google.permissions import permission_cache
+from src.google.rate_limits import (
+    EXPORT,
+    LISTING,
+    MEDIA,
+    PERMISSIONS,
+    drive_rate_limits,
+)
+from src.aws.s3 import S3, shared_s3
+from src.aws.transfer import pool_connections_for
+from src.utils.bundler import Bundler
+from src.utils.claims import ClaimRegistry
+from src.utils.archive_index import INDEX_SUFFIX
+from src.utils.compressor import ARCHIVE_EXTENSIONS, Compressor, StreamingArchive
+from src.utils.disk_budget import DiskBudget
 from src.utils.logger import app_logger as logger
+from src.utils.memory_budget import memory_budget
+from src.utils.scheduler import WorkQueues
 from src.utils.settings import Settings
+from src.utils.token_buckets import TokenBuckets
+from src.utils.volumes import (
+    MANIFEST_SUFFIX,
+    VolumeUploader,
+    VolumeWriter,
+    volume_name,
+)
+from src.utils.snapshots import (
+    MANIFEST_FILE_NAME,
+    SNAPSHOT_FILE_NAME,
+    load_previous_snapshot,
+    mark_backed_up_files,
+    reuse_unchanged_files,
+    write_snapshot,
+)
 from src.enums import STATE
 
 
@@ -21,6 +55,9 @@ SCOPES = [
     "https://www.googleapis.com/auth/admin.directory.user.readonly",
     "https://www.googleapis.com/auth/drive.readonly",
 ]
+SCHEDULER_CHUNK_SIZE = 20
+DISK_BUDGET: Optional[DiskBudget] = None
+RESULTS_DIR_NAME = ".results"
 
 random.seed(time.time())
 
@@ -31,45 +68,320 @@ def get_credentials(subject: str) -> Credentials:
     ).with_subject(subject)
 
 
+def s3_pool_connections() -> int:
+    # Shared by folder uploads, JIT uploads of every download thread and
+    # streamed parts
+    return (
+        pool_connections_for(
+            max(SETTINGS.S3_UPLOAD_CONCURRENCY, SETTINGS.MAX_DOWNLOAD_THREADS)
+        )
+        + SETTINGS.UPLOAD_BUFFERS
+    )
+
+
+def gdrive_options() -> Dict[str, Any]:
+    """Keyword arguments of `GDrive` shared by user and shared drives."""
+    return {
+        "include_shared_with_me": SETTINGS.INCLUDE_SHARED_WITH_ME,
+        "jit_s3_upload": SETTINGS.JIT_S3_UPLOAD,
+        "s3_role_based_access": SETTINGS.S3_ROLE_BASED_ACCESS,
+        "s3_bucket_name": SETTINGS.S3_BUCKET_NAME,
+        "s3_access_key": SETTINGS.S3_ACCESS_KEY,
+        "s3_secret_key": SETTINGS.S3_SECRET_KEY,
+        "content_addressed_storage": SETTINGS.CONTENT_ADDRESSED_STORAGE,
+        "batch_shortcut_lookups": SETTINGS.BATCH_SHORTCUT_LOOKUPS,
+        "ranged_download_threshold": SETTINGS.RANGED_DOWNLOAD_THRESHOLD_MB
+        * 1024
+        * 1024,
+        "ranged_download_threads": SETTINGS.RANGED_DOWNLOAD_THREADS,
+        "zero_staging_uploads": SETTINGS.ZERO_STAGING_UPLOADS,
+        "upload_part_size": SETTINGS.UPLOAD_PART_SIZE_MB * 1024 * 1024,
+        "upload_buffers": SETTINGS.UPLOAD_BUFFERS,
+        "s3_max_pool_connections": s3_pool_connections(),
+    }
+
+
+def get_s3() -> S3:
+    if SETTINGS.S3_ROLE_BASED_ACCESS:
+        return shared_s3(
+            SETTINGS.S3_BUCKET_NAME,
+            None,
+            None,
+            role_based=True,
+            max_pool_connections=s3_pool_connections(),
+        )
+    return shared_s3(
+        SETTINGS.S3_BUCKET_NAME,
+        SETTINGS.S3_ACCESS_KEY,
+        SETTINGS.S3_SECRET_KEY,
+        max_pool_connections=s3_pool_connections(),
+    )
+
+
 def download_files_from_drive(
-    drive: GDrive, metadata_path: str, files_path: str
+    drive: GDrive, downloads_path: str, current_timestamp: str
 ) -> None:
     drive_id = drive.drive_id
+    metadata_path = f"{downloads_path}/{MANIFEST_FILE_NAME}"
+    files_path = f"{downloads_path}/files"
+    if SETTINGS.STREAM_DOWNLOADS:
+        logger.info(f"({drive_id}) Listing and downloading files")
+        drive.stream_download_all_files(
+            files_path, threads=SETTINGS.MAX_DOWNLOAD_THREADS
+        )
+        drive.flush_bundle(files_path)
+        logger.info(f"({drive_id}) Files downloaded")
+        mark_backed_up_files(drive, current_timestamp)
+        drive.dump_file_list(metadata_path)
+        logger.info(f"({drive_id}) File list saved to {metadata_path}")
+        return
+
     drive.fetch_file_list()
     logger.debug(f"({drive_id}) Files found: {len(drive.files)}")
     drive.dump_file_list(metadata_path)
     logger.info(f"({drive_id}) File list saved to {metadata_path}")
 
-    logger.info(f"({drive_id}) Downloading {len(drive.files)} files")
-    drive.download_all_files(files_path, threads=SETTINGS.MAX_DOWNLOAD_THREADS)
+    reused_ids = set()
+    if SETTINGS.REUSE_UNCHANGED_FILES != "none":
+        reused_ids = reuse_files_from_previous_snapshot(
+            drive, downloads_path, current_timestamp
+        )
+    file_ids = [file_id for file_id in drive.files if file_id not in reused_ids]
+
+    logger.info(f"({drive_id}) Downloading {len(file_ids)} files")
+    drive.download_all_files(
+        files_path, threads=SETTINGS.MAX_DOWNLOAD_THREADS, file_ids=file_ids
+    )
+    drive.flush_bundle(files_path)
     logger.info(f"({drive_id}) Files downloaded")
+    mark_backed_up_files(drive, current_timestamp)
+    drive.dump_file_list(metadata_path)
+
+
+def reuse_files_from_previous_snapshot(
+    drive: GDrive, downloads_path: str, current_timestamp: str
+) -> Set[str]:
+    drive_id = drive.drive_id
+    s3 = get_s3()
+    previous_timestamp, previous_snapshot, previous_files = load_previous_snapshot(
+        s3, drive_id, before=current_timestamp
+    )
+    if previous_timestamp is None:
+        logger.info(f"({drive_id}) No previous snapshot, nothing to reuse")
+        return set()
+    if previous_snapshot.get("compressed", True):
+        logger.info(
+            f"({drive_id}) Previous snapshot {previous_timestamp} is compressed, nothing to reuse"
+        )
+        return set()
+
+    reuse_time_start = time.time()
+    reused_ids = reuse_unchanged_files(
+        drive,
+        s3,
+        previous_files,
+        current_timestamp,
+        f"{downloads_path}/files",
+        SETTINGS.REUSE_UNCHANGED_FILES,
+        threads=SETTINGS.MAX_DOWNLOAD_THREADS,
+    )
+    logger.info(
+        f"({drive_id}) Reused {len(reused_ids)} unchanged files from {previous_timestamp} in {time.time() - reuse_time_start:.2f}s ({SETTINGS.REUSE_UNCHANGED_FILES})"
+    )
+    return reused_ids
+
+
+def download_changed_files_from_drive(
+    drive: GDrive, downloads_path: str, current_timestamp: str
+) -> Dict[str, Any]:
+    drive_id = drive.drive_id
+    metadata_path = f"{downloads_path}/{MANIFEST_FILE_NAME}"
+    files_path = f"{downloads_path}/files"
+
+    previous_timestamp, previous_snapshot, previous_files = load_previous_snapshot(
+        get_s3(), drive_id, before=current_timestamp
+    )
+    changes = None
+    if previous_timestamp is not None and previous_snapshot.get("start_page_token"):
+        try:
+            changes = drive.fetch_changes(
+                previous_snapshot["start_page_token"], previous_files
+            )
+        except Exception as e:
+            logger.warning(
+                f"({drive_id}) Could not fetch changes since {previous_timestamp}, falling back to full backup: {e}"
+            )
+
+    if changes is None:
+        logger.info(f"({drive_id}) No usable previous snapshot, running full backup")
+        start_page_token = drive.get_start_page_token()
+        download_files_from_drive(drive, downloads_path, current_timestamp)
+        return {"start_page_token": start_page_token, "base_timestamp": None}
+
+    changed_ids, start_page_token = changes
+    logger.info(
+        f"({drive_id}) {len(changed_ids)} files changed since {previous_timestamp}"
+    )
+    drive.dump_file_list(metadata_path)
+    drive.download_all_files(
+        files_path, threads=SETTINGS.MAX_DOWNLOAD_THREADS, file_ids=changed_ids
+    )
+    drive.flush_bundle(files_path)
+    logger.info(f"({drive_id}) Changed files downloaded")
+    mark_backed_up_files(drive, current_timestamp)
+    drive.dump_file_list(metadata_path)
+    return {
+        "start_page_token": start_page_token,
+        "base_timestamp": previous_timestamp,
+    }
+
+
+def get_compressor() -> Compressor:
+    return Compressor(
+        SETTINGS.COMPRESSION_ALGORITHM,
+        max_processes=SETTINGS.COMPRESSION_PROCESSES,
+        engine=SETTINGS.COMPRESSION_ENGINE,
+        level=SETTINGS.COMPRESSION_LEVEL,
+        adaptive=SETTINGS.ADAPTIVE_COMPRESSION,
+        seekable=SETTINGS.SEEKABLE_ARCHIVES,
+        volume_size=SETTINGS.ARCHIVE_VOLUME_SIZE_MB * 1024 * 1024,
+    )
+
 
+def archive_file_ids(drive: GDrive) -> Dict[str, str]:
+    """Maps archive member names to Drive file IDs for archive indexes,
+    members are named after the files' backup path."""
+    return {
+        file["backup_path"]: file_id
+        for file_id, file in drive.files.items()
+        if "backup_path" in file
+    }
 
-def compress_files_from_drive(drive_id: str, files_path: str) -> None:
+
+def compress_files_from_drive(
+    drive_id: str,
+    files_path: str,
+    timestamp: str,
+    file_ids: Optional[Dict[str, str]] = None,
+) -> None:
     logger.info(f"({drive_id}) Compressing files")
     compress_time_start = time.time()
-    compressor = Compressor(
-        SETTINGS.COMPRESSION_ALGORITHM, max_processes=SETTINGS.COMPRESSION_PROCESSES
-    )
-    _, tar_size = compressor.compress_folder(files_path, delete_original=True)
+    compressor = get_compressor()
+    uploader = None
+    if compressor.volume_size:
+        uploader = VolumeUploader(
+            lambda volume_path: upload_volume(drive_id, volume_path, timestamp),
+            SETTINGS.ARCHIVE_VOLUME_UPLOADS,
+        )
+    try:
+        _, tar_size = compressor.compress_folder(
+            files_path,
+            delete_original=True,
+            file_ids=file_ids,
+            on_volume=uploader.submit if uploader is not None else None,
+        )
+    finally:
+        if uploader is not None:
+            uploader.wait()
     logger.info(
         f"({drive_id}) Files compressed in {time.time() - compress_time_start:.2f}s ({tar_size/1024/1024:.2f}MB)"
     )
 
 
+def expected_archive_size(uncompressed_size: int) -> int:
+    """Disk space compressing `uncompressed_size` bytes of files needs at
+    most, next to the files themselves. Volumes are deleted once uploaded,
+    so only those being written or uploaded are on disk at once."""
+    volume_size = SETTINGS.ARCHIVE_VOLUME_SIZE_MB * 1024 * 1024
+    if volume_size:
+        return min(
+            uncompressed_size, volume_size * (SETTINGS.ARCHIVE_VOLUME_UPLOADS + 1)
+        )
+    return uncompressed_size
+
+
+def pipelined_archive_key(drive_id: str, timestamp: str) -> str:
+    return f"{timestamp}/{drive_id}/files.{ARCHIVE_EXTENSIONS[SETTINGS.COMPRESSION_ALGORITHM]}"
+
+
+def upload_volume(drive_id: str, volume_path: str, timestamp: str) -> None:
+    # Volumes are next to the drive's files.json, where upload_files_to_s3
+    # would have put them
+    get_s3().upload_file(
+        volume_path, f"{timestamp}/{drive_id}/{os.path.basename(volume_path)}"
+    )
+    os.remove(volume_path)
+
+
+def open_pipelined_archive(
+    drive: GDrive, downloads_path: str, timestamp: str
+) -> StreamingArchive:
+    """Starts compressing the drive into S3 while it downloads: every saved
+    file is added to the archive and removed from the disk."""
+    s3 = get_s3()
+    key = pipelined_archive_key(drive.drive_id, timestamp)
+    compressor = get_compressor()
+
+    def open_output() -> Any:
+        if not compressor.volume_size:
+            return s3.open_multipart_writer(
+                key, drive.part_buffers, drive.upload_executor
+            )
+        # Every volume is a multipart upload of its own
+        return VolumeWriter(
+            lambda number: s3.open_multipart_writer(
+                volume_name(key, number), drive.part_buffers, drive.upload_executor
+            ),
+            compressor.volume_size,
+        )
+
+    archive = StreamingArchive(compressor, open_output)
+
+    def add_to_archive(file: Dict[str, Any], saved_file_path: str) -> None:
+        archive.add(
+            saved_file_path,
+            os.path.relpath(saved_file_path, downloads_path),
+            file.get("mimeType"),
+        )
+        os.remove(saved_file_path)
+
+    drive.on_file_saved = add_to_archive
+    return archive
+
+
+def close_pipelined_archive(
+    drive: GDrive, archive: StreamingArchive, timestamp: str
+) -> int:
+    """Finishes the archive, uploads its index if it is seekable and its
+    manifest if it is split into volumes, and returns its compressed size."""
+    archive_size = archive.close()
+    if archive_size == 0:
+        return archive_size
+    key = pipelined_archive_key(drive.drive_id, timestamp)
+    s3 = get_s3()
+    index = archive.index(os.path.basename(key), archive_file_ids(drive))
+    if index is not None:
+        s3.upload_json(f"{key}{INDEX_SUFFIX}", index)
+    manifest = archive.manifest(os.path.basename(key))
+    if manifest is not None:
+        s3.upload_json(f"{key}{MANIFEST_SUFFIX}", manifest)
+    return archive_size
+
+
 def upload_files_to_s3(
     drive_id: str,
     downloads_path: str,
     timestamp: str,
     delete_after_upload: bool = False,
 ) -> None:
-    if SETTINGS.S3_ROLE_BASED_ACCESS:
-        s3 = S3(SETTINGS.S3_BUCKET_NAME, None, None, role_based=True)
-    else:
-        s3 = S3(SETTINGS.S3_BUCKET_NAME, SETTINGS.S3_ACCESS_KEY, SETTINGS.S3_SECRET_KEY)
+    s3 = get_s3()
     logger.info(f"({drive_id}) Uploading files to S3")
     upload_time_start = time.time()
-    upload_size = s3.upload_folder(downloads_path, f"{timestamp}/{drive_id}")
+    upload_size = s3.upload_folder(
+        downloads_path,
+        f"{timestamp}/{drive_id}",
+        concurrency=SETTINGS.S3_UPLOAD_CONCURRENCY,
+    )
     upload_size_mb = upload_size / 1024 / 1024
     upload_speed_mb = upload_size_mb / (time.time() - upload_time_start)
     if delete_after_upload:
@@ -79,17 +391,351 @@ def upload_files_to_s3(
     )
 
 
+def download_memory_budget() -> int:
+    budget = SETTINGS.MEMORY_BUDGET_MB * 1024 * 1024
+    if budget > 0 and SETTINGS.ZERO_STAGING_UPLOADS:
+        # Part buffers of streamed uploads are allocated up front
+        budget -= SETTINGS.UPLOAD_BUFFERS * SETTINGS.UPLOAD_PART_SIZE_MB * 1024 * 1024
+    return budget
+
+
+def init_worker(
+    shared_permissions: Dict[str, Any],
+    disk_budget: Optional[DiskBudget],
+    rate_limits: Optional[TokenBuckets],
+) -> None:
+    global DISK_BUDGET
+    permission_cache.share(shared_permissions)
+    drive_rate_limits.share(rate_limits)
+    DISK_BUDGET = disk_budget
+    memory_budget.configure(download_memory_budget(), SETTINGS.MAX_DOWNLOAD_THREADS)
+    download_concurrency.configure(adaptive_concurrency_limit())
+
+
+def get_rate_limits(manager: Any) -> Optional[TokenBuckets]:
+    requests_per_minute = {
+        LISTING: SETTINGS.LISTING_REQUESTS_PER_MINUTE,
+        PERMISSIONS: SETTINGS.PERMISSION_REQUESTS_PER_MINUTE,
+        EXPORT: SETTINGS.EXPORT_REQUESTS_PER_MINUTE,
+        MEDIA: SETTINGS.MEDIA_REQUESTS_PER_MINUTE,
+    }
+    if not any(requests_per_minute.values()):
+        return None
+    return TokenBuckets(
+        manager, {kind: rpm / 60 for kind, rpm in requests_per_minute.items()}
+    )
+
+
+def async_download_concurrency() -> int:
+    if SETTINGS.DOWNLOAD_ENGINE != "asyncio":
+        return 0
+    return SETTINGS.ASYNC_DOWNLOAD_CONCURRENCY
+
+
+def adaptive_concurrency_limit() -> int:
+    if not SETTINGS.ADAPTIVE_CONCURRENCY:
+        return 0
+    return async_download_concurrency() or SETTINGS.MAX_DOWNLOAD_THREADS
+
+
+def get_bundler(downloads_path: str) -> Optional[Bundler]:
+    if not SETTINGS.BUNDLE_FILE_SIZE_KB:
+        return None
+    return Bundler(
+        f"{downloads_path}/bundles",
+        SETTINGS.BUNDLE_FILE_SIZE_KB * 1024,
+        SETTINGS.BUNDLE_SIZE_MB * 1024 * 1024,
+        SETTINGS.BUNDLE_MAX_AGE_SECONDS,
+    )
+
+
+def blob_registry_path(timestamp: str) -> str:
+    return f"downloads/{timestamp}/.blobs"
+
+
+def path_registry_path(timestamp: str) -> str:
+    return f"downloads/{timestamp}/.paths"
+
+
+def record_drive_error(downloads_path: str, message: str) -> None:
+    os.makedirs(downloads_path, exist_ok=True)
+    with open(f"{downloads_path}/errors.txt", "a") as f:
+        f.write(f"{message}\n")
+
+
+def list_drive_for_scheduler(
+    drive: GDrive, current_timestamp: str, queues: WorkQueues
+) -> bool:
+    drive_id = drive.drive_id
+    downloads_path = f"downloads/{current_timestamp}/{drive_id}"
+    try:
+        logger.info(f"({drive_id}) Listing files")
+        drive.fetch_file_list()
+        drive.dump_file_list(f"{downloads_path}/{MANIFEST_FILE_NAME}")
+        file_ids = list(drive.files)
+        chunks = [
+            file_ids[i : i + SCHEDULER_CHUNK_SIZE]
+            for i in range(0, len(file_ids), SCHEDULER_CHUNK_SIZE)
+        ]
+        queues.put(drive_id, chunks)
+        logger.info(
+            f"({drive_id}) {len(file_ids)} files found, queued in {len(chunks)} chunks"
+        )
+    except Exception as e:
+        logger.error(f"({drive_id}) Error listing drive: {e}")
+        record_drive_error(downloads_path, f"Error listing drive: {e}")
+    return queues.finish_listing(drive_id)
+
+
+def save_chunk_results(
+    drive: GDrive, current_timestamp: str, file_ids: List[str]
+) -> None:
+    # The drive is finalized by whichever process downloads its last chunk,
+    # so every process leaves its results next to the manifest
+    downloads_path = f"downloads/{current_timestamp}/{drive.drive_id}"
+    results = {}
+    for file_id in file_ids:
+        file = drive.files[file_id]
+        result = {
+            key: file[key]
+            for key in ("backup_path", "blob", "bundle", "unavailable")
+            if key in file
+        }
+        if result:
+            results[file_id] = result
+    results_path = f"{downloads_path}/{RESULTS_DIR_NAME}"
+    os.makedirs(results_path, exist_ok=True)
+    with open(f"{results_path}/{os.getpid()}.jsonl", "a") as f:
+        f.write(json.dumps(results) + "\n")
+
+
+def finalize_scheduled_drive(drive: GDrive, current_timestamp: str) -> bool:
+    drive_id = drive.drive_id
+    downloads_path = f"downloads/{current_timestamp}/{drive_id}"
+    metadata_path = f"{downloads_path}/{MANIFEST_FILE_NAME}"
+    files_path = f"{downloads_path}/files"
+    results_path = f"{downloads_path}/{RESULTS_DIR_NAME}"
+    try:
+        if os.path.exists(f"{downloads_path}/errors.txt"):
+            raise RuntimeError(f"errors recorded in {downloads_path}/errors.txt")
+
+        drive.load_file_list(metadata_path)
+        if os.path.isdir(results_path):
+            for name in os.listdir(results_path):
+                with open(f"{results_path}/{name}") as f:
+                    for line in f:
+                        for file_id, result in json.loads(line).items():
+                            drive.files[file_id].update(result)
+            shutil.rmtree(results_path)
+        mark_backed_up_files(drive, current_timestamp)
+        drive.dump_file_list(metadata_path)
+        write_snapshot(
+            f"{downloads_path}/{SNAPSHOT_FILE_NAME}",
+            {"compressed": SETTINGS.COMPRESS_DRIVES},
+        )
+
+        file_count = len(drive.files)
+        if SETTINGS.COMPRESS_DRIVES and file_count > 0 and os.path.isdir(files_path):
+            compress_files_from_drive(
+                drive_id, files_path, current_timestamp, archive_file_ids(drive)
+            )
+        if file_count > 0:
+            upload_files_to_s3(
+                drive_id,
+                downloads_path,
+                current_timestamp,
+                delete_after_upload=SETTINGS.AUTO_CLEANUP,
+            )
+        else:
+            logger.warning(f"({drive_id}) No files found, skipping upload")
+        logger.info(f"({drive_id}) Drive processed ({file_count} files)")
+        return True
+    except Exception as e:
+        logger.error(f"({drive_id}) Error processing drive: {e}")
+        record_drive_error(downloads_path, f"Error processing drive: {e}")
+        return False
+
+
+def scheduler_worker(
+    args: Tuple[int, List[GDrive], str, WorkQueues],
+) -> Dict[str, bool]:
+    """Lists the drives assigned to this worker, then downloads chunks of any
+    drive until all of them are done, home drives first. Returns the result
+    of every drive finalized by this worker.
+
+    Files of all chunks go through one pool of MAX_DOWNLOAD_THREADS threads,
+    and a new chunk is taken as soon as a thread is free, so a large file
+    never leaves the other threads waiting for it.
+    """
+    worker_index, drives, current_timestamp, queues = args
+    drives_by_id = {drive.drive_id: drive for drive in drives}
+    home_drives = drives[worker_index :: SETTINGS.MAX_DRIVE_PROCESSES]
+    home_drive_ids = [drive.drive_id for drive in home_drives]
+    loaded_drive_ids = set()
+    results = {}
+
+    for drive in drives:
+        drive.path_registry = ClaimRegistry(path_registry_path(current_timestamp))
+        drive.bundler = get_bundler(f"downloads/{current_timestamp}/{drive.drive_id}")
+        if SETTINGS.CONTENT_ADDRESSED_STORAGE:
+            drive.blob_registry = ClaimRegistry(blob_registry_path(current_timestamp))
+
+    for drive in home_drives:
+        loaded_drive_ids.add(drive.drive_id)
+        if list_drive_for_scheduler(drive, current_timestamp, queues):
+            results[drive.drive_id] = finalize_scheduled_drive(drive, current_timestamp)
+
+    def files_path(drive_id: str) -> str:
+        return f"downloads/{current_timestamp}/{drive_id}/files"
+
+    # Downloaded chunks are only marked as done once no chunk of their drive
+    # is left. Until then their files may sit in this worker's open bundle,
+    # or wait for blobs claimed by other workers.
+    finished_chunks: Dict[str, List[List[str]]] = {}
+    prepared_drive_ids = set()
+    chunk_numbers = itertools.count()
+    remaining_files: Dict[int, int] = {}
+    running: Dict[Future, Tuple[str, int, List[str]]] = {}
+
+    def take_chunk() -> bool:
+        work = queues.get(home_drive_ids)
+        if work is None:
+            return False
+        drive_id, file_ids = work
+        drive = drives_by_id[drive_id]
+        try:
+            if drive_id not in loaded_drive_ids:
+                drive.load_file_list(
+                    f"downloads/{current_timestamp}/{drive_id}/{MANIFEST_FILE_NAME}"
+                )
+                loaded_drive_ids.add(drive_id)
+            if drive_id not in prepared_drive_ids and drive.batch_shortcut_lookups:
+                drive.prefetch_shortcut_targets()
+            prepared_drive_ids.add(drive_id)
+        except Exception as e:
+            logger.error(f"({drive_id}) Error downloading files: {e}")
+            record_drive_error(
+                os.path.dirname(files_path(drive_id)), f"Error downloading files: {e}"
+            )
+            finished_chunks.setdefault(drive_id, []).append([])
+            return True
+        chunk = next(chunk_numbers)
+        remaining_files[chunk] = len(file_ids)
+        for file_id in file_ids:
+            future = executor.submit(
+                drive.download_file, drive.files[file_id], files_path(drive_id)
+            )
+            running[future] = (drive_id, chunk, file_ids)
+        if not file_ids:
+            finished_chunks.setdefault(drive_id, []).append(file_ids)
+        return True
+
+    def file_done(future: Future) -> None:
+        drive_id, chunk, file_ids = running.pop(future)
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"({drive_id}) Error downloading files: {e}")
+            record_drive_error(
+                os.path.dirname(files_path(drive_id)), f"Error downloading files: {e}"
+            )
+        remaining_files[chunk] -= 1
+        if remaining_files[chunk] == 0:
+            del remaining_files[chunk]
+            finished_chunks.setdefault(drive_id, []).append(file_ids)
+
+    def finish_drive(drive_id: str, chunks: List[List[str]]) -> Optional[bool]:
+        drive = drives_by_id[drive_id]
+        drive.download_blobs_claimed_elsewhere(files_path(drive_id))
+        drive.flush_bundle(files_path(drive_id))
+        for file_ids in chunks:
+            save_chunk_results(drive, current_timestamp, file_ids)
+            if queues.task_done(drive_id):
+                return finalize_scheduled_drive(drive, current_timestamp)
+        return None
+
+    # Waiting for blobs and finalizing (compressing, uploading) take long,
+    # the threads keep downloading other chunks meanwhile
+    finishing: Dict[Future, str] = {}
+
+    def finish_drives() -> None:
+        busy_drive_ids = {drive_id for drive_id, _, _ in running.values()}
+        for drive_id in list(finished_chunks):
+            if drive_id in busy_drive_ids or queues.has_pending(drive_id):
+                continue
+            future = finisher.submit(
+                finish_drive, drive_id, finished_chunks.pop(drive_id)
+            )
+            finishing[future] = drive_id
+
+    def drive_finished(future: Future) -> None:
+        drive_id = finishing.pop(future)
+        result = future.result()
+        if result is not None:
+            results[drive_id] = result
+
+    with (
+        ThreadPoolExecutor(max_workers=SETTINGS.MAX_DOWNLOAD_THREADS) as executor,
+        ThreadPoolExecutor(max_workers=len(drives)) as finisher,
+    ):
+        while True:
+            finish_drives()
+            if not running and not finishing and queues.all_done():
+                break
+            while len(running) < SETTINGS.MAX_DOWNLOAD_THREADS and take_chunk():
+                pass
+            if not running and not finishing:
+                time.sleep(1)  # Other workers are still listing or downloading
+                continue
+            done, _ = wait(
+                [*running, *finishing], timeout=1, return_when=FIRST_COMPLETED
+            )
+            for future in done:
+                if future in finishing:
+                    drive_finished(future)
+                else:
+                    file_done(future)
+
+    return results
+
+
+def run_work_stealing_scheduler(
+    pool: Any, manager: Any, drives: List[GDrive], current_timestamp: str
+) -> Tuple[Set[str], Set[str]]:
+    queues = WorkQueues(manager, [drive.drive_id for drive in drives])
+    workers = min(SETTINGS.MAX_DRIVE_PROCESSES, len(drives))
+    processed_drives = set()
+    failed_drives = set()
+    for results in pool.imap_unordered(
+        scheduler_worker,
+        [(i, drives, current_timestamp, queues) for i in range(workers)],
+    ):
+        for drive_id, success in results.items():
+            if success:
+                processed_drives.add(drive_id)
+            else:
+                failed_drives.add(drive_id)
+    return processed_drives, failed_drives
+
+
+def can_start_drive(disk_budget: Optional[DiskBudget], running_processes: List) -> bool:
+    # New drives wait until running ones upload and free their disk space
+    if disk_budget is None or not running_processes:
+        return True
+    return not disk_budget.near_limit()
+
+
 def process_drive(args: Tuple[GDrive, str]) -> bool:
     current_task = STATE.STARTING
     drive, current_timestamp = args
     start_time = time.time()
     drive_id = drive.drive_id
     downloads_path = f"downloads/{current_timestamp}/{drive_id}"
-    metadata_path = f"{downloads_path}/files.json"
     files_path = f"{downloads_path}/files"
 
     stop_event = threading.Event()
     status_thread = None
+    archive = None
 
     def print_status():
         counter = 0
@@ -101,6 +747,15 @@ def process_drive(args: Tuple[GDrive, str]) -> bool:
                     f"({drive_id}) Current status: {current_task.value}. Files found: {len(drive.files)}. Time elapsed: {time.time() - start_time:.2f}s"
                 )
 
+    if SETTINGS.CONTENT_ADDRESSED_STORAGE:
+        drive.blob_registry = ClaimRegistry(blob_registry_path(current_timestamp))
+    drive.disk_budget = DISK_BUDGET
+    if SETTINGS.COMPRESS_DRIVES and not SETTINGS.PIPELINED_COMPRESSION:
+        # The archive is written next to the files before they are deleted
+        drive.expected_archive_size = expected_archive_size
+    drive.bundler = get_bundler(downloads_path)
+    drive.async_download_concurrency = async_download_concurrency()
+
     try:
         status_thread = threading.Thread(target=print_status, daemon=True)
         status_thread.start()
@@ -111,14 +766,33 @@ def process_drive(args: Tuple[GDrive, str]) -> bool:
             current_task = STATE.DOWNLOADING_AND_JIT_UPLOADING
         else:
             current_task = STATE.DOWNLOADING
-        download_files_from_drive(drive, metadata_path, files_path)
+        if SETTINGS.PIPELINED_COMPRESSION:
+            archive = open_pipelined_archive(drive, downloads_path, current_timestamp)
+        snapshot = {"compressed": SETTINGS.COMPRESS_DRIVES}
+        if SETTINGS.INCREMENTAL_BACKUPS:
+            snapshot.update(
+                download_changed_files_from_drive(
+                    drive, downloads_path, current_timestamp
+                )
+            )
+        else:
+            download_files_from_drive(drive, downloads_path, current_timestamp)
+        write_snapshot(f"{downloads_path}/{SNAPSHOT_FILE_NAME}", snapshot)
 
         file_count = len(drive.files)
 
-        if SETTINGS.COMPRESS_DRIVES and file_count > 0:
+        if archive is not None:
+            current_task = STATE.COMPRESSING
+            archive_size = close_pipelined_archive(drive, archive, current_timestamp)
+            logger.info(
+                f"({drive_id}) Archive uploaded while downloading ({archive_size/1024/1024:.2f}MB)"
+            )
+        elif SETTINGS.COMPRESS_DRIVES and file_count > 0 and os.path.isdir(files_path):
             current_task = STATE.COMPRESSING
-            compress_files_from_drive(drive_id, files_path)
-        elif SETTINGS.COMPRESS_DRIVES and file_count == 0:
+            compress_files_from_drive(
+                drive_id, files_path, current_timestamp, archive_file_ids(drive)
+            )
+        elif SETTINGS.COMPRESS_DRIVES:
             logger.debug(f"({drive_id}) No files found, skipping compression")
         else:
             logger.debug(f"({drive_id}) Compression disabled")
@@ -142,11 +816,15 @@ def process_drive(args: Tuple[GDrive, str]) -> bool:
 
     except Exception as e:
         logger.error(f"({drive_id}) Error processing drive: {e}")
+        if archive is not None:
+            archive.abort()
         os.makedirs(f"{downloads_path}", exist_ok=True)
         with open(f"{downloads_path}/errors.txt", "a") as f:
             f.write(f"Error processing drive: {e}\n")
         return False
     finally:
+        # Uploaded files are deleted, failed drives don't get any more space
+        drive.release_staged_bytes()
         stop_event.set()
         if status_thread and status_thread.is_alive():
             status_thread.join(timeout=1.0)
@@ -162,6 +840,7 @@ def main():
     shared_drives = [drive["id"] for drive in gadmin.get_shared_drives()]
     logger.debug(f"Shared drives found: {shared_drives}")
 
+    drive_options = gdrive_options()
     drives = []
     for drive_name in users:
         drives.append(
@@ -169,12 +848,7 @@ def main():
                 drive_name,
                 get_credentials(drive_name),
                 DRIVE_TYPE.USER,
-                SETTINGS.INCLUDE_SHARED_WITH_ME,
-                SETTINGS.JIT_S3_UPLOAD,
-                SETTINGS.S3_ROLE_BASED_ACCESS,
-                SETTINGS.S3_BUCKET_NAME,
-                SETTINGS.S3_ACCESS_KEY,
-                SETTINGS.S3_SECRET_KEY,
+                **drive_options,
             )
         )
     for drive_name in shared_drives:
@@ -183,12 +857,7 @@ def main():
                 drive_name,
                 admin_credentials,
                 DRIVE_TYPE.SHARED,
-                SETTINGS.INCLUDE_SHARED_WITH_ME,
-                SETTINGS.JIT_S3_UPLOAD,
-                SETTINGS.S3_ROLE_BASED_ACCESS,
-                SETTINGS.S3_BUCKET_NAME,
-                SETTINGS.S3_ACCESS_KEY,
-                SETTINGS.S3_SECRET_KEY,
+                **drive_options,
             )
         )
 
@@ -214,7 +883,18 @@ def main():
         drives
     )  # In case of failure, every backup will have some unique data
 
-    with Pool(processes=SETTINGS.MAX_DRIVE_PROCESSES) as pool:
+    manager = Manager()
+    shared_permissions = manager.dict()
+    disk_budget = None
+    if SETTINGS.DISK_BUDGET_MB > 0:
+        disk_budget = DiskBudget(manager, SETTINGS.DISK_BUDGET_MB * 1024 * 1024)
+    rate_limits = get_rate_limits(manager)
+
+    with Pool(
+        processes=SETTINGS.MAX_DRIVE_PROCESSES,
+        initializer=init_worker,
+        initargs=(shared_permissions, disk_budget, rate_limits),
+    ) as pool:
         current_timestamp = time.strftime("%Y%m%d-%H%M%S")
         logger.debug(f"Current timestamp: {current_timestamp}")
 
@@ -223,9 +903,17 @@ def main():
         failed_drives = set()
         running_processes = []
 
+        if SETTINGS.WORK_STEALING_SCHEDULER:
+            processed_drives, failed_drives = run_work_stealing_scheduler(
+                pool, manager, drives, current_timestamp
+            )
+            remaining_drives = []
+
         # Initial process spawning
         while (
-            len(running_processes) < SETTINGS.MAX_DRIVE_PROCESSES and remaining_drives
+            len(running_processes) < SETTINGS.MAX_DRIVE_PROCESSES
+            and remaining_drives
+            and can_start_drive(disk_budget, running_processes)
         ):
             drive_args = remaining_drives.pop(0)
             result = pool.apply_async(process_drive, (drive_args,))
@@ -246,11 +934,15 @@ def main():
 
                     running_processes.remove((drive_args, result))
 
-                    # Spawn new process if there are remaining drives
-                    if remaining_drives:
-                        new_drive_args = remaining_drives.pop(0)
-                        new_result = pool.apply_async(process_drive, (new_drive_args,))
-                        running_processes.append((new_drive_args, new_result))
+            # Spawn new processes if there are remaining drives and disk space
+            while (
+                len(running_processes) < SETTINGS.MAX_DRIVE_PROCESSES
+                and remaining_drives
+                and can_start_drive(disk_budget, running_processes)
+            ):
+                new_drive_args = remaining_drives.pop(0)
+                new_result = pool.apply_async(process_drive, (new_drive_args,))
+                running_processes.append((new_drive_args, new_result))
 
             time.sleep(1)  # Short sleep to prevent CPU spinning
 
@@ -264,6 +956,11 @@ def main():
             logger.warning("Some drives were not processed successfully!")
             logger.warning(f"Failed drives: {failed_drives}")
 
+    if SETTINGS.CONTENT_ADDRESSED_STORAGE:
+        shutil.rmtree(blob_registry_path(current_timestamp), ignore_errors=True)
+    if SETTINGS.WORK_STEALING_SCHEDULER:
+        shutil.rmtree(path_registry_path(current_timestamp), ignore_errors=True)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,237 @@
+import hashlib
+import io
+import math
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from src.utils.logger import app_logger as logger
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 limit for every part but the last
+# Part size doubles every this many parts, so uploads of unknown size stay
+# within the 10000 parts S3 allows (more than 1000 times `part_size` at 10000)
+PARTS_PER_SIZE = 1000
+
+
+class BufferPool:
+    """Fixed number of reusable part buffers shared by all uploads of a
+    process. Writers block when every buffer is being filled or uploaded,
+    which bounds the memory used by streamed uploads to `count * size`.
+
+    Buffers for parts larger than `size` take as many buffers' worth of the
+    pool as they need, so the bound holds for them too.
+    """
+
+    def __init__(self, count: int, size: int) -> None:
+        if size < MIN_PART_SIZE:
+            raise ValueError(f"Part size must be at least {MIN_PART_SIZE} bytes")
+        self.count = count
+        self.size = size
+        self._available: List[io.BytesIO] = []
+        self._created = 0
+        self._in_use = 0
+        self._condition = threading.Condition()
+
+    def _slots(self, part_size: Optional[int]) -> int:
+        if part_size is None:
+            return 1
+        # A part larger than the whole pool waits until it has it all
+        return min(self.count, math.ceil(part_size / self.size))
+
+    def acquire(self, part_size: Optional[int] = None) -> io.BytesIO:
+        slots = self._slots(part_size)
+        with self._condition:
+            while self._in_use + slots > self.count:
+                self._condition.wait()
+            self._in_use += slots
+            if self._available:
+                return self._available.pop()
+            self._created += 1
+            return io.BytesIO()
+
+    def release(self, buffer: io.BytesIO, part_size: Optional[int] = None) -> None:
+        buffer.seek(0)
+        buffer.truncate()
+        with self._condition:
+            self._in_use -= self._slots(part_size)
+            self._available.append(buffer)
+            self._condition.notify_all()
+
+
+class MultipartUploadWriter:
+    """Write-only file object that uploads everything written to it to S3.
+
+    Data is collected in buffers from `buffer_pool` and every full buffer is
+    uploaded as a part in the background while the next one is filled.
+    Parts are `part_size` bytes, at least the size of the pool's buffers,
+    and double every `PARTS_PER_SIZE` parts.
+    Objects smaller than one part are uploaded with a single PutObject. Used
+    as a context manager, the upload is completed on success and aborted on
+    error, so nothing is left behind in the bucket.
+    """
+
+    def __init__(
+        self,
+        s3_client: Any,
+        bucket_name: str,
+        key: str,
+        buffer_pool: BufferPool,
+        executor: ThreadPoolExecutor,
+        extra_args: Optional[dict] = None,
+        expected_md5: Optional[str] = None,
+        part_size: Optional[int] = None,
+    ) -> None:
+        self.s3 = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.buffer_pool = buffer_pool
+        self.part_size = max(buffer_pool.size, part_size or 0)
+        self.executor = executor
+        self.extra_args = extra_args or {}
+        self.expected_md5 = expected_md5
+        self._reset()
+
+    def _reset(self) -> None:
+        self._md5 = hashlib.md5() if self.expected_md5 else None
+        self._buffer: Optional[io.BytesIO] = None
+        self._buffer_size = self.part_size
+        self._upload_id: Optional[str] = None
+        self._parts: List[Future] = []
+        self._position = 0
+
+    def __enter__(self) -> "MultipartUploadWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int) -> int:
+        # Only rewinding to the start is supported, followed by truncate()
+        if offset != 0:
+            raise io.UnsupportedOperation("Can only seek to the start")
+        return 0
+
+    def truncate(self) -> None:
+        """Drops everything written so far, e.g. to restart a download."""
+        self.abort()
+        self._reset()
+
+    def write(self, data: bytes) -> int:
+        view = memoryview(data)
+        while view:
+            if self._buffer is None:
+                self._buffer_size = self.part_size * 2 ** (
+                    len(self._parts) // PARTS_PER_SIZE
+                )
+                self._buffer = self.buffer_pool.acquire(self._buffer_size)
+            room = self._buffer_size - self._buffer.tell()
+            self._buffer.write(view[:room])
+            if self._md5 is not None:
+                self._md5.update(view[:room])
+            view = view[room:]
+            if self._buffer.tell() == self._buffer_size:
+                self._submit_part()
+        self._position += len(data)
+        return len(data)
+
+    def _submit_part(self) -> None:
+        if self._upload_id is None:
+            response = self.s3.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, **self.extra_args
+            )
+            self._upload_id = response["UploadId"]
+        part_number = len(self._parts) + 1
+        buffer, self._buffer = self._buffer, None
+        self._parts.append(
+            self.executor.submit(
+                self._upload_part, part_number, buffer, self._buffer_size
+            )
+        )
+
+    def _upload_part(self, part_number: int, buffer: io.BytesIO, size: int) -> dict:
+        try:
+            etag = self._upload_part_with_retry(part_number, buffer)
+        finally:
+            self.buffer_pool.release(buffer, size)
+        return {"PartNumber": part_number, "ETag": etag}
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=5),
+        reraise=True,
+    )
+    def _upload_part_with_retry(self, part_number: int, buffer: io.BytesIO) -> str:
+        buffer.seek(0)
+        response = self.s3.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=buffer,
+        )
+        return response["ETag"]
+
+    def _verify_checksum(self) -> None:
+        if self._md5 is not None and self._md5.hexdigest() != self.expected_md5:
+            raise ValueError(
+                f"md5 mismatch for {self.key}: expected {self.expected_md5}, got {self._md5.hexdigest()}"
+            )
+
+    def close(self) -> None:
+        try:
+            self._verify_checksum()
+            if self._upload_id is None:
+                self._put_object()
+            else:
+                self._complete_multipart_upload()
+        except Exception:
+            self.abort()
+            raise
+
+    def _put_object(self) -> None:
+        body = self._buffer.getvalue() if self._buffer is not None else b""
+        self._release_buffer()
+        self.s3.put_object(
+            Bucket=self.bucket_name, Key=self.key, Body=body, **self.extra_args
+        )
+        logger.trace(f"Streamed {self._position} bytes to {self.key}")
+
+    def _complete_multipart_upload(self) -> None:
+        if self._buffer is not None and self._buffer.tell() > 0:
+            self._submit_part()
+        self._release_buffer()
+        parts = [part.result() for part in self._parts]
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+        logger.trace(
+            f"Streamed {self._position} bytes to {self.key} in {len(parts)} parts"
+        )
+
+    def abort(self) -> None:
+        self._release_buffer()
+        for part in self._parts:
+            part.exception()  # Wait for in-flight parts to give their buffer back
+        if self._upload_id is not None:
+            try:
+                self.s3.abort_multipart_upload(
+                    Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id
+                )
+            except Exception as e:
+                logger.warning(f"Could not abort multipart upload of {self.key}: {e}")
+
+    def _release_buffer(self) -> None:
+        if self._buffer is not None:
+            self.buffer_pool.release(self._buffer, self._buffer_size)
+            self._buffer = None
@@ -1,6 +1,15 @@
+import json
 import os
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from tenacity import retry, stop_after_attempt, wait_exponential
+from src.aws.multipart import BufferPool, MultipartUploadWriter
+from src.aws.transfer import transfer_config_for
 from src.utils.logger import app_logger as logger
 from src.enums import STORAGE_CLASS
 
@@ -12,13 +21,20 @@ class S3:
         access_key: str,
         secret_key: str,
         role_based: bool = False,
+        max_pool_connections: Optional[int] = None,
     ) -> None:
         self.bucket_name = bucket_name
+        config = None
+        if max_pool_connections is not None:
+            config = Config(max_pool_connections=max_pool_connections)
         if role_based:
-            self.s3 = boto3.client("s3")
+            self.s3 = boto3.client("s3", config=config)
         else:
             self.s3 = boto3.client(
-                "s3", aws_access_key_id=access_key, aws_secret_access_key=secret_key
+                "s3",
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                config=config,
             )
 
     def upload_folder(
@@ -26,30 +42,39 @@ class S3:
         source_path: str,
         destination_path: str,
         storage_class: STORAGE_CLASS = STORAGE_CLASS.STANDARD,
+        concurrency: int = 1,
     ) -> int:
+        """Uploads every file under `source_path`, `concurrency` at a time.
+        Files are retried on their own and the largest start first, so a big
+        archive does not end up uploading alone at the end."""
         if not os.path.isdir(source_path):
             raise ValueError(f"{source_path} is not a directory")
 
-        file_size_counter = 0
-
-        for root, _, files in os.walk(source_path):
-            for file in files:
-                try:
-                    file_size_counter += os.path.getsize(os.path.join(root, file))
-                    file_path = os.path.join(root, file)
-                    key = f"{destination_path}{file_path.replace(source_path, '')}"
-                    self.s3.upload_file(
-                        file_path,
-                        self.bucket_name,
-                        key,
-                        ExtraArgs={"StorageClass": storage_class.value},
-                    )
-                    logger.trace(f"Uploaded {file_path} to {key}")
-                except Exception as e:
-                    logger.error(f"Error uploading {file_path} to {key}: {e}")
-                    raise e
+        files: List[Tuple[int, str]] = []
+        for root, _, names in os.walk(source_path):
+            for name in names:
+                file_path = os.path.join(root, name)
+                files.append((os.path.getsize(file_path), file_path))
+        files.sort(reverse=True)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(
+                    self.upload_file,
+                    file_path,
+                    f"{destination_path}{file_path.replace(source_path, '')}",
+                    storage_class,
+                )
+                for _, file_path in files
+            ]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception() is not None:
+                    for pending in futures:
+                        pending.cancel()
+                    raise future.exception()
 
-        return file_size_counter
+        return sum(size for size, _ in files)
 
     @retry(
         stop=stop_after_attempt(3),
@@ -70,8 +95,155 @@ class S3:
                 self.bucket_name,
                 destination_path,
                 ExtraArgs={"StorageClass": storage_class.value},
+                Config=transfer_config_for(os.path.getsize(source_path)),
             )
             logger.trace(f"Uploaded {source_path} to {destination_path}")
         except Exception as e:
             logger.error(f"Error uploading {source_path} to {destination_path}: {e}")
             raise e
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=5),
+        reraise=True,
+    )
+    def copy_object(
+        self,
+        source_path: str,
+        destination_path: str,
+        storage_class: STORAGE_CLASS = STORAGE_CLASS.STANDARD,
+    ) -> None:
+        try:
+            self.s3.copy(
+                {"Bucket": self.bucket_name, "Key": source_path},
+                self.bucket_name,
+                destination_path,
+                ExtraArgs={"StorageClass": storage_class.value},
+            )
+            logger.trace(f"Copied {source_path} to {destination_path}")
+        except Exception as e:
+            logger.error(f"Error copying {source_path} to {destination_path}: {e}")
+            raise e
+
+    def open_multipart_writer(
+        self,
+        destination_path: str,
+        buffer_pool: BufferPool,
+        executor: ThreadPoolExecutor,
+        expected_md5: Optional[str] = None,
+        storage_class: STORAGE_CLASS = STORAGE_CLASS.STANDARD,
+        part_size: Optional[int] = None,
+    ) -> MultipartUploadWriter:
+        """Returns a file object streaming everything written to it to
+        `destination_path`, without staging it on disk. `part_size` defaults
+        to the size of the pool's buffers."""
+        return MultipartUploadWriter(
+            self.s3,
+            self.bucket_name,
+            destination_path,
+            buffer_pool,
+            executor,
+            extra_args={"StorageClass": storage_class.value},
+            expected_md5=expected_md5,
+            part_size=part_size,
+        )
+
+    def object_exists(self, key: str) -> bool:
+        try:
+            self.s3.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return False
+            raise e
+        return True
+
+    def download_json(self, key: str) -> Optional[Any]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise e
+        return json.loads(response["Body"].read())
+
+    def upload_json(
+        self,
+        key: str,
+        data: Any,
+        storage_class: STORAGE_CLASS = STORAGE_CLASS.STANDARD,
+    ) -> None:
+        self.s3.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=json.dumps(data).encode(),
+            StorageClass=storage_class.value,
+        )
+        logger.trace(f"Uploaded {key}")
+
+    def download_range(self, key: str, offset: int, length: int) -> bytes:
+        """Returns `length` bytes of the object from `offset`, e.g. one file
+        of a seekable archive."""
+        response = self.s3.get_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Range=f"bytes={offset}-{offset + length - 1}",
+        )
+        return response["Body"].read()
+
+    def find_latest_snapshot(
+        self, drive_id: str, before: str, marker: str = "snapshot.json"
+    ) -> Optional[str]:
+        """Returns the newest backup timestamp older than `before` that holds
+        `marker` for the given drive."""
+        timestamps = []
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Delimiter="/"):
+            for prefix in page.get("CommonPrefixes", []):
+                timestamp = prefix["Prefix"].rstrip("/")
+                if timestamp < before:
+                    timestamps.append(timestamp)
+
+        for timestamp in sorted(timestamps, reverse=True):
+            try:
+                self.s3.head_object(
+                    Bucket=self.bucket_name, Key=f"{timestamp}/{drive_id}/{marker}"
+                )
+                return timestamp
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                    raise e
+        return None
+
+
+_shared_lock = threading.Lock()
+_shared_pid: Optional[int] = None
+_shared: Dict[Tuple[Any, ...], S3] = {}
+
+
+def shared_s3(
+    bucket_name: str,
+    access_key: Optional[str],
+    secret_key: Optional[str],
+    role_based: bool = False,
+    max_pool_connections: Optional[int] = None,
+) -> S3:
+    """Returns the S3 of the process for these settings, made once and used
+    by every thread (boto3 clients are thread-safe). Its connection pool must
+    be sized for all of them with `max_pool_connections`."""
+    global _shared_pid
+    key = (bucket_name, access_key, secret_key, role_based, max_pool_connections)
+    # Creating boto3 clients is not thread-safe, and pool workers must not
+    # share connections opened before the fork
+    with _shared_lock:
+        if _shared_pid != os.getpid():
+            _shared_pid = os.getpid()
+            _shared.clear()
+        if key not in _shared:
+            _shared[key] = S3(
+                bucket_name,
+                access_key,
+                secret_key,
+                role_based=role_based,
+                max_pool_connections=max_pool_connections,
+            )
+        return _shared[key]
@@ -0,0 +1,39 @@
+import math
+
+from boto3.s3.transfer import TransferConfig
+
+MB = 1024 * 1024
+# Files up to this size are uploaded with a single PutObject
+MULTIPART_THRESHOLD = 16 * MB
+MIN_PART_SIZE = 16 * MB
+MAX_PARTS = 10000  # S3 limit
+# Parts of one file uploaded at once, folder uploads also run several files
+# at once so the connection pool needs room for both
+MAX_PART_CONCURRENCY = 8
+
+
+def part_size_for(size: int, min_part_size: int = MIN_PART_SIZE) -> int:
+    """Parts grow with the file so that even the largest archives fit in
+    `MAX_PARTS`, rounded up to whole megabytes."""
+    return max(min_part_size, math.ceil(size / MAX_PARTS / MB) * MB)
+
+
+def transfer_config_for(size: int) -> TransferConfig:
+    """Returns the transfer settings for uploading a file of `size` bytes.
+    Small files go up in one request on the calling thread, large ones in
+    parts uploaded by up to `MAX_PART_CONCURRENCY` threads."""
+    if size <= MULTIPART_THRESHOLD:
+        return TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD + 1, use_threads=False
+        )
+    part_size = part_size_for(size)
+    return TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD,
+        multipart_chunksize=part_size,
+        max_concurrency=min(MAX_PART_CONCURRENCY, math.ceil(size / part_size)),
+    )
+
+
+def pool_connections_for(concurrency: int) -> int:
+    """Connection pool size needed by `concurrency` file uploads at once."""
+    return concurrency * MAX_PART_CONCURRENCY
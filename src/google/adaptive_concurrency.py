@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator, List
+
+from src.utils.logger import app_logger as logger
+
+MIN_LIMIT = 1
+DECREASE_FACTOR = 0.5
+# Rate limit errors come in bursts, one of them is enough to back off
+DECREASE_COOLDOWN = 5  # Seconds
+# Added workers that lower throughput by more than this are taken back
+THROUGHPUT_TOLERANCE = 0.1
+
+
+class AdaptiveConcurrency:
+    """Process-wide limit on downloads in flight, adjusted AIMD style.
+
+    The limit starts at half of `max_limit`. Every window of `limit`
+    finished downloads without rate limit errors adds one slot, unless the
+    window was slower than the previous one, which takes one back. A rate
+    limit error halves the limit. A `max_limit` of 0 disables the limit.
+    """
+
+    def __init__(self, max_limit: int = 0) -> None:
+        self._condition = threading.Condition()
+        self._wakers: List[Callable[[], None]] = []
+        self.configure(max_limit)
+
+    def configure(self, max_limit: int) -> None:
+        with self._condition:
+            self.max_limit = max_limit
+            self.limit = max(MIN_LIMIT, max_limit // 2)
+            self.in_flight = 0
+            self._last_decrease = float("-inf")
+            self._throughput = 0.0
+            self._start_window()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_limit > 0
+
+    def _start_window(self) -> None:
+        self._window_start = time.monotonic()
+        self._window_done = 0
+        self._window_bytes = 0
+        self._window_throttled = False
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self.enabled and self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, size: int) -> None:
+        """Frees the slot of a finished download of `size` bytes."""
+        with self._condition:
+            self.in_flight -= 1
+            if self.enabled:
+                self._record(size)
+            self._notify()
+
+    @contextmanager
+    def slot(self, size: int) -> Iterator[None]:
+        """Waits for a free slot and holds it while downloading `size`
+        bytes."""
+        with self._condition:
+            while self.enabled and self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.release(size)
+
+    @asynccontextmanager
+    async def async_slot(self, size: int) -> AsyncIterator[None]:
+        """Same as `slot`, waiting without blocking the event loop."""
+        if not self.try_acquire():
+            loop = asyncio.get_running_loop()
+            freed = asyncio.Event()
+
+            def waker() -> None:
+                loop.call_soon_threadsafe(freed.set)
+
+            self.add_waker(waker)
+            try:
+                while not self.try_acquire():
+                    await freed.wait()
+                    freed.clear()
+            finally:
+                self.remove_waker(waker)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+    def add_waker(self, waker: Callable[[], None]) -> None:
+        """Registers `waker` to be called, from any thread, when slots may
+        have become free. Used to wake up event loops."""
+        with self._condition:
+            self._wakers.append(waker)
+
+    def remove_waker(self, waker: Callable[[], None]) -> None:
+        with self._condition:
+            self._wakers.remove(waker)
+
+    def _notify(self) -> None:
+        self._condition.notify_all()
+        for waker in self._wakers:
+            waker()
+
+    def _record(self, size: int) -> None:
+        self._window_done += 1
+        self._window_bytes += size
+        if self._window_done < self.limit:
+            return
+        elapsed = time.monotonic() - self._window_start
+        throughput = self._window_bytes / elapsed if elapsed > 0 else 0.0
+        if not self._window_throttled:
+            previous = self.limit
+            if throughput < self._throughput * (1 - THROUGHPUT_TOLERANCE):
+                self.limit = max(MIN_LIMIT, self.limit - 1)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1)
+            if self.limit != previous:
+                logger.debug(
+                    f"Download concurrency {previous} -> {self.limit} ({throughput/1024/1024:.2f}MB/s)"
+                )
+        self._throughput = throughput
+        self._start_window()
+
+    def throttled(self) -> None:
+        """Called when the API answers with a rate limit error."""
+        with self._condition:
+            if not self.enabled:
+                return
+            self._window_throttled = True
+            now = time.monotonic()
+            if now - self._last_decrease < DECREASE_COOLDOWN:
+                return
+            self._last_decrease = now
+            previous = self.limit
+            self.limit = max(MIN_LIMIT, int(self.limit * DECREASE_FACTOR))
+            logger.info(
+                f"Rate limited, download concurrency {previous} -> {self.limit}"
+            )
+            self._notify()
+
+
+download_concurrency = AdaptiveConcurrency()
@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Dict, Optional
+
+import aiohttp
+import httplib2
+from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+
+from src.utils.memory_budget import memory_budget
+
+from .rate_limits import drive_rate_limits
+from .retries import async_download_retrying
+from .transport import TIMEOUT
+
+API_URL = "https://www.googleapis.com/drive/v3"
+READ_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+def media_url(file_id: str) -> str:
+    return f"{API_URL}/files/{file_id}?alt=media&supportsAllDrives=true"
+
+
+def export_url(file_id: str) -> str:
+    return f"{API_URL}/files/{file_id}/export"
+
+
+def open_session(concurrency: int) -> aiohttp.ClientSession:
+    """Returns a session keeping up to `concurrency` connections alive."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency),
+        timeout=aiohttp.ClientTimeout(sock_connect=TIMEOUT, sock_read=TIMEOUT),
+    )
+
+
+class AsyncCredentials:
+    """Authorization header of `credentials` for aiohttp requests. The token
+    is refreshed in a thread (google-auth is blocking) when it expires or the
+    API rejects it, once for all the downloads waiting on it."""
+
+    def __init__(self, credentials: Any) -> None:
+        self.credentials = credentials
+        self._lock = asyncio.Lock()
+
+    async def headers(self) -> Dict[str, str]:
+        async with self._lock:
+            if not self.credentials.valid:
+                await asyncio.to_thread(self.credentials.refresh, Request())
+        return {"Authorization": f"Bearer {self.credentials.token}"}
+
+    async def refresh(self, rejected_headers: Dict[str, str]) -> None:
+        async with self._lock:
+            # Another download may have refreshed it already
+            if rejected_headers == {
+                "Authorization": f"Bearer {self.credentials.token}"
+            }:
+                await asyncio.to_thread(self.credentials.refresh, Request())
+
+
+async def _raise_for_status(response: aiohttp.ClientResponse) -> None:
+    # Same error as the API client raises, so that error handling and
+    # retries treat both engines alike
+    if response.status >= 400:
+        raise HttpError(
+            httplib2.Response({"status": str(response.status)}),
+            await response.read(),
+            uri=str(response.url),
+        )
+
+
+async def _get(
+    session: aiohttp.ClientSession,
+    auth: AsyncCredentials,
+    url: str,
+    params: Optional[Dict[str, str]],
+    headers: Dict[str, str],
+) -> aiohttp.ClientResponse:
+    auth_headers = await auth.headers()
+    await drive_rate_limits.wait_async(url)
+    response = await session.get(
+        url, params=params, headers={**headers, **auth_headers}
+    )
+    if response.status == 401:
+        response.release()
+        await auth.refresh(auth_headers)
+        await drive_rate_limits.wait_async(url)
+        response = await session.get(
+            url, params=params, headers={**headers, **await auth.headers()}
+        )
+    return response
+
+
+async def _write_response(
+    session: aiohttp.ClientSession,
+    auth: AsyncCredentials,
+    url: str,
+    params: Optional[Dict[str, str]],
+    f: Any,
+) -> None:
+    # Ask for the rest of the file after an interrupted attempt, responses
+    # that can't be resumed are downloaded again from the start
+    written = f.tell()
+    headers = {"Range": f"bytes={written}-"} if written else {}
+    response = await _get(session, auth, url, params, headers)
+    try:
+        await _raise_for_status(response)
+        if written and response.status != 206:
+            f.seek(0)
+            await asyncio.to_thread(f.truncate)
+        # Disk writes would stall every download of the event loop
+        chunk_size = min(READ_CHUNK_SIZE, memory_budget.chunk_size)
+        async with memory_budget.reserve_async(chunk_size):
+            async for chunk in response.content.iter_chunked(chunk_size):
+                await asyncio.to_thread(f.write, chunk)
+    finally:
+        response.release()
+
+
+async def download_to_file(
+    session: aiohttp.ClientSession,
+    auth: AsyncCredentials,
+    url: str,
+    file_path: str,
+    params: Optional[Dict[str, str]] = None,
+) -> None:
+    """Downloads `url` into `file_path`. A transient error resumes the
+    download from the last byte written."""
+    with open(file_path, "wb") as f:
+        async for attempt in async_download_retrying():
+            with attempt:
+                await _write_response(session, auth, url, params, f)
@@ -0,0 +1,38 @@
+import threading
+from typing import Any, Dict, Optional, TypeAlias
+
+GFolder: TypeAlias = Dict[str, Any]
+
+
+class FolderCache:
+    """Process-wide, thread-safe cache of folder metadata (name, parents) and
+    shared drive names, used to resolve paths outside of the listed drive."""
+
+    def __init__(self) -> None:
+        self._folders: Dict[str, GFolder] = {}
+        self._drive_names: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get_folder(self, folder_id: str) -> Optional[GFolder]:
+        with self._lock:
+            return self._folders.get(folder_id)
+
+    def set_folder(self, folder_id: str, folder: GFolder) -> None:
+        with self._lock:
+            self._folders[folder_id] = folder
+
+    def get_drive_name(self, drive_id: str) -> Optional[str]:
+        with self._lock:
+            return self._drive_names.get(drive_id)
+
+    def set_drive_name(self, drive_id: str, name: str) -> None:
+        with self._lock:
+            self._drive_names[drive_id] = name
+
+    def clear(self) -> None:
+        with self._lock:
+            self._folders.clear()
+            self._drive_names.clear()
+
+
+folder_cache = FolderCache()
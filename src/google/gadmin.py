@@ -1,5 +1,6 @@
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
+from .transport import SessionHttp, authorized_session
 from functools import cache
 from typing import List, Dict, Any, TypeAlias
 
@@ -14,8 +15,15 @@ class GAdmin:
         self.workspace_customer_id = workspace_customer_id
         self.credentials = credentials
 
+    def _build(self, service_name: str, version: str) -> Any:
+        return build(
+            service_name,
+            version,
+            http=SessionHttp(authorized_session(self.credentials)),
+        )
+
     def _fetch_shared_drives(self) -> List[GSharedDrive]:
-        service = build("drive", "v3", credentials=self.credentials)
+        service = self._build("drive", "v3")
         request = service.drives().list()
         while request is not None:
             response = request.execute()
@@ -26,7 +34,7 @@ class GAdmin:
     def _fetch_user_list(
         self, page_size: int = 100, order_by: str = "email"
     ) -> List[GUser]:
-        service = build("admin", "directory_v1", credentials=self.credentials)
+        service = self._build("admin", "directory_v1")
         request = service.users().list(
             customer=self.workspace_customer_id, maxResults=page_size, orderBy=order_by
         )
@@ -1,22 +1,86 @@
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 from concurrent.futures import ThreadPoolExecutor, as_completed
+import asyncio
 import threading
-from ..aws.s3 import S3
+from ..aws.multipart import BufferPool
+from ..aws.s3 import S3, shared_s3
+from ..aws.transfer import part_size_for
+from .adaptive_concurrency import download_concurrency
+from .async_download import (
+    AsyncCredentials,
+    download_to_file,
+    export_url,
+    media_url,
+    open_session,
+)
+from .path_resolver import PathResolver
+from .ranged_download import MEDIA_URL, download_in_ranges
+from .rate_limits import drive_rate_limits
+from .retries import download_retrying, is_permanent_error
+from .transport import SessionHttp, authorized_session
+from .folder_cache import folder_cache
+from .permissions import GPermission, permission_cache
+from src.utils.bundler import Bundle, Bundler
+from src.utils.claims import ClaimRegistry
+from src.utils.disk_budget import DiskBudget
 from src.utils.logger import app_logger as logger
+from src.utils.memory_budget import memory_budget
 from enum import Enum
-from typing import Optional, Dict, Any, TypeAlias
+from typing import (
+    Optional,
+    Callable,
+    Dict,
+    Any,
+    Iterable,
+    Iterator,
+    List,
+    Set,
+    Tuple,
+    TypeAlias,
+)
 import requests
 
 import json
 import os
 
-thread_local = threading.local()
-
 DriveService: TypeAlias = Any
 GFile: TypeAlias = Dict[str, Any]
 
+BLOBS_PREFIX = "blobs"
+SHORTCUT_MIMETYPE = "application/vnd.google-apps.shortcut"
+FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
+FOLDER_CACHE_FIELDS = "id, name, parents"
+BATCH_SIZE = 100  # Drive API limit for batch requests
+BATCH_THREADS = 8
+EXPORT_SIZE_ESTIMATE = 1024 * 1024  # Exported files have no size until exported
+# Format and extension Google Workspace files are exported to
+EXPORT_FORMATS = {
+    "application/vnd.google-apps.document": (
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        "docx",
+    ),
+    "application/vnd.google-apps.spreadsheet": (
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "xlsx",
+    ),
+    "application/vnd.google-apps.presentation": (
+        "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+        "pptx",
+    ),
+    "application/vnd.google-apps.drawing": ("application/pdf", "pdf"),
+    "application/vnd.google-apps.script": (
+        "application/vnd.google-apps.script+json",
+        "json",
+    ),
+    "application/vnd.google-apps.form": ("application/zip", "zip"),
+}
+
+USER_DRIVE_FILE_FIELDS = "id, name, md5Checksum, size, parents, mimeType, shortcutDetails, permissions, exportLinks, version, modifiedTime"
+SHARED_DRIVE_FILE_FIELDS = "id, name, md5Checksum, size, parents, mimeType, shortcutDetails, permissionIds, exportLinks, version, modifiedTime"
+
 
 class DRIVE_TYPE(Enum):
     USER = "user"
@@ -35,6 +99,14 @@ class GDrive:
         s3_bucket_name: str = None,
         s3_access_key: str = None,
         s3_secret_key: str = None,
+        content_addressed_storage: bool = False,
+        batch_shortcut_lookups: bool = False,
+        ranged_download_threshold: int = 0,
+        ranged_download_threads: int = 8,
+        zero_staging_uploads: bool = False,
+        upload_part_size: int = 16 * 1024 * 1024,
+        upload_buffers: int = 40,
+        s3_max_pool_connections: Optional[int] = None,
     ) -> None:
         self.drive_id = drive_id
         self.credentials = credentials
@@ -48,8 +120,32 @@ class GDrive:
         self.s3_bucket_name = s3_bucket_name
         self.s3_access_key = s3_access_key
         self.s3_secret_key = s3_secret_key
+        self.content_addressed_storage = content_addressed_storage
+        self.batch_shortcut_lookups = batch_shortcut_lookups
+        self.ranged_download_threshold = ranged_download_threshold
+        self.ranged_download_threads = ranged_download_threads
+        self.zero_staging_uploads = zero_staging_uploads
+        self.upload_part_size = upload_part_size
+        self.upload_buffers = upload_buffers
+        self.s3_max_pool_connections = s3_max_pool_connections
+        self.blob_registry: Optional[ClaimRegistry] = None
+        self.path_registry: Optional[ClaimRegistry] = None
+        self.disk_budget: Optional[DiskBudget] = None
+        self.on_file_saved: Optional[Callable[[GFile, str], None]] = None
+        # Disk space the archive of files of a given size needs, when the
+        # drive is compressed after downloading
+        self.expected_archive_size: Optional[Callable[[int], int]] = None
+        self.bundler: Optional[Bundler] = None
+        # Downloads in flight with the asyncio engine, 0 uses threads only
+        self.async_download_concurrency = 0
+        self.staged_bytes = 0
+        self._blobs_claimed_elsewhere = []
         self._lock = None
         self._locked_files = None
+        self._path_resolver = None
+        self._part_buffers = None
+        self._upload_executor = None
+        self._drive_service = None
 
     @property
     def files(self):
@@ -57,6 +153,12 @@ class GDrive:
             self._files = {}
         return self._files
 
+    @property
+    def path_resolver(self):
+        if self._path_resolver is None:
+            self._path_resolver = PathResolver(self.files)
+        return self._path_resolver
+
     @property
     def locked_files(self):
         if self._locked_files is None:
@@ -67,13 +169,11 @@ class GDrive:
     def file_export_handlers(self):
         if self._file_export_handlers is None:
             self._file_export_handlers = {
-                "application/vnd.google-apps.shortcut": self._handle_shortcut_export,
-                "application/vnd.google-apps.document": self._handle_document_export,
-                "application/vnd.google-apps.spreadsheet": self._handle_spreadsheet_export,
-                "application/vnd.google-apps.presentation": self._handle_presentation_export,
-                "application/vnd.google-apps.drawing": self._handle_drawing_export,
-                "application/vnd.google-apps.script": self._handle_script_export,
-                "application/vnd.google-apps.form": self._handle_zip_export,
+                SHORTCUT_MIMETYPE: self._handle_shortcut_export,
+                **{
+                    mime_type: self._handle_format_export
+                    for mime_type in EXPORT_FORMATS
+                },
             }
         return self._file_export_handlers
 
@@ -83,82 +183,151 @@ class GDrive:
             self._lock = threading.Lock()
         return self._lock
 
+    @property
+    def part_buffers(self) -> BufferPool:
+        with self.lock:
+            if self._part_buffers is None:
+                self._part_buffers = BufferPool(
+                    self.upload_buffers, self.upload_part_size
+                )
+            return self._part_buffers
+
+    @property
+    def upload_executor(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self._upload_executor is None:
+                self._upload_executor = ThreadPoolExecutor(
+                    max_workers=self.upload_buffers
+                )
+            return self._upload_executor
+
     def __repr__(self) -> str:
         return f"GDrive({self.drive_id}, {self.drive_type})"
 
     def _get_drive_service(self) -> DriveService:
-        if not hasattr(thread_local, "drive_service"):
-            thread_local.drive_service = build(
-                "drive", "v3", credentials=self.credentials
-            )
-        return thread_local.drive_service
+        # One client per drive for all threads, its requests go through the
+        # pooled session of the process
+        with self.lock:
+            if self._drive_service is None:
+                self._drive_service = build(
+                    "drive", "v3", http=SessionHttp(self._get_auth_session())
+                )
+            return self._drive_service
 
     def _get_s3_service(self) -> S3:
-        if not hasattr(thread_local, "s3"):
-            if self.s3_role_based_access:
-                s3 = S3(self.s3_bucket_name, None, None, role_based=True)
-            else:
-                s3 = S3(
-                    self.s3_bucket_name,
-                    self.s3_access_key,
-                    self.s3_secret_key,
-                )
-            thread_local.s3 = s3
-        return thread_local.s3
+        return shared_s3(
+            self.s3_bucket_name,
+            None if self.s3_role_based_access else self.s3_access_key,
+            None if self.s3_role_based_access else self.s3_secret_key,
+            role_based=self.s3_role_based_access,
+            max_pool_connections=self.s3_max_pool_connections,
+        )
 
     def _get_auth_session(self) -> requests.Session:
-        if not hasattr(thread_local, "auth_session"):
-            thread_local.auth_session = requests.Session()
-            thread_local.auth_session.headers.update(
-                {"Authorization": f"Bearer {self.credentials.token}"}
-            )
-        return thread_local.auth_session
+        return authorized_session(self.credentials)
 
     def fetch_file_path(
         self, file_id: str, drive_service: DriveService, supportsAllDrives: bool = False
     ) -> str:
+        """Returns the path of the folder holding the file, starting with the
+        name of its drive. Listed files are looked up locally, anything else
+        goes through the process-wide folder cache."""
         file_path = []
-        f = (
-            drive_service.files()
-            .get(
-                fileId=file_id,
-                fields="id, name, parents",
-                supportsAllDrives=supportsAllDrives,
-            )
-            .execute()
-        )
+        f = self._get_file_metadata(file_id, drive_service, supportsAllDrives)
 
+        seen = set()
         parents = f.get("parents", [])
-        while parents:
+        while parents and parents[0] not in seen:
             parent_id = parents[0]
-            parent = (
-                drive_service.files()
-                .get(
-                    fileId=parent_id,
-                    fields="name, parents",
-                    supportsAllDrives=supportsAllDrives,
-                )
-                .execute()
+            seen.add(parent_id)
+            parent = self._get_file_metadata(
+                parent_id, drive_service, supportsAllDrives
             )
             # check if parent is a shared drive
             if "parents" not in parent:
-                # get shared drive name
-                drive = drive_service.drives().get(driveId=parent_id).execute()
-                file_path.append(drive["name"])
+                file_path.append(self._get_drive_name(parent_id, parent, drive_service))
                 break
             file_path.append(parent["name"])
             parents = parent.get("parents", [])
 
         return "/".join(reversed(file_path))
 
+    def _get_file_metadata(
+        self, file_id: str, drive_service: DriveService, supportsAllDrives: bool
+    ) -> GFile:
+        listed = self.files.get(file_id)
+        if listed is not None:
+            return listed
+        f = folder_cache.get_folder(file_id)
+        if f is None:
+            f = (
+                drive_service.files()
+                .get(
+                    fileId=file_id,
+                    fields=FOLDER_CACHE_FIELDS,
+                    supportsAllDrives=supportsAllDrives,
+                )
+                .execute()
+            )
+            folder_cache.set_folder(file_id, f)
+        return f
+
+    def _get_drive_name(
+        self, root_id: str, root: GFile, drive_service: DriveService
+    ) -> str:
+        name = folder_cache.get_drive_name(root_id)
+        if name is None:
+            try:
+                name = drive_service.drives().get(driveId=root_id).execute()["name"]
+            except HttpError as e:
+                # "My Drive" roots are not shared drives
+                if e.resp.status != 404:
+                    raise e
+                name = root["name"]
+            folder_cache.set_drive_name(root_id, name)
+        return name
+
+    def prefetch_shortcut_targets(self) -> None:
+        """Fills the folder cache with shortcut targets and their ancestors
+        using batch requests, one level of the folder tree at a time."""
+        pending = {
+            f["shortcutDetails"]["targetId"]
+            for f in self.files.values()
+            if f.get("mimeType") == SHORTCUT_MIMETYPE and "shortcutDetails" in f
+        }
+        seen = set()
+        while pending:
+            missing = [
+                file_id
+                for file_id in pending
+                if file_id not in self.files
+                and folder_cache.get_folder(file_id) is None
+            ]
+            fetched, _ = self._batch_execute(
+                missing,
+                lambda drive_service, file_id: drive_service.files().get(
+                    fileId=file_id, fields=FOLDER_CACHE_FIELDS, supportsAllDrives=True
+                ),
+            )
+            for file_id, f in fetched.items():
+                folder_cache.set_folder(file_id, f)
+
+            seen.update(pending)
+            next_pending = set()
+            for file_id in pending:
+                f = self.files.get(file_id) or folder_cache.get_folder(file_id)
+                if f is not None and f.get("parents"):
+                    next_pending.add(f["parents"][0])
+            pending = next_pending - seen
+
     def fetch_file_list(self, page_size: int = 1000) -> None:
-        drive_service = build("drive", "v3", credentials=self.credentials)
+        drive_service = self._get_drive_service()
         self.files.clear()
+        self.path_resolver.clear()
 
-        if self.drive_type == DRIVE_TYPE.USER:
-            self._fetch_file_list_user_drive(drive_service, page_size)
-        elif self.drive_type == DRIVE_TYPE.SHARED:
-            self._fetch_file_list_shared_drive(drive_service, page_size)
+        for page in self._list_file_pages(drive_service, page_size):
+            for file in page:
+                self.files[file["id"]] = file
 
         self._files_fetched = True
 
@@ -166,63 +335,249 @@ class GDrive:
         for file_id, file in self.files.items():
             file["path"] = self.build_file_path(file_id)
 
-    def _fetch_file_list_user_drive(
-        self, drive_service: DriveService, page_size: int
-    ) -> None:
-        fields = "nextPageToken, files(id, name, md5Checksum, parents, mimeType, shortcutDetails, permissions, exportLinks)"
-        if self.include_shared_with_me:
-            request = drive_service.files().list(
-                pageSize=page_size,
-                fields=fields,
-            )
-        else:
-            request = drive_service.files().list(
-                pageSize=page_size,
-                fields=fields,
-                q="'me' in owners",
-            )
+    def _list_file_pages(
+        self,
+        drive_service: DriveService,
+        page_size: int,
+        order_by: Optional[str] = None,
+    ) -> Iterator[List[GFile]]:
+        if self.drive_type == DRIVE_TYPE.USER:
+            yield from self._list_user_drive_pages(drive_service, page_size, order_by)
+        elif self.drive_type == DRIVE_TYPE.SHARED:
+            yield from self._list_shared_drive_pages(drive_service, page_size, order_by)
+
+    def _list_user_drive_pages(
+        self, drive_service: DriveService, page_size: int, order_by: Optional[str]
+    ) -> Iterator[List[GFile]]:
+        params = {
+            "pageSize": page_size,
+            "fields": f"nextPageToken, files({USER_DRIVE_FILE_FIELDS})",
+        }
+        if not self.include_shared_with_me:
+            params["q"] = "'me' in owners"
+        if order_by is not None:
+            params["orderBy"] = order_by
+        request = drive_service.files().list(**params)
         while request is not None:
             response = request.execute()
-            for file in response.get("files", []):
-                self.files[file["id"]] = file
+            yield response.get("files", [])
             request = drive_service.files().list_next(request, response)
 
-    def _fetch_file_list_shared_drive(
-        self, drive_service: DriveService, page_size: int
-    ) -> None:
-        known_permissions = {}
-        request = drive_service.files().list(
-            pageSize=page_size,
-            fields="nextPageToken, files(id, name, md5Checksum, parents, mimeType, shortcutDetails, permissionIds, exportLinks)",
-            corpora="drive",
-            driveId=self.drive_id,
-            includeItemsFromAllDrives=True,
-            supportsAllDrives=True,
-        )
+    def _list_shared_drive_pages(
+        self, drive_service: DriveService, page_size: int, order_by: Optional[str]
+    ) -> Iterator[List[GFile]]:
+        params = {
+            "pageSize": page_size,
+            "fields": f"nextPageToken, files({SHARED_DRIVE_FILE_FIELDS})",
+            "corpora": "drive",
+            "driveId": self.drive_id,
+            "includeItemsFromAllDrives": True,
+            "supportsAllDrives": True,
+        }
+        if order_by is not None:
+            params["orderBy"] = order_by
+        request = drive_service.files().list(**params)
         while request is not None:
             response = request.execute()
-            for file in response.get("files", []):
-                self.files[file["id"]] = file
+            files = response.get("files", [])
+            self._resolve_permissions(files)
+            yield files
             request = drive_service.files().list_next(request, response)
-        for file in self.files.values():
-            file["permissions"] = []
-            if "permissionIds" in file:
-                for permission_id in file["permissionIds"]:
-                    if permission_id in known_permissions:
-                        file["permissions"].append(known_permissions[permission_id])
-                    else:
-                        permission = (
-                            drive_service.permissions()
-                            .get(
-                                fileId=file["id"],
-                                permissionId=permission_id,
-                                fields="id, displayName, type, kind, emailAddress, role",
-                                supportsAllDrives=True,
-                            )
-                            .execute()
-                        )
-                        file["permissions"].append(permission)
-                        known_permissions[permission_id] = permission
+
+    def _resolve_permissions(self, files: List[GFile]) -> None:
+        missing = {}
+        for file in files:
+            for permission_id in file.get("permissionIds", []):
+                if permission_cache.get(permission_id) is None:
+                    missing.setdefault(permission_id, file["id"])
+        if missing:
+            permission_cache.update(self._fetch_permissions(missing))
+
+        for file in files:
+            file["permissions"] = [
+                permission_cache.get(permission_id)
+                for permission_id in file.get("permissionIds", [])
+            ]
+
+    def _fetch_permissions(self, file_ids: Dict[str, str]) -> Dict[str, GPermission]:
+        """Fetches permissions (permission id -> id of a file that has it) in
+        parallel batch requests."""
+        permissions, failed = self._batch_execute(
+            list(file_ids),
+            lambda drive_service, permission_id: self._permission_request(
+                drive_service, file_ids[permission_id], permission_id
+            ),
+        )
+
+        # Retry failed lookups one by one, so that persistent errors are raised
+        drive_service = self._get_drive_service()
+        for permission_id in failed:
+            permissions[permission_id] = self._permission_request(
+                drive_service, file_ids[permission_id], permission_id
+            ).execute()
+        return permissions
+
+    def _batch_execute(
+        self, keys: List[str], make_request: Callable[[DriveService, str], Any]
+    ) -> Tuple[Dict[str, Any], List[str]]:
+        """Executes the request made for every key through parallel batch
+        requests. Returns responses by key and the keys whose request failed."""
+        responses = {}
+        failed = []
+
+        def execute_batch(batch_keys: List[str]) -> None:
+            drive_service = self._get_drive_service()
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    responses[request_id] = response
+                else:
+                    failed.append(request_id)
+
+            batch = drive_service.new_batch_http_request(callback=callback)
+            uris = []
+            for key in batch_keys:
+                request = make_request(drive_service, key)
+                uris.append(request.uri)
+                batch.add(request, request_id=key)
+            drive_rate_limits.wait_batch(uris)
+            batch.execute()
+
+        batches = [keys[i : i + BATCH_SIZE] for i in range(0, len(keys), BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=BATCH_THREADS) as executor:
+            list(executor.map(execute_batch, batches))
+        return responses, failed
+
+    def _permission_request(
+        self, drive_service: DriveService, file_id: str, permission_id: str
+    ) -> Any:
+        return drive_service.permissions().get(
+            fileId=file_id,
+            permissionId=permission_id,
+            fields="id, displayName, type, kind, emailAddress, role",
+            supportsAllDrives=True,
+        )
+
+    def _get_root_folder_id(self, drive_service: DriveService) -> Optional[str]:
+        if self.drive_type == DRIVE_TYPE.SHARED:
+            return self.drive_id
+        try:
+            return drive_service.files().get(fileId="root", fields="id").execute()["id"]
+        except Exception as e:
+            logger.warning(f"({self.drive_id}) Could not fetch root folder id: {e}")
+            return None
+
+    def _find_unlisted_ancestor(
+        self, file: GFile, root_id: Optional[str]
+    ) -> Optional[str]:
+        """Returns the id of the first ancestor of `file` that has not been listed
+        yet, or None if the whole parent chain is known."""
+        seen = set()
+        parents = file.get("parents")
+        while parents:
+            parent_id = parents[0]
+            if parent_id == root_id or parent_id in seen:
+                return None
+            if self.path_resolver.is_cached(parent_id):
+                return None
+            parent = self.files.get(parent_id)
+            if parent is None:
+                return parent_id
+            seen.add(parent_id)
+            parents = parent.get("parents")
+        return None
+
+    def get_start_page_token(self) -> str:
+        drive_service = self._get_drive_service()
+        if self.drive_type == DRIVE_TYPE.SHARED:
+            request = drive_service.changes().getStartPageToken(
+                driveId=self.drive_id, supportsAllDrives=True
+            )
+        else:
+            request = drive_service.changes().getStartPageToken()
+        return request.execute()["startPageToken"]
+
+    def fetch_changes(
+        self, start_page_token: str, previous_files: Dict[str, GFile]
+    ) -> Tuple[Set[str], str]:
+        """Rebuilds the file list from the previous manifest and the Changes API.
+
+        Returns the ids of files added or modified since `start_page_token`,
+        plus files the previous backup has no copy of (e.g. failed downloads)
+        unless Drive refused them, and the token to start from on the next
+        run.
+        """
+        drive_service = self._get_drive_service()
+        self.files.clear()
+        self.path_resolver.clear()
+        self.files.update(previous_files)
+
+        if self.drive_type == DRIVE_TYPE.SHARED:
+            file_fields = SHARED_DRIVE_FILE_FIELDS
+            params = {
+                "driveId": self.drive_id,
+                "includeItemsFromAllDrives": True,
+                "supportsAllDrives": True,
+            }
+        else:
+            file_fields = USER_DRIVE_FILE_FIELDS
+            if not self.include_shared_with_me:
+                file_fields += ", ownedByMe"
+            params = {}
+
+        changed_ids = set()
+        page_token = start_page_token
+        new_start_page_token = None
+        while page_token is not None:
+            response = (
+                drive_service.changes()
+                .list(
+                    pageToken=page_token,
+                    pageSize=1000,
+                    includeRemoved=True,
+                    fields=f"nextPageToken, newStartPageToken, changes(changeType, fileId, removed, file({file_fields}))",
+                    **params,
+                )
+                .execute()
+            )
+            changed_files = []
+            for change in response.get("changes", []):
+                if change.get("changeType", "file") != "file":
+                    continue
+                file_id = change["fileId"]
+                file = change.get("file")
+                owned_by_me = file.pop("ownedByMe", True) if file else True
+                if change.get("removed") or file is None or not owned_by_me:
+                    self.files.pop(file_id, None)
+                    changed_ids.discard(file_id)
+                    continue
+                self.files[file_id] = file
+                changed_ids.add(file_id)
+                changed_files.append(file)
+            if self.drive_type == DRIVE_TYPE.SHARED:
+                self._resolve_permissions(changed_files)
+            page_token = response.get("nextPageToken")
+            new_start_page_token = response.get(
+                "newStartPageToken", new_start_page_token
+            )
+
+        self._files_fetched = True
+
+        for file_id, file in self.files.items():
+            file["path"] = self.build_file_path(file_id)
+
+        # Otherwise they would stay missing until someone edits them. Files
+        # Drive refused are only retried once they change.
+        changed_ids.update(
+            file_id
+            for file_id, file in self.files.items()
+            if file_id in previous_files
+            and file["mimeType"] != FOLDER_MIMETYPE
+            and "backup_path" not in file
+            and "blob" not in file
+            and "unavailable" not in file
+        )
+        return changed_ids, new_start_page_token
 
     def find_file_by_id(self, file_id: str) -> Optional[GFile]:
         if not self._files_fetched:
@@ -230,18 +585,44 @@ class GDrive:
         return self.files.get(file_id)
 
     def build_file_path(self, file_id: str) -> Optional[str]:
-        f = self.find_file_by_id(file_id)
-        if f is None:
-            return None
-        file_path = []
-        while "parents" in f:
-            parent_id = f["parents"][0]
-            parent = self.find_file_by_id(parent_id)
-            if parent is None:
-                break
-            file_path.append(parent["name"])
-            f = parent
-        return "/".join(reversed(file_path))
+        if not self._files_fetched:
+            self.fetch_file_list()
+        return self.path_resolver.resolve(file_id)
+
+    def find_unchanged_files(
+        self, previous_files: Dict[str, GFile]
+    ) -> Dict[str, GFile]:
+        """Returns previous manifest entries (by file id) of files whose content
+        and location did not change since they were backed up."""
+        unchanged = {}
+        for file_id, file in self.files.items():
+            previous = previous_files.get(file_id)
+            if previous is None or "backup_path" not in previous:
+                continue
+            if (file["name"], file.get("path")) != (
+                previous.get("name"),
+                previous.get("path"),
+            ):
+                continue
+            if "md5Checksum" in file:
+                if file["md5Checksum"] != previous.get("md5Checksum"):
+                    continue
+            elif (
+                "version" not in file
+                or file["version"] != previous.get("version")
+                or file.get("modifiedTime") != previous.get("modifiedTime")
+            ):
+                continue
+            unchanged[file_id] = previous
+        return unchanged
+
+    def load_file_list(self, path: str) -> None:
+        with open(path) as f:
+            files = json.load(f)
+        self.files.clear()
+        self.files.update(files)
+        self.path_resolver.clear()
+        self._files_fetched = True
 
     def dump_file_list(self, path: str) -> None:
         if not self._files_fetched:
@@ -250,21 +631,261 @@ class GDrive:
         with open(path, "w") as f:
             json.dump(self.files, f, indent=4)
 
-    def download_all_files(self, base_path: str, threads: int = 20) -> None:
+    def download_all_files(
+        self,
+        base_path: str,
+        threads: int = 20,
+        file_ids: Optional[Iterable[str]] = None,
+    ) -> None:
         if not self._files_fetched:
             self.fetch_file_list()
         if len(self.files) == 0:
             return
+        if file_ids is None:
+            files = list(self.files.values())
+        else:
+            files = [self.files[file_id] for file_id in file_ids]
+        if self.batch_shortcut_lookups:
+            self.prefetch_shortcut_targets()
+        download = self.download_file
+        if self._uses_disk_budget() and self.jit_s3_upload:
+            download = self._download_file_within_disk_budget
+        elif self._uses_disk_budget():
+            # Files stay on disk until the whole drive is uploaded, so the
+            # drive waits until all of them fit, along with their archive
+            size = sum(self._estimated_size(f) for f in files)
+            if self.expected_archive_size is not None:
+                size += self.expected_archive_size(size)
+            logger.info(
+                f"({self.drive_id}) Waiting for {size/1024/1024:.2f}MB of disk budget"
+            )
+            self.disk_budget.reserve(size)
+            self.staged_bytes += size
+        if self.async_download_concurrency > 0:
+            asyncio.run(self._download_files_async(files, base_path, threads, download))
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                futures = []
+                for f in files:
+                    futures.append(executor.submit(download, f, base_path))
+                for future in as_completed(futures):
+                    future.result()
+                    futures.remove(future)
+                    files_remaining = len(futures)
+                    if files_remaining % 100 == 0 and files_remaining > 0:
+                        logger.info(
+                            f"({self.drive_id}) Files remaining: {len(futures)}"
+                        )
+        self.download_blobs_claimed_elsewhere(base_path)
+
+    async def _download_files_async(
+        self,
+        files: List[GFile],
+        base_path: str,
+        threads: int,
+        download: Callable[[GFile, str], None],
+    ) -> None:
+        """Keeps up to `async_download_concurrency` downloads in flight on one
+        thread. Binary files and exports are fetched with aiohttp, the rest
+        (shortcuts, blobs, ranged and streamed downloads) and the blocking
+        steps around downloads (JIT uploads, disk budget) run on `threads`
+        threads with `download` as usual."""
+        loop = asyncio.get_running_loop()
+        auth = AsyncCredentials(self.credentials)
+        remaining = iter(files)
+        files_done = 0
+
+        async def worker(session, executor) -> None:
+            nonlocal files_done
+            for file in remaining:
+                if self._downloads_async(file):
+                    await self._download_file_async(
+                        session, auth, executor, file, base_path
+                    )
+                else:
+                    await loop.run_in_executor(executor, download, file, base_path)
+                files_done += 1
+                files_remaining = len(files) - files_done
+                if files_remaining % 100 == 0 and files_remaining > 0:
+                    logger.info(f"({self.drive_id}) Files remaining: {files_remaining}")
+
+        workers = min(self.async_download_concurrency, len(files))
         with ThreadPoolExecutor(max_workers=threads) as executor:
-            futures = []
-            for f in self.files.values():
-                futures.append(executor.submit(self.download_file, f, base_path))
+            async with open_session(self.async_download_concurrency) as session:
+                await asyncio.gather(
+                    *(worker(session, executor) for _ in range(workers))
+                )
+
+    def _downloads_async(self, file: GFile) -> bool:
+        if self.zero_staging_uploads:
+            return False
+        if "md5Checksum" in file:
+            return not self.content_addressed_storage and not (
+                self._should_download_in_ranges(file)
+            )
+        return file["mimeType"] in EXPORT_FORMATS
+
+    async def _download_file_async(
+        self,
+        session: Any,
+        auth: AsyncCredentials,
+        executor: ThreadPoolExecutor,
+        file: GFile,
+        base_path: str,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        # JIT uploads delete every file right after uploading it
+        budgeted = self._uses_disk_budget() and self.jit_s3_upload
+        size = self._estimated_size(file)
+        if budgeted:
+            await loop.run_in_executor(executor, self.disk_budget.reserve, size)
+        try:
+            saved_file_path = None
+            async with download_concurrency.async_slot(size):
+                try:
+                    saved_file_path = await self._save_file_async(
+                        session, auth, file, base_path
+                    )
+                except Exception as e:
+                    self._record_download_error(file, base_path, e)
+            await loop.run_in_executor(
+                executor, self._finish_download, file, base_path, saved_file_path
+            )
+        finally:
+            if budgeted:
+                self.disk_budget.release(size)
+
+    async def _save_file_async(
+        self, session: Any, auth: AsyncCredentials, file: GFile, base_path: str
+    ) -> str:
+        new_file_path = self._file_path(file, base_path)
+        if "md5Checksum" in file:
+            return await self._download_url_async(
+                session, auth, file["id"], media_url(file["id"]), new_file_path
+            )
+        desired_mimetype, extension = EXPORT_FORMATS[file["mimeType"]]
+        new_file_path = f"{new_file_path}.{extension}"
+        try:
+            return await self._download_url_async(
+                session,
+                auth,
+                file["id"],
+                export_url(file["id"]),
+                new_file_path,
+                {"mimeType": desired_mimetype},
+            )
+        except Exception:
+            export_link = file["exportLinks"][desired_mimetype]
+            return await self._download_url_async(
+                session, auth, file["id"], export_link, new_file_path
+            )
+
+    async def _download_url_async(
+        self,
+        session: Any,
+        auth: AsyncCredentials,
+        file_id: str,
+        url: str,
+        file_path: str,
+        params: Optional[Dict[str, str]] = None,
+    ) -> str:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        logger.debug(f"Downloading file: {file_path}")
+        file_path = self._get_available_path_and_lock_it(file_id, file_path)
+        try:
+            await download_to_file(session, auth, url, file_path, params)
+        except Exception:
+            self._remove_partial_file(file_path)
+            raise
+        return file_path
+
+    def _uses_disk_budget(self) -> bool:
+        return self.disk_budget is not None and not self.zero_staging_uploads
+
+    def _estimated_size(self, file: GFile) -> int:
+        if file.get("mimeType") == FOLDER_MIMETYPE:
+            return 0
+        if "size" in file:
+            return int(file["size"])
+        return EXPORT_SIZE_ESTIMATE
+
+    def _download_file_within_disk_budget(self, file: GFile, base_path: str) -> None:
+        # JIT uploads delete every file right after uploading it
+        size = self._estimated_size(file)
+        self.disk_budget.reserve(size)
+        try:
+            self.download_file(file, base_path)
+        finally:
+            self.disk_budget.release(size)
+
+    def release_staged_bytes(self) -> None:
+        if self.disk_budget is not None and self.staged_bytes > 0:
+            self.disk_budget.release(self.staged_bytes)
+            self.staged_bytes = 0
+
+    def stream_download_all_files(
+        self, base_path: str, threads: int = 20, page_size: int = 1000
+    ) -> None:
+        """Lists the drive and downloads files while listing is still running.
+
+        Every listing page is handed to the download threads as soon as it
+        arrives. A file is submitted once its whole parent chain is known, so
+        paths are the same as with `fetch_file_list`. Files waiting for an
+        unlisted folder are submitted when that folder shows up, or when the
+        listing ends (with the same orphan handling as `build_file_path`).
+        """
+        drive_service = self._get_drive_service()
+        self.files.clear()
+        self.path_resolver.clear()
+        root_id = self._get_root_folder_id(drive_service)
+        waiting: Dict[str, List[GFile]] = {}
+        futures = []
+        files_done = 0
+
+        def log_progress(_) -> None:
+            nonlocal files_done
+            with self.lock:
+                files_done += 1
+                if files_done % 100 == 0:
+                    logger.info(
+                        f"({self.drive_id}) Files downloaded: {files_done}/{len(self.files)}"
+                    )
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+
+            def submit(file: GFile) -> None:
+                file["path"] = self.path_resolver.resolve(file["id"])
+                future = executor.submit(self.download_file, file, base_path)
+                future.add_done_callback(log_progress)
+                futures.append(future)
+
+            # Folders first, so that most files find their parents already listed
+            for page in self._list_file_pages(drive_service, page_size, "folder"):
+                ready = []
+                for file in page:
+                    self.files[file["id"]] = file
+                    ready.append(file)
+                for file in page:
+                    ready.extend(waiting.pop(file["id"], []))
+                for file in ready:
+                    missing_parent = self._find_unlisted_ancestor(file, root_id)
+                    if missing_parent is None:
+                        submit(file)
+                    else:
+                        waiting.setdefault(missing_parent, []).append(file)
+
+            self._files_fetched = True
+            for files in waiting.values():
+                for file in files:
+                    submit(file)
+            waiting.clear()
+            logger.info(
+                f"({self.drive_id}) Listing done, {len(self.files)} files found"
+            )
+
             for future in as_completed(futures):
                 future.result()
-                futures.remove(future)
-                files_remaining = len(futures)
-                if files_remaining % 100 == 0 and files_remaining > 0:
-                    logger.info(f"({self.drive_id}) Files remaining: {len(futures)}")
+        self.download_blobs_claimed_elsewhere(base_path)
 
     def _is_cannot_download_error(self, error: Exception) -> bool:
         return (
@@ -279,66 +900,277 @@ class GDrive:
         self,
         file: GFile,
         base_path: str,
+        content_addressed: Optional[bool] = None,
     ) -> None:
+        if content_addressed is None:
+            content_addressed = self.content_addressed_storage
         saved_file_path = None
-        try:
-            if "md5Checksum" in file:
-                saved_file_path = self.download_binary_file(file, base_path)
-            else:
-                saved_file_path = self.export_file(file, base_path)
-        except Exception as e:
-            if self._is_cannot_download_error(e):
-                logger.warning(
-                    f"Skipping file \"{file['name']}\" ({file['id']}) - no download permission"
-                )
-                os.makedirs(
-                    os.path.dirname(f"{base_path}/permission_errors.txt"), exist_ok=True
-                )
-                with open(f"{base_path}/permission_errors.txt", "a") as f:
-                    f.write(f"\"{file['name']}\" | ({file['id']})\n")
-                return
+        with download_concurrency.slot(self._estimated_size(file)):
+            try:
+                if "md5Checksum" in file and content_addressed:
+                    self.download_blob(file, base_path)
+                    return
+                if "md5Checksum" in file:
+                    saved_file_path = self.download_binary_file(file, base_path)
+                else:
+                    saved_file_path = self.export_file(file, base_path)
+            except Exception as e:
+                self._record_download_error(file, base_path, e)
+        self._finish_download(file, base_path, saved_file_path)
 
-            os.makedirs(os.path.dirname(f"{base_path}/errors.txt"), exist_ok=True)
-            with open(f"{base_path}/errors.txt", "a") as f:
-                logger.error(
-                    f"Error downloading file \"{file['name']}\" ({file['id']}, (drive: {self.drive_id})): {e}"
-                )
-                f.write(
-                    f"Error downloading file \"{file['name']}\" ({file['id']}): {e}\n"
-                )
+    def _record_download_error(
+        self, file: GFile, base_path: str, error: Exception
+    ) -> None:
+        if is_permanent_error(error):
+            # Incremental runs don't retry it until the file changes
+            file["unavailable"] = str(error)
+        if self._is_cannot_download_error(error):
+            logger.warning(
+                f"Skipping file \"{file['name']}\" ({file['id']}) - no download permission"
+            )
+            os.makedirs(
+                os.path.dirname(f"{base_path}/permission_errors.txt"), exist_ok=True
+            )
+            with open(f"{base_path}/permission_errors.txt", "a") as f:
+                f.write(f"\"{file['name']}\" | ({file['id']})\n")
+            return
 
-        if self.jit_s3_upload and saved_file_path is not None:
+        os.makedirs(os.path.dirname(f"{base_path}/errors.txt"), exist_ok=True)
+        with open(f"{base_path}/errors.txt", "a") as f:
+            logger.error(
+                f"Error downloading file \"{file['name']}\" ({file['id']}, (drive: {self.drive_id})): {error}"
+            )
+            f.write(
+                f"Error downloading file \"{file['name']}\" ({file['id']}): {error}\n"
+            )
+
+    def _finish_download(
+        self, file: GFile, base_path: str, saved_file_path: Optional[str]
+    ) -> None:
+        if saved_file_path is None:
+            return
+        file["backup_path"] = os.path.relpath(
+            saved_file_path, os.path.dirname(base_path)
+        )
+
+        if self.on_file_saved is not None:
+            self.on_file_saved(file, saved_file_path)
+
+        # Streamed files are already in S3, only what was written to disk
+        # (e.g. shortcuts) still needs to be uploaded
+        if self.jit_s3_upload and os.path.isfile(saved_file_path):
+            if self.bundler is not None and self.bundler.accepts(saved_file_path):
+                self._add_to_bundle(file, saved_file_path, base_path)
+                return
             try:
                 s3 = self._get_s3_service()
-                destination_path = "/".join(saved_file_path.split("/")[1:])
+                destination_path = self._s3_key(saved_file_path)
                 s3.upload_file(saved_file_path, destination_path)
                 logger.trace(f"Removing file: {saved_file_path}")
                 os.remove(saved_file_path)
             except Exception as e:
-                os.makedirs(os.path.dirname(f"{base_path}/errors.txt"), exist_ok=True)
-                with open(f"{base_path}/errors.txt", "a") as f:
-                    logger.error(f'Error uploading file "{saved_file_path}" to S3: {e}')
-                    f.write(f'Error uploading file "{saved_file_path}" to S3: {e}\n')
+                file.pop("backup_path", None)
+                self._record_upload_error(base_path, saved_file_path, e)
 
-    def download_binary_file(self, file: GFile, base_path: str) -> str:
+    def _add_to_bundle(self, file: GFile, saved_file_path: str, base_path: str) -> None:
+        try:
+            bundle = self.bundler.add(file, saved_file_path, file["backup_path"])
+            os.remove(saved_file_path)
+        except Exception as e:
+            file.pop("backup_path", None)
+            self._record_upload_error(base_path, saved_file_path, e)
+            return
+        if bundle is not None:
+            self._upload_bundle(bundle, base_path)
+
+    def flush_bundle(self, base_path: str) -> None:
+        """Uploads the bundle still being filled, if any. Called once the
+        drive is downloaded, so bundles span all calls of the download
+        methods."""
+        if self.bundler is None:
+            return
+        bundle = self.bundler.flush()
+        if bundle is not None:
+            self._upload_bundle(bundle, base_path)
+
+    def _upload_bundle(self, bundle: Bundle, base_path: str) -> None:
+        try:
+            self._get_s3_service().upload_file(bundle.path, self._s3_key(bundle.path))
+            os.remove(bundle.path)
+        except Exception as e:
+            for file, _, _ in bundle.files:
+                file.pop("backup_path", None)
+            self._record_upload_error(base_path, bundle.path, e)
+            return
+        Bundler.locate(bundle, os.path.relpath(bundle.path, os.path.dirname(base_path)))
+        logger.trace(
+            f"({self.drive_id}) Uploaded bundle {bundle.path} with {len(bundle.files)} files"
+        )
+
+    def _record_upload_error(self, base_path: str, path: str, error: Exception) -> None:
+        os.makedirs(os.path.dirname(f"{base_path}/errors.txt"), exist_ok=True)
+        with open(f"{base_path}/errors.txt", "a") as f:
+            logger.error(f'Error uploading file "{path}" to S3: {error}')
+            f.write(f'Error uploading file "{path}" to S3: {error}\n')
+
+    def _s3_key(self, file_path: str) -> str:
+        return "/".join(file_path.split("/")[1:])
+
+    def _open_output(
+        self,
+        file_path: str,
+        expected_md5: Optional[str] = None,
+        size: Optional[int] = None,
+    ) -> Any:
+        """Opens the destination of a download: the local file, or with
+        zero-staging uploads a multipart upload to its S3 key."""
+        if not self.zero_staging_uploads:
+            return open(file_path, "wb")
+        return self._open_s3_output(self._s3_key(file_path), expected_md5, size)
+
+    def _open_s3_output(
+        self,
+        key: str,
+        expected_md5: Optional[str] = None,
+        size: Optional[int] = None,
+    ) -> Any:
+        # Files too large for MAX_PARTS parts of the configured size get
+        # larger parts, files of unknown size (exports) are small
+        part_size = part_size_for(size, self.upload_part_size) if size else None
+        return self._get_s3_service().open_multipart_writer(
+            key,
+            self.part_buffers,
+            self.upload_executor,
+            expected_md5=expected_md5,
+            part_size=part_size,
+        )
+
+    def _blob_key(self, md5_checksum: str) -> str:
+        return f"{BLOBS_PREFIX}/{md5_checksum[:2]}/{md5_checksum}"
+
+    def download_blob(self, file: GFile, base_path: str) -> None:
+        """Stores a binary file once under its checksum, shared by all drives.
+
+        Blobs already uploaded by a previous run, or claimed by another worker
+        of this run, are not downloaded again. The manifest entry of the file
+        points at the blob.
+        """
+        md5_checksum = file["md5Checksum"]
+        key = self._blob_key(md5_checksum)
+        if not self.blob_registry.claim(md5_checksum):
+            # Pointed at the blob once the other worker has stored it
+            logger.trace(f"Blob {key} claimed by another worker")
+            with self.lock:
+                self._blobs_claimed_elsewhere.append(file)
+            return
+
+        try:
+            s3 = self._get_s3_service()
+            if not s3.object_exists(key) and self.zero_staging_uploads:
+                self.stream_binary_file_to_s3(file, key)
+            elif not s3.object_exists(key):
+                saved_file_path = self.download_binary_file(file, base_path)
+                s3.upload_file(saved_file_path, key)
+                logger.trace(f"Removing file: {saved_file_path}")
+                os.remove(saved_file_path)
+            else:
+                logger.trace(f"Blob {key} already in S3")
+        except Exception:
+            self.blob_registry.release(md5_checksum)
+            raise
+        self.blob_registry.complete(md5_checksum)
+        file["blob"] = key
+
+    def download_blobs_claimed_elsewhere(self, base_path: str) -> None:
+        # Whoever claimed a blob may fail to store it, or die, so make sure it
+        # exists. Released and abandoned claims are taken over here (which can
+        # lose to yet another worker, hence the loop). Blobs still claimed
+        # after the wait are stored as plain files.
+        while True:
+            with self.lock:
+                files = self._blobs_claimed_elsewhere
+                self._blobs_claimed_elsewhere = []
+            if not files:
+                return
+            done = self.blob_registry.wait_all({file["md5Checksum"] for file in files})
+            for file in files:
+                md5_checksum = file["md5Checksum"]
+                key = self._blob_key(md5_checksum)
+                if md5_checksum in done or self._get_s3_service().object_exists(key):
+                    file["blob"] = key
+                elif self.blob_registry.is_claimed(md5_checksum):
+                    logger.warning(
+                        f"Blob {key} still claimed after waiting, downloading \"{file['name']}\" ({file['id']}) as a plain file"
+                    )
+                    self.download_file(file, base_path, content_addressed=False)
+                else:
+                    self.download_file(file, base_path)
+
+    def stream_binary_file_to_s3(self, file: GFile, key: str) -> None:
         drive_service = self._get_drive_service()
         request = drive_service.files().get_media(fileId=file["id"])
+        logger.debug(f"Streaming file to S3: {key}")
+        with self._open_s3_output(
+            key, file["md5Checksum"], int(file.get("size", 0))
+        ) as f:
+            self._write_request(request, f)
+
+    def _file_path(self, file: GFile, base_path: str) -> str:
         if file["path"] == "":
-            new_file_path = f"{base_path}/{file['name']}"
-        else:
-            new_file_path = f"{base_path}/{file['path']}/{file['name']}"
-        saved_file_path = self.write_request_to_file(file["id"], request, new_file_path)
+            return f"{base_path}/{file['name']}"
+        return f"{base_path}/{file['path']}/{file['name']}"
+
+    def download_binary_file(self, file: GFile, base_path: str) -> str:
+        new_file_path = self._file_path(file, base_path)
+        if self._should_download_in_ranges(file):
+            return self.download_file_in_ranges(file, new_file_path)
+        drive_service = self._get_drive_service()
+        request = drive_service.files().get_media(fileId=file["id"])
+        saved_file_path = self.write_request_to_file(
+            file["id"],
+            request,
+            new_file_path,
+            file.get("md5Checksum"),
+            int(file.get("size", 0)),
+        )
         return saved_file_path
 
+    def _should_download_in_ranges(self, file: GFile) -> bool:
+        # Ranges are written in place on disk, streamed uploads can't do that
+        return (
+            not self.zero_staging_uploads
+            and self.ranged_download_threshold > 0
+            and int(file.get("size", 0)) >= self.ranged_download_threshold
+        )
+
+    def download_file_in_ranges(self, file: GFile, file_path: str) -> str:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        file_path = self._get_available_path_and_lock_it(file["id"], file_path)
+        size = int(file["size"])
+        logger.debug(
+            f"Downloading file in ranges: {file_path} ({size/1024/1024:.2f}MB)"
+        )
+        try:
+            download_in_ranges(
+                self._get_auth_session(),
+                MEDIA_URL.format(file_id=file["id"]),
+                file_path,
+                size,
+                file["md5Checksum"],
+                threads=self.ranged_download_threads,
+            )
+        except Exception:
+            # A preallocated file has the right size even if it's incomplete
+            self._remove_partial_file(file_path)
+            raise
+        return file_path
+
     def export_file(self, file: GFile, base_path: str) -> str:
-        if file["mimeType"] == "application/vnd.google-apps.folder":
+        if file["mimeType"] == FOLDER_MIMETYPE:
             return
 
         drive_service = self._get_drive_service()
-        if file["path"] == "":
-            new_file_path = f"{base_path}/{file['name']}"
-        else:
-            new_file_path = f"{base_path}/{file['path']}/{file['name']}"
+        new_file_path = self._file_path(file, base_path)
 
         export_handler = self.file_export_handlers.get(file["mimeType"], None)
         if export_handler is not None:
@@ -348,6 +1180,7 @@ class GDrive:
             with open(f"{base_path}/errors.txt", "a") as f:
                 logger.warning(f"Unknown file type: {file['mimeType']} ({file['id']})")
                 f.write(f"Unknown file type: {file['mimeType']} ({file['id']})\n")
+                file["unavailable"] = f"Unknown file type: {file['mimeType']}"
                 return None
         return saved_file_path
 
@@ -363,7 +1196,11 @@ class GDrive:
         counter = 1
         while True:
             with self.lock:
-                if new_path not in self.locked_files and not os.path.exists(new_path):
+                if (
+                    new_path not in self.locked_files
+                    and not os.path.exists(new_path)
+                    and self._claim_shared_path(new_path)
+                ):
                     self.locked_files.add(new_path)
                     logger.trace(f"Locked new path: {new_path}")
                     return new_path
@@ -371,6 +1208,20 @@ class GDrive:
             new_path = path_format % f"{fileId[:5]}_{counter}"
             counter += 1
 
+    def _claim_shared_path(self, file_path: str) -> bool:
+        # Other processes may download files of the same drive
+        return self.path_registry is None or self.path_registry.claim(file_path)
+
+    def reserve_file_path(self, file_path: str) -> bool:
+        with self.lock:
+            if file_path in self.locked_files or not self._claim_shared_path(file_path):
+                return False
+            self.locked_files.add(file_path)
+            return True
+
+    def release_file_path(self, file_path: str) -> None:
+        self._unlock_file_path(file_path)
+
     def _unlock_file_path(self, file_path: str) -> None:
         with self.lock:
             self.locked_files.remove(file_path)
@@ -382,28 +1233,74 @@ class GDrive:
         auth_session = self._get_auth_session()
         os.makedirs(os.path.dirname(new_file_path), exist_ok=True)
         new_file_path = self._get_available_path_and_lock_it(fileId, new_file_path)
-        with open(new_file_path, "wb") as f:
-            response = auth_session.get(export_link, stream=True)
-            for chunk in response.iter_content(chunk_size=104857600):  # 100MB
+        try:
+            with self._open_output(new_file_path) as f:
+                for attempt in download_retrying():
+                    with attempt:
+                        self._write_export_link_to_file(auth_session, export_link, f)
+        except Exception:
+            self._remove_partial_file(new_file_path)
+            raise
+        return new_file_path
+
+    def _write_export_link_to_file(
+        self, auth_session: requests.Session, export_link: str, f: Any
+    ) -> None:
+        # Ask for the rest of the file after an interrupted attempt, exports
+        # that can't be resumed are downloaded again from the start
+        written = f.tell()
+        headers = {"Range": f"bytes={written}-"} if written else {}
+        response = auth_session.get(export_link, stream=True, headers=headers)
+        response.raise_for_status()
+        if written and response.status_code != 206:
+            f.seek(0)
+            f.truncate()
+        chunk_size = memory_budget.chunk_size
+        with memory_budget.reserve(chunk_size):
+            for chunk in response.iter_content(chunk_size=chunk_size):
                 if chunk:
                     f.write(chunk)
-        return new_file_path
 
-    def write_request_to_file(self, fileId: str, request: Any, file_path: str) -> None:
+    def write_request_to_file(
+        self,
+        fileId: str,
+        request: Any,
+        file_path: str,
+        expected_md5: Optional[str] = None,
+        size: Optional[int] = None,
+    ) -> None:
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
         logger.debug(f"Downloading file: {file_path}")
 
         file_path = self._get_available_path_and_lock_it(fileId, file_path)
 
-        with open(file_path, "wb") as f:
-            downloader = MediaIoBaseDownload(f, request)
-            done = False
-            while not done:
-                _, done = downloader.next_chunk()
+        try:
+            with self._open_output(file_path, expected_md5, size) as f:
+                self._write_request(request, f)
+        except Exception:
+            self._remove_partial_file(file_path)
+            raise
 
         return file_path
 
+    def _write_request(self, request: Any, f: Any) -> None:
+        # The downloader only moves forward once a chunk is written, so a
+        # retried chunk resumes from the last byte written
+        chunk_size = memory_budget.chunk_size
+        downloader = MediaIoBaseDownload(f, request, chunksize=chunk_size)
+        done = False
+        with memory_budget.reserve(chunk_size):
+            while not done:
+                for attempt in download_retrying():
+                    with attempt:
+                        _, done = downloader.next_chunk()
+
+    def _remove_partial_file(self, file_path: str) -> None:
+        if os.path.exists(file_path):
+            logger.trace(f"Removing partial file: {file_path}")
+            os.remove(file_path)
+
     def _handle_shortcut_export(
         self, file: GFile, drive_service: DriveService, new_file_path: str
     ) -> str:
@@ -416,122 +1313,21 @@ class GDrive:
             f.write(original_file_path)
         return f"{new_file_path}.lnk.txt"
 
-    def _handle_document_export(
-        self, file: GFile, drive_service: DriveService, new_file_path: str
-    ) -> str:
-        desired_mimetype = (
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        )
-        try:
-            request = drive_service.files().export_media(
-                fileId=file["id"],
-                mimeType=desired_mimetype,
-            )
-            saved_file_path = self.write_request_to_file(
-                file["id"], request, f"{new_file_path}.docx"
-            )
-        except Exception:
-            export_link = file["exportLinks"][desired_mimetype]
-            saved_file_path = self.download_via_export_link(
-                file["id"], export_link, f"{new_file_path}.docx"
-            )
-        return saved_file_path
-
-    def _handle_spreadsheet_export(
-        self, file: GFile, drive_service: DriveService, new_file_path: str
-    ) -> str:
-        desired_mimetype = (
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        try:
-            request = drive_service.files().export_media(
-                fileId=file["id"],
-                mimeType=desired_mimetype,
-            )
-            saved_file_path = self.write_request_to_file(
-                file["id"], request, f"{new_file_path}.xlsx"
-            )
-        except Exception:
-            export_link = file["exportLinks"][desired_mimetype]
-            saved_file_path = self.download_via_export_link(
-                file["id"], export_link, f"{new_file_path}.xlsx"
-            )
-        return saved_file_path
-
-    def _handle_presentation_export(
-        self, file: GFile, drive_service: DriveService, new_file_path: str
-    ) -> str:
-        desired_mimetype = (
-            "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-        )
-        try:
-            request = drive_service.files().export_media(
-                fileId=file["id"],
-                mimeType=desired_mimetype,
-            )
-            saved_file_path = self.write_request_to_file(
-                file["id"], request, f"{new_file_path}.pptx"
-            )
-        except Exception:
-            export_link = file["exportLinks"][desired_mimetype]
-            saved_file_path = self.download_via_export_link(
-                file["id"], export_link, f"{new_file_path}.pptx"
-            )
-        return saved_file_path
-
-    def _handle_drawing_export(
-        self, file: GFile, drive_service: DriveService, new_file_path: str
-    ) -> str:
-        desired_mimetype = "application/pdf"
-        try:
-            request = drive_service.files().export_media(
-                fileId=file["id"],
-                mimeType=desired_mimetype,
-            )
-            saved_file_path = self.write_request_to_file(
-                file["id"], request, f"{new_file_path}.pdf"
-            )
-        except Exception:
-            export_link = file["exportLinks"][desired_mimetype]
-            saved_file_path = self.download_via_export_link(
-                file["id"], export_link, f"{new_file_path}.pdf"
-            )
-        return saved_file_path
-
-    def _handle_script_export(
-        self, file: GFile, drive_service: DriveService, new_file_path: str
-    ) -> str:
-        desired_mimetype = "application/vnd.google-apps.script+json"
-        try:
-            request = drive_service.files().export_media(
-                fileId=file["id"],
-                mimeType=desired_mimetype,
-            )
-            saved_file_path = self.write_request_to_file(
-                file["id"], request, f"{new_file_path}.json"
-            )
-        except Exception:
-            export_link = file["exportLinks"][desired_mimetype]
-            saved_file_path = self.download_via_export_link(
-                file["id"], export_link, f"{new_file_path}.json"
-            )
-        return saved_file_path
-
-    def _handle_zip_export(
+    def _handle_format_export(
         self, file: GFile, drive_service: DriveService, new_file_path: str
     ) -> str:
-        desired_mimetype = "application/zip"
+        desired_mimetype, extension = EXPORT_FORMATS[file["mimeType"]]
         try:
             request = drive_service.files().export_media(
                 fileId=file["id"],
                 mimeType=desired_mimetype,
             )
             saved_file_path = self.write_request_to_file(
-                file["id"], request, f"{new_file_path}.zip"
+                file["id"], request, f"{new_file_path}.{extension}"
             )
         except Exception:
             export_link = file["exportLinks"][desired_mimetype]
             saved_file_path = self.download_via_export_link(
-                file["id"], export_link, f"{new_file_path}.zip"
+                file["id"], export_link, f"{new_file_path}.{extension}"
             )
         return saved_file_path
@@ -0,0 +1,68 @@
+from typing import Any, Dict, Optional, TypeAlias
+
+from src.utils.logger import app_logger as logger
+
+GFile: TypeAlias = Dict[str, Any]
+
+
+class PathResolver:
+    """Resolves the folder path of files listed from a drive.
+
+    Every folder path is computed once and memoized, so resolving the paths of
+    all files in a drive is linear in the number of files instead of
+    O(files * depth). Parents missing from the listing (e.g. drive root or
+    folders owned by someone else) end the path, and parent cycles are broken
+    at the first repeated folder instead of looping forever.
+    """
+
+    def __init__(self, files: Dict[str, GFile]) -> None:
+        self.files = files
+        self._folder_paths: Dict[str, str] = {}
+
+    def clear(self) -> None:
+        self._folder_paths.clear()
+
+    def is_cached(self, folder_id: str) -> bool:
+        return folder_id in self._folder_paths
+
+    def resolve(self, file_id: str) -> Optional[str]:
+        f = self.files.get(file_id)
+        if f is None:
+            return None
+        parents = f.get("parents")
+        if not parents or parents[0] not in self.files:
+            return ""
+        return self.folder_path(parents[0])
+
+    def folder_path(self, folder_id: str) -> str:
+        cached = self._folder_paths.get(folder_id)
+        if cached is not None:
+            return cached
+
+        chain = []
+        seen = set()
+        prefix = ""
+        current = folder_id
+        while True:
+            cached = self._folder_paths.get(current)
+            if cached is not None:
+                prefix = cached
+                break
+            folder = self.files.get(current)
+            if folder is None:
+                break
+            if current in seen:
+                logger.debug(f"Parent cycle detected at folder {current}")
+                break
+            chain.append(current)
+            seen.add(current)
+            parents = folder.get("parents")
+            if not parents:
+                break
+            current = parents[0]
+
+        for chain_id in reversed(chain):
+            name = self.files[chain_id]["name"]
+            prefix = f"{prefix}/{name}" if prefix else name
+            self._folder_paths[chain_id] = prefix
+        return prefix
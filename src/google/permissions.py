@@ -0,0 +1,44 @@
+import threading
+from typing import Any, Dict, MutableMapping, Optional, TypeAlias
+
+GPermission: TypeAlias = Dict[str, Any]
+
+
+class PermissionCache:
+    """Thread-safe cache of permissions by id.
+
+    Lookups hit a local dict first. When a `shared` mapping is set (e.g. a
+    `multiprocessing.Manager().dict()`), permissions fetched by any drive
+    process are reused by all of them.
+    """
+
+    def __init__(self, shared: Optional[MutableMapping[str, GPermission]] = None):
+        self._local: Dict[str, GPermission] = {}
+        self._shared = shared
+        self._lock = threading.Lock()
+
+    def share(self, shared: MutableMapping[str, GPermission]) -> None:
+        self._shared = shared
+
+    def get(self, permission_id: str) -> Optional[GPermission]:
+        with self._lock:
+            permission = self._local.get(permission_id)
+        if permission is None and self._shared is not None:
+            permission = self._shared.get(permission_id)
+            if permission is not None:
+                with self._lock:
+                    self._local[permission_id] = permission
+        return permission
+
+    def update(self, permissions: Dict[str, GPermission]) -> None:
+        with self._lock:
+            self._local.update(permissions)
+        if self._shared is not None and permissions:
+            self._shared.update(permissions)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._local.clear()
+
+
+permission_cache = PermissionCache()
@@ -0,0 +1,97 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, List, Tuple
+
+from src.utils.memory_budget import memory_budget
+from .retries import download_retrying
+
+MEDIA_URL = "https://www.googleapis.com/drive/v3/files/{file_id}?alt=media&supportsAllDrives=true"
+SEGMENT_SIZE = 64 * 1024 * 1024  # 64MB
+READ_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class ChecksumMismatchError(Exception):
+    pass
+
+
+def split_into_segments(size: int, segment_size: int) -> List[Tuple[int, int]]:
+    """Returns the (start, end) byte ranges covering `size` bytes, with `end`
+    inclusive as in HTTP Range headers."""
+    return [
+        (start, min(start + segment_size, size) - 1)
+        for start in range(0, size, segment_size)
+    ]
+
+
+def download_segment(session: Any, url: str, fd: int, start: int, end: int) -> None:
+    """Downloads bytes `start`-`end` into `fd`. A transient error resumes the
+    segment from the last byte written instead of starting it over."""
+    offset = start
+    with memory_budget.reserve(READ_CHUNK_SIZE):
+        for attempt in download_retrying():
+            with attempt:
+                response = session.get(
+                    url, headers={"Range": f"bytes={offset}-{end}"}, stream=True
+                )
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise RuntimeError(
+                        f"Range requests not supported ({response.status_code})"
+                    )
+                for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                    if chunk:
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                if offset != end + 1:
+                    raise ConnectionError(
+                        f"Incomplete segment {start}-{end}: got {offset - start} bytes"
+                    )
+
+
+def file_md5(file_path: str) -> str:
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def download_in_ranges(
+    session: Any,
+    url: str,
+    file_path: str,
+    size: int,
+    md5_checksum: str,
+    threads: int = 8,
+    segment_size: int = SEGMENT_SIZE,
+) -> None:
+    """Downloads `size` bytes from `url` into `file_path` with parallel HTTP
+    Range requests. The file is preallocated and every segment is written in
+    place with pwrite, then the whole file is checked against `md5_checksum`."""
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)
+        segments = split_into_segments(size, segment_size)
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(threads, len(segments)))
+        ) as executor:
+            futures = [
+                executor.submit(download_segment, session, url, fd, start, end)
+                for start, end in segments
+            ]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                # Don't download the rest of a file that already failed
+                executor.shutdown(cancel_futures=True)
+                raise
+    finally:
+        os.close(fd)
+
+    actual_checksum = file_md5(file_path)
+    if actual_checksum != md5_checksum:
+        raise ChecksumMismatchError(
+            f"md5 mismatch for {file_path}: expected {md5_checksum}, got {actual_checksum}"
+        )
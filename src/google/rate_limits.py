@@ -0,0 +1,73 @@
+import asyncio
+import time
+from collections import Counter
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+
+from src.utils.token_buckets import TokenBuckets
+
+LISTING = "listing"
+PERMISSIONS = "permissions"
+EXPORT = "export"
+MEDIA = "media"
+
+
+def request_kind(url: str) -> Optional[str]:
+    """Returns which Drive budget a request to `url` draws from, None for
+    other APIs (e.g. Admin SDK). Listings, changes and metadata lookups
+    share the listing budget. Batch requests draw nothing themselves, their
+    inner requests are charged with `DriveRateLimits.wait_batch`."""
+    parsed = urlparse(url)
+    if parsed.path.startswith("/batch/"):
+        return None
+    # Both files/{id}/export (sent with alt=media) and the exportLinks of
+    # documents
+    if "/export" in parsed.path.lower():
+        return EXPORT
+    if "alt=media" in parsed.query:
+        return MEDIA
+    if "/drive/" not in parsed.path:
+        return None
+    if "/permissions" in parsed.path:
+        return PERMISSIONS
+    return LISTING
+
+
+class DriveRateLimits:
+    """Makes the Drive requests of a process wait for their turn in the
+    `TokenBuckets` shared by all drive processes. Requests go out right away
+    until `share` is called."""
+
+    def __init__(self) -> None:
+        self._buckets: Optional[TokenBuckets] = None
+
+    def share(self, buckets: Optional[TokenBuckets]) -> None:
+        self._buckets = buckets
+
+    def _reserve(self, urls: Iterable[str]) -> float:
+        if self._buckets is None:
+            return 0.0
+        counts = Counter(request_kind(url) for url in urls)
+        counts.pop(None, None)
+        return max(
+            (self._buckets.reserve(kind, count) for kind, count in counts.items()),
+            default=0.0,
+        )
+
+    def wait(self, url: str) -> None:
+        self.wait_batch([url])
+
+    def wait_batch(self, urls: Iterable[str]) -> None:
+        """Waits until requests to all of `urls` can be sent, e.g. the inner
+        requests of a batch request (Drive counts each against quota)."""
+        wait = self._reserve(urls)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def wait_async(self, url: str) -> None:
+        wait = self._reserve([url])
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+drive_rate_limits = DriveRateLimits()
@@ -0,0 +1,117 @@
+import http.client
+import json
+import socket
+from typing import Any, Dict, Set
+
+import aiohttp
+import requests
+from googleapiclient.errors import HttpError
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from src.utils.logger import app_logger as logger
+
+from .adaptive_concurrency import download_concurrency
+
+DOWNLOAD_RETRY_ATTEMPTS = 5
+# Jittered, so that downloads throttled together don't retry together
+DOWNLOAD_RETRY_WAIT = wait_random_exponential(multiplier=1, min=2, max=30)
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Drive refusing a file (no access, not found) gives the same answer on the
+# next run, unless the file changes
+PERMANENT_STATUS_CODES = {403, 404}
+# Drive answers 403 instead of 429 when a quota is used up
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+def _status_code(error: Exception) -> int | None:
+    if isinstance(error, HttpError) and hasattr(error.resp, "status"):
+        return int(error.resp.status)
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    return None
+
+
+def _error_reasons(error: Exception) -> Set[str]:
+    content = None
+    if isinstance(error, HttpError):
+        content = error.content
+    elif isinstance(error, requests.HTTPError) and error.response is not None:
+        content = error.response.content
+    try:
+        errors = json.loads(content)["error"]["errors"]
+        return {e["reason"] for e in errors}
+    except (TypeError, ValueError, KeyError):
+        return set()
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    status = _status_code(error)
+    return status == 429 or (
+        status == 403 and bool(_error_reasons(error) & RATE_LIMIT_REASONS)
+    )
+
+
+def is_permanent_error(error: Exception) -> bool:
+    return _status_code(error) in PERMANENT_STATUS_CODES and not is_rate_limit_error(
+        error
+    )
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Network failures, throttling and server errors are worth retrying,
+    anything else (missing file, no permission...) fails the same way again."""
+    status = _status_code(error)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES or is_rate_limit_error(error)
+    return isinstance(
+        error,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,
+            http.client.HTTPException,
+            socket.timeout,
+            ConnectionError,
+            TimeoutError,
+        ),
+    )
+
+
+def _log_retry(retry_state) -> None:
+    error = retry_state.outcome.exception()
+    if is_rate_limit_error(error):
+        download_concurrency.throttled()
+    logger.warning(
+        f"Transient download error, retrying (attempt {retry_state.attempt_number}): {error}"
+    )
+
+
+def download_retrying() -> Retrying:
+    """Returns a tenacity `Retrying` for one download step. Callers keep their
+    progress outside the retried block so every attempt resumes where the
+    previous one stopped."""
+    return Retrying(**_download_retry_options())
+
+
+def async_download_retrying() -> AsyncRetrying:
+    """Same as `download_retrying`, for coroutines."""
+    return AsyncRetrying(**_download_retry_options())
+
+
+def _download_retry_options() -> Dict[str, Any]:
+    # Read at call time so tests can patch the wait
+    return {
+        "stop": stop_after_attempt(DOWNLOAD_RETRY_ATTEMPTS),
+        "wait": DOWNLOAD_RETRY_WAIT,
+        "retry": retry_if_exception(is_transient_error),
+        "before_sleep": _log_retry,
+        "reraise": True,
+    }
@@ -0,0 +1,80 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httplib2
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+
+from .rate_limits import drive_rate_limits
+
+# Connections kept alive per host, more are opened when every one is busy
+# and closed once they are done
+POOL_SIZE = 64
+TIMEOUT = 120  # Seconds, for connecting and between bytes read
+
+_lock = threading.Lock()
+_pid: Optional[int] = None
+_adapter: Optional[HTTPAdapter] = None
+_sessions: Dict[Any, AuthorizedSession] = {}
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """Sends every request once the shared Drive rate limits allow it."""
+
+    def send(self, request: Any, *args: Any, **kwargs: Any) -> Any:
+        drive_rate_limits.wait(request.url)
+        return super().send(request, *args, **kwargs)
+
+
+def _shared_adapter() -> RateLimitedAdapter:
+    global _pid, _adapter
+    # Pool workers must not share connections opened before the fork
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _adapter = RateLimitedAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+        _sessions.clear()
+    return _adapter
+
+
+def authorized_session(credentials: Any) -> AuthorizedSession:
+    """Returns the session of the process for `credentials`. Sessions of all
+    credentials share one pool of keep-alive connections, are safe to use
+    from several threads and refresh the token when it expires."""
+    with _lock:
+        adapter = _shared_adapter()
+        session = _sessions.get(credentials)
+        if session is None:
+            session = AuthorizedSession(credentials)
+            session.mount("https://", adapter)
+            _sessions[credentials] = session
+        return session
+
+
+class SessionHttp:
+    """Stand-in for `httplib2.Http` sending the requests of API clients made
+    with `build(..., http=SessionHttp(session))` through a shared session.
+    Unlike `httplib2.Http` it can be used by several threads at once."""
+
+    def __init__(self, session: AuthorizedSession, timeout: float = TIMEOUT) -> None:
+        self.session = session
+        self.timeout = timeout
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        redirections: int = httplib2.DEFAULT_MAX_REDIRECTS,
+        connection_type: Any = None,
+    ) -> Tuple[httplib2.Response, bytes]:
+        response = self.session.request(
+            method, uri, data=body, headers=headers, timeout=self.timeout
+        )
+        info = {key.lower(): value for key, value in response.headers.items()}
+        # The content is already decompressed
+        if info.pop("content-encoding", None) is not None:
+            info["content-length"] = str(len(response.content))
+        info["status"] = str(response.status_code)
+        return httplib2.Response(info), response.content
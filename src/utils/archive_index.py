@@ -0,0 +1,102 @@
+import io
+import tarfile
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.utils.compression_engine import CompressedWriter, decompress
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.json"
+# Files start a new frame once the current one holds at least this much,
+# smaller files share frames so they still compress well together
+MIN_FRAME_SIZE = 1024 * 1024  # 1MB
+
+
+class ArchiveIndexer:
+    """Records where every file of a seekable archive is, so that it can be
+    restored from a byte range of the archive.
+
+    Files start new frames of `writer` (see `MIN_FRAME_SIZE`). The index maps
+    each file to the compressed range from the frame holding its tar header
+    to the frame after its data, and to the offset of its header once that
+    range is decompressed.
+    """
+
+    def __init__(
+        self,
+        writer: CompressedWriter,
+        algorithm: str,
+        min_frame_size: int = MIN_FRAME_SIZE,
+    ) -> None:
+        self.writer = writer
+        self.algorithm = algorithm
+        self.min_frame_size = min_frame_size
+        # Name, uncompressed offset of the header and size of every file
+        self._members: List[Tuple[str, int, int]] = []
+
+    def start_member(self, info: tarfile.TarInfo) -> None:
+        """Called right before the member is written to the archive."""
+        if not info.isfile():
+            return
+        if self.writer.tell() - self.writer.frame_start >= self.min_frame_size:
+            self.writer.end_frame()
+        self._members.append((info.name, self.writer.tell(), info.size))
+
+    def members(self) -> Dict[str, Dict[str, int]]:
+        """Byte ranges of the files by member name, once the writer is
+        closed."""
+        frame_starts = [start for start, _ in self.writer.frames]
+        # A file ends where the next one starts, the last one with the archive
+        ends = [offset for _, offset, _ in self._members[1:]]
+        ends.append(self.writer.bytes_in)
+        members = {}
+        for (name, offset, size), end in zip(self._members, ends):
+            first = bisect_right(frame_starts, offset) - 1
+            last = bisect_left(frame_starts, end)
+            start_frame, start_offset = self.writer.frames[first]
+            if last < len(self.writer.frames):
+                end_offset = self.writer.frames[last][1]
+            else:
+                end_offset = self.writer.bytes_out
+            members[name] = {
+                "offset": start_offset,
+                "length": end_offset - start_offset,
+                "tar_offset": offset - start_frame,
+                "size": size,
+            }
+        return members
+
+    def build(
+        self, archive_name: str, file_ids: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Returns the index of the archive. `file_ids` maps member names to
+        Drive file IDs, restores look files up by ID."""
+        members = self.members()
+        return {
+            "version": INDEX_VERSION,
+            "archive": archive_name,
+            "algorithm": self.algorithm,
+            "members": members,
+            "files": {
+                file_id: name
+                for name, file_id in (file_ids or {}).items()
+                if name in members
+            },
+        }
+
+
+def read_member(
+    index: Dict[str, Any],
+    file_id: str,
+    read_range: Callable[[int, int], bytes],
+) -> bytes:
+    """Restores one file from a seekable archive. `read_range(offset,
+    length)` returns bytes of the archive, e.g. with an S3 ranged GET."""
+    member = index["members"][index["files"][file_id]]
+    data = decompress(
+        index["algorithm"], read_range(member["offset"], member["length"])
+    )
+    with tarfile.open(
+        fileobj=io.BytesIO(data[member["tar_offset"] :]), mode="r:"
+    ) as tar:
+        return tar.extractfile(tar.next()).read()
@@ -0,0 +1,89 @@
+import os
+import tarfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Bundle:
+    """An uncompressed tar file of small files, each recorded with the
+    offset of its data in the tar."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.created = time.monotonic()
+        self.files: List[Tuple[Dict[str, Any], int, int]] = []
+        self._tar = tarfile.open(path, "w")
+
+    @property
+    def size(self) -> int:
+        return self._tar.offset
+
+    def add(self, file: Dict[str, Any], path: str, arcname: str) -> None:
+        size = os.path.getsize(path)
+        self._tar.add(path, arcname=arcname)
+        # Data is padded to whole 512-byte blocks after its header
+        padded_size = -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        self.files.append((file, self._tar.offset - padded_size, size))
+
+    def close(self) -> None:
+        self._tar.close()
+
+
+class Bundler:
+    """Packs files of at most `max_file_size` bytes into bundles written to
+    `directory`, so that many small files take a single upload.
+
+    `add` returns the bundle once it holds `max_size` bytes or is
+    `max_age` seconds old (checked when files are added), and `flush`
+    returns the last one. The caller uploads them, then records where each
+    file went with `Bundler.locate`.
+    """
+
+    def __init__(
+        self, directory: str, max_file_size: int, max_size: int, max_age: float
+    ) -> None:
+        self.directory = directory
+        self.max_file_size = max_file_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self._bundle: Optional[Bundle] = None
+        self._lock = threading.Lock()
+
+    def accepts(self, path: str) -> bool:
+        return os.path.getsize(path) <= self.max_file_size
+
+    def add(self, file: Dict[str, Any], path: str, arcname: str) -> Optional[Bundle]:
+        with self._lock:
+            if self._bundle is None:
+                os.makedirs(self.directory, exist_ok=True)
+                # Bundles of a drive can be written by several processes
+                self._bundle = Bundle(
+                    os.path.join(self.directory, f"{uuid.uuid4().hex}.tar")
+                )
+            self._bundle.add(file, path, arcname)
+            if (
+                self._bundle.size >= self.max_size
+                or time.monotonic() - self._bundle.created >= self.max_age
+            ):
+                return self._take()
+            return None
+
+    def flush(self) -> Optional[Bundle]:
+        with self._lock:
+            if self._bundle is None:
+                return None
+            return self._take()
+
+    def _take(self) -> Bundle:
+        bundle, self._bundle = self._bundle, None
+        bundle.close()
+        return bundle
+
+    @staticmethod
+    def locate(bundle: Bundle, bundle_path: str) -> None:
+        """Records in every file of the uploaded `bundle` that its content is
+        `size` bytes at `offset` of the bundle stored at `bundle_path`."""
+        for file, offset, size in bundle.files:
+            file["bundle"] = {"path": bundle_path, "offset": offset, "size": size}
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import time
+from typing import Iterable, Optional, Set
+
+
+class ClaimRegistry:
+    """Cross-process registry of claimed keys, backed by marker files.
+
+    A key is claimed by atomically creating its marker file, so only one
+    process (or thread) on the host wins the claim. The winner either marks
+    the key as done or releases it, so that someone else can claim it again.
+    Markers hold the pid of their owner, so that claims of processes that
+    died count as released. Such a claim is taken over by exactly one
+    process, the one that creates the takeover marker of the dead owner.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _marker(self, key: str, suffix: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, f"{digest}.{suffix}")
+
+    def claim(self, key: str) -> bool:
+        marker = self._marker(key, "claim")
+        try:
+            fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            owner = self._owner(key)
+            if owner is None:
+                return self.claim(key)  # Released meanwhile
+            if self._is_alive(owner):
+                return False
+            return self._take_over(marker, owner)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+        finally:
+            os.close(fd)
+        return True
+
+    def _take_over(self, marker: str, owner: str) -> bool:
+        """Replaces the marker of the dead `owner` with one of this process.
+        Takeover markers are never removed, so processes that saw the same
+        dead owner late can't take the claim from the winner."""
+        try:
+            fd = os.open(
+                f"{marker}.{owner}.takeover", os.O_CREAT | os.O_EXCL | os.O_WRONLY
+            )
+        except FileExistsError:
+            return False
+        os.close(fd)
+        replacement = f"{marker}.{os.getpid()}"
+        with open(replacement, "w") as f:
+            f.write(str(os.getpid()))
+        os.replace(replacement, marker)
+        return True
+
+    def complete(self, key: str) -> None:
+        with open(self._marker(key, "done"), "w"):
+            pass
+
+    def release(self, key: str) -> None:
+        try:
+            os.remove(self._marker(key, "claim"))
+        except FileNotFoundError:
+            pass
+
+    def is_done(self, key: str) -> bool:
+        return os.path.exists(self._marker(key, "done"))
+
+    def is_claimed(self, key: str) -> bool:
+        owner = self._owner(key)
+        return owner is not None and self._is_alive(owner)
+
+    def _owner(self, key: str) -> Optional[str]:
+        try:
+            with open(self._marker(key, "claim")) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _is_alive(self, owner: str) -> bool:
+        if not owner:
+            # Just created, the owner is writing its pid
+            return True
+        try:
+            os.kill(int(owner), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def wait(self, key: str, timeout: float = 3600, interval: float = 1) -> bool:
+        """Waits until a claimed key is done (True) or released (False)."""
+        return key in self.wait_all([key], timeout, interval)
+
+    def wait_all(
+        self, keys: Iterable[str], timeout: float = 3600, interval: float = 1
+    ) -> Set[str]:
+        """Waits, up to `timeout` for all of them together, until every
+        claimed key is done, released or abandoned by a dead owner. Returns
+        the keys that are done."""
+        pending = set(keys)
+        done = set()
+        deadline = time.time() + timeout
+        while pending:
+            for key in list(pending):
+                if self.is_done(key):
+                    done.add(key)
+                    pending.discard(key)
+                elif not self.is_claimed(key):
+                    pending.discard(key)
+                    if self.is_done(key):
+                        done.add(key)
+            if not pending or time.time() >= deadline:
+                break
+            time.sleep(interval)
+        return done
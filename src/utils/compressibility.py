@@ -0,0 +1,90 @@
+import math
+import mimetypes
+import os
+from collections import Counter
+from typing import Optional, Union
+
+SAMPLE_SIZE = 16 * 1024  # 16KB
+# Bits per byte above which a sample is considered already compressed
+ENTROPY_THRESHOLD = 7.5
+# Files smaller than this are compressed in whatever mode the stream is in,
+# switching modes costs more than it saves
+MIN_ADAPTIVE_SIZE = 1024 * 1024  # 1MB
+
+COMPRESSED_MIME_PREFIXES = ("video/", "audio/")
+UNCOMPRESSED_MIME_TYPES = {
+    "audio/wav",
+    "audio/x-wav",
+    "audio/aiff",
+    "audio/x-aiff",
+    "audio/midi",
+}
+COMPRESSED_MIME_TYPES = {
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "image/heic",
+    "image/heif",
+    "image/avif",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/vnd.rar",
+    "application/zstd",
+    "application/java-archive",
+    "application/epub+zip",
+    "application/vnd.android.package-archive",
+}
+# Office Open XML and OpenDocument files are zip archives
+COMPRESSED_MIME_TYPE_PREFIXES = (
+    "application/vnd.openxmlformats-officedocument.",
+    "application/vnd.oasis.opendocument.",
+)
+
+
+def is_compressed_mime_type(mime_type: Optional[str]) -> bool:
+    if not mime_type or mime_type in UNCOMPRESSED_MIME_TYPES:
+        return False
+    return (
+        mime_type in COMPRESSED_MIME_TYPES
+        or mime_type.startswith(COMPRESSED_MIME_PREFIXES)
+        or mime_type.startswith(COMPRESSED_MIME_TYPE_PREFIXES)
+    )
+
+
+def byte_entropy(data: bytes) -> float:
+    """Shannon entropy of `data` in bits per byte (0 to 8)."""
+    total = len(data)
+    return -sum(
+        count / total * math.log2(count / total) for count in Counter(data).values()
+    )
+
+
+def sample_entropy(path: Union[str, os.PathLike], size: int) -> float:
+    """Entropy of `SAMPLE_SIZE` bytes from the middle of the file, past the
+    headers that even compressed formats often start with."""
+    with open(path, "rb") as f:
+        f.seek(max(0, size // 2 - SAMPLE_SIZE // 2))
+        return byte_entropy(f.read(SAMPLE_SIZE))
+
+
+def should_store(
+    path: Union[str, os.PathLike], mime_type: Optional[str] = None
+) -> Optional[bool]:
+    """Whether the file at `path` is already compressed and should be stored
+    as is. Checks the Drive `mime_type`, then the one of the file extension
+    (exported Google files), then the entropy of a sample of the content.
+    Returns None for files too small to be worth deciding."""
+    size = os.path.getsize(path)
+    if size < MIN_ADAPTIVE_SIZE:
+        return None
+    if is_compressed_mime_type(mime_type):
+        return True
+    if is_compressed_mime_type(mimetypes.guess_type(os.fspath(path))[0]):
+        return True
+    return sample_entropy(path, size) >= ENTROPY_THRESHOLD
@@ -0,0 +1,305 @@
+import gzip
+import io
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Deque, List, Optional, Tuple
+
+import lz4.frame
+import zstandard
+
+BLOCK_SIZE = 4 * 1024 * 1024  # 4MB
+DEFAULT_LEVELS = {"zstd": 3, "gzip": 6, "lz4": 0}
+# Levels used for data that is stored rather than compressed: deflate level 0
+# copies the input and the fastest zstd level skips nearly all match finding.
+# lz4 has no stored mode, it is fast enough on any input.
+STORED_LEVELS = {"zstd": -50, "gzip": 0}
+
+# Called with the number of uncompressed bytes read and compressed bytes
+# written so far
+ProgressCallback = Callable[[int, int], None]
+
+
+class CompressedWriter:
+    """Write-only file object compressing everything written to it into
+    `output`. Tracks the bytes read and written and reports them to the
+    optional `progress` callback.
+
+    The output is a sequence of frames that can each be decompressed on
+    their own. `frames` lists the (uncompressed, compressed) offsets where
+    the frames ended by `end_frame` start."""
+
+    def __init__(
+        self, output: BinaryIO, progress: Optional[ProgressCallback] = None
+    ) -> None:
+        self.output = output
+        self.progress = progress
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.stored = False
+        self.frames: List[Tuple[int, int]] = [(0, 0)]
+        # Uncompressed offset of the current frame
+        self.frame_start = 0
+
+    @property
+    def supports_stored(self) -> bool:
+        return False
+
+    def set_stored(self, stored: bool) -> None:
+        """Switches between compressing and storing whatever is written
+        next, e.g. for already compressed files."""
+        if self.supports_stored:
+            self.stored = stored
+
+    def end_frame(self) -> None:
+        """Ends the current frame, what is written next starts a new one."""
+        raise NotImplementedError
+
+    def __enter__(self) -> "CompressedWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+
+    def tell(self) -> int:
+        return self.bytes_in
+
+    def _write_output(self, data: bytes) -> None:
+        if data:
+            self.output.write(data)
+            self.bytes_out += len(data)
+        if self.progress is not None:
+            self.progress(self.bytes_in, self.bytes_out)
+
+    def write(self, data: bytes) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class ZstdWriter(CompressedWriter):
+    """zstd with the library's own worker threads."""
+
+    def __init__(
+        self,
+        output: BinaryIO,
+        level: int,
+        threads: int,
+        progress: Optional[ProgressCallback] = None,
+    ) -> None:
+        super().__init__(output, progress)
+        self._compressors = {
+            stored: self._new_compressor(
+                STORED_LEVELS["zstd"] if stored else level, threads
+            )
+            for stored in (False, True)
+        }
+        self._chunker = self._new_chunker()
+
+    def _new_chunker(self) -> Any:
+        return self._compressors[self.stored].chunker(chunk_size=BLOCK_SIZE)
+
+    @staticmethod
+    def _new_compressor(level: int, threads: int) -> zstandard.ZstdCompressor:
+        params = zstandard.ZstdCompressionParameters.from_level(
+            level, threads=threads if threads > 1 else 0
+        )
+        return zstandard.ZstdCompressor(compression_params=params)
+
+    @property
+    def supports_stored(self) -> bool:
+        return True
+
+    def set_stored(self, stored: bool) -> None:
+        # Every mode switch ends the current frame, zstd reads the
+        # concatenated frames as one stream
+        if stored != self.stored:
+            self.end_frame()
+            super().set_stored(stored)
+            self._chunker = self._new_chunker()
+
+    def end_frame(self) -> None:
+        if self.bytes_in == self.frame_start:
+            return
+        for chunk in self._chunker.finish():
+            self._write_output(chunk)
+        self._chunker = self._new_chunker()
+        self.frame_start = self.bytes_in
+        self.frames.append((self.bytes_in, self.bytes_out))
+
+    def write(self, data: bytes) -> int:
+        self.bytes_in += len(data)
+        for chunk in self._chunker.compress(data):
+            self._write_output(chunk)
+        return len(data)
+
+    def close(self) -> None:
+        for chunk in self._chunker.finish():
+            self._write_output(chunk)
+
+
+class BlockParallelWriter(CompressedWriter):
+    """Splits the input into blocks compressed in parallel as independent
+    gzip members or lz4 frames. Concatenated members/frames are valid
+    streams for gzip, pigz and lz4, and the compressors release the GIL, so
+    this scales with threads like pigz does. With `store_block`, stored
+    data goes into blocks of its own written by that function.
+
+    Every block is a frame, but only the ones started by `end_frame` are
+    listed in `frames`, when they are written out."""
+
+    def __init__(
+        self,
+        output: BinaryIO,
+        compress_block: Callable[[bytes], bytes],
+        threads: int,
+        progress: Optional[ProgressCallback] = None,
+        store_block: Optional[Callable[[bytes], bytes]] = None,
+    ) -> None:
+        super().__init__(output, progress)
+        self._compress_block = compress_block
+        self._store_block = store_block
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._max_pending = threads * 2
+        # Blocks being compressed, with their uncompressed offset if they
+        # start a frame
+        self._pending: Deque[Tuple[Future, Optional[int]]] = deque()
+        self._chunks: List[bytes] = []
+        self._buffered = 0
+        self._submitted = 0
+        self._starts_frame = False
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes) -> int:
+        with self._lock:
+            self.bytes_in += len(data)
+            self._chunks.append(bytes(data))
+            self._buffered += len(data)
+            if self._buffered >= BLOCK_SIZE:
+                buffered = b"".join(self._chunks)
+                end = len(buffered) - len(buffered) % BLOCK_SIZE
+                for start in range(0, end, BLOCK_SIZE):
+                    self._submit(buffered[start : start + BLOCK_SIZE])
+                self._chunks = [buffered[end:]]
+                self._buffered = len(buffered) - end
+        return len(data)
+
+    @property
+    def supports_stored(self) -> bool:
+        return self._store_block is not None
+
+    def set_stored(self, stored: bool) -> None:
+        with self._lock:
+            # Blocks hold data of a single mode, the partial one is cut short
+            if stored != self.stored:
+                self._submit_buffered()
+            super().set_stored(stored)
+
+    def end_frame(self) -> None:
+        with self._lock:
+            if self.bytes_in == self.frame_start:
+                return
+            self._submit_buffered()
+            self.frame_start = self.bytes_in
+            self._starts_frame = True
+
+    def _submit_buffered(self) -> None:
+        if self._buffered:
+            self._submit(b"".join(self._chunks))
+            self._chunks = []
+            self._buffered = 0
+
+    def _submit(self, block: bytes) -> None:
+        # Blocks are written in order, waiting for the oldest one bounds
+        # the memory held by queued blocks
+        while len(self._pending) >= self._max_pending:
+            self._write_block(*self._pending.popleft())
+        write_block = self._store_block if self.stored else self._compress_block
+        frame_start = self._submitted if self._starts_frame else None
+        self._pending.append((self._executor.submit(write_block, block), frame_start))
+        self._submitted += len(block)
+        self._starts_frame = False
+
+    def _write_block(self, future: Future, frame_start: Optional[int]) -> None:
+        if frame_start is not None:
+            self.frames.append((frame_start, self.bytes_out))
+        self._write_output(future.result())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._buffered or self.bytes_in == 0:
+                self._submit(b"".join(self._chunks))
+                self._chunks = []
+                self._buffered = 0
+            while self._pending:
+                self._write_block(*self._pending.popleft())
+            self._executor.shutdown()
+
+
+def open_compressed_writer(
+    algorithm: str,
+    output: BinaryIO,
+    level: Optional[int] = None,
+    threads: int = 1,
+    progress: Optional[ProgressCallback] = None,
+) -> CompressedWriter:
+    """Returns a file object compressing into `output` with `algorithm`
+    ("zstd", "gzip" or "lz4"). Closing it flushes the compressed stream but
+    leaves `output` open."""
+    if level is None:
+        level = DEFAULT_LEVELS.get(algorithm)
+    match algorithm:
+        case "zstd":
+            return ZstdWriter(output, level, threads, progress)
+        case "gzip":
+            return BlockParallelWriter(
+                output,
+                lambda block: gzip.compress(block, compresslevel=level, mtime=0),
+                threads,
+                progress,
+                store_block=lambda block: gzip.compress(
+                    block, compresslevel=STORED_LEVELS["gzip"], mtime=0
+                ),
+            )
+        case "lz4":
+            return BlockParallelWriter(
+                output,
+                lambda block: lz4.frame.compress(
+                    block,
+                    compression_level=level,
+                    block_size=lz4.frame.BLOCKSIZE_MAX4MB,
+                ),
+                threads,
+                progress,
+            )
+        case _:
+            raise NotImplementedError(
+                f"Compression algorithm {algorithm} not implemented"
+            )
+
+
+def decompress(algorithm: str, data: bytes) -> bytes:
+    """Decompresses all the frames in `data`, e.g. a range of an archive
+    between two frame boundaries."""
+    match algorithm:
+        case "zstd":
+            reader = zstandard.ZstdDecompressor().stream_reader(
+                io.BytesIO(data), read_across_frames=True
+            )
+            return reader.read()
+        case "gzip":
+            return gzip.decompress(data)
+        case "lz4":
+            # lz4.frame.decompress stops after the first frame
+            chunks = []
+            while data:
+                decompressor = lz4.frame.LZ4FrameDecompressor()
+                chunks.append(decompressor.decompress(data))
+                data = decompressor.unused_data
+            return b"".join(chunks)
+        case _:
+            raise NotImplementedError(
+                f"Compression algorithm {algorithm} not implemented"
+            )
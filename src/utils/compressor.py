@@ -1,18 +1,107 @@
+import contextlib
+import json
 import os
 import shutil
-from typing import Tuple, Union
+import subprocess
+import tarfile
+import threading
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple, Union
+
+from src.utils.archive_index import INDEX_SUFFIX, ArchiveIndexer
+from src.utils.compressibility import should_store
+from src.utils.compression_engine import (
+    CompressedWriter,
+    ProgressCallback,
+    open_compressed_writer,
+)
+from src.utils.volumes import MANIFEST_SUFFIX, VolumeWriter, volume_name
+
+ARCHIVE_EXTENSIONS = {"lz4": "tar.lz4", "pigz": "tar.gz", "pzstd": "tar.zst"}
+# Formats written by the native engine for each algorithm, readable by the
+# same tools as the shell engine
+NATIVE_ALGORITHMS = {"lz4": "lz4", "pigz": "gzip", "pzstd": "zstd"}
+PIPE_CHUNK_SIZE = 1024 * 1024  # 1MB
+# PAX header of every file member written by the adaptive mode, "store" or
+# "compress". Tools that don't know it ignore it.
+COMPRESSION_PAX_HEADER = "GDRIVE_BACKUP.compression"
+
+
+def open_tar_stream(fileobj: BinaryIO) -> tarfile.TarFile:
+    # The default 10KB blocks make tar the bottleneck of fast compressors.
+    # Writers that know their position skip the stream buffer entirely.
+    if isinstance(fileobj, CompressedWriter):
+        return tarfile.TarFile(fileobj=fileobj, mode="w", copybufsize=PIPE_CHUNK_SIZE)
+    return tarfile.open(
+        fileobj=fileobj,
+        mode="w|",
+        bufsize=PIPE_CHUNK_SIZE,
+        copybufsize=PIPE_CHUNK_SIZE,
+    )
+
+
+def choose_compression(
+    writer: CompressedWriter,
+    info: tarfile.TarInfo,
+    path: Union[str, os.PathLike],
+    mime_type: Optional[str] = None,
+) -> tarfile.TarInfo:
+    """Tar filter storing already compressed files and compressing the
+    others, called right before the member at `path` is written. The mode
+    used is recorded in the member's PAX headers."""
+    if info.isfile() and writer.supports_stored:
+        stored = should_store(path, mime_type)
+        if stored is not None:
+            writer.set_stored(stored)
+        info.pax_headers = {
+            **info.pax_headers,
+            COMPRESSION_PAX_HEADER: "store" if writer.stored else "compress",
+        }
+    return info
 
 
 class Compressor:
-    def __init__(self, algorithm: str, max_processes: int = 1) -> None:
+    def __init__(
+        self,
+        algorithm: str,
+        max_processes: int = 1,
+        engine: str = "shell",
+        level: Optional[int] = None,
+        progress: Optional[ProgressCallback] = None,
+        adaptive: bool = False,
+        seekable: bool = False,
+        volume_size: int = 0,
+    ) -> None:
+        if adaptive and engine != "native":
+            raise ValueError("Adaptive compression requires the native engine")
+        if seekable and engine != "native":
+            raise ValueError("Seekable archives require the native engine")
+        if volume_size and engine != "native":
+            raise ValueError("Archive volumes require the native engine")
         self.algorithm = algorithm
         self.max_processes = max_processes
+        self.engine = engine
+        self.level = level
+        self.progress = progress
+        self.adaptive = adaptive
+        self.seekable = seekable
+        self.volume_size = volume_size
 
     def compress_folder(
         self,
         path: Union[str, os.PathLike],
         delete_original: bool = False,
+        file_ids: Optional[Dict[str, str]] = None,
+        on_volume: Optional[Callable[[str], None]] = None,
     ) -> Tuple[str, int]:
+        """Compresses the folder next to it and returns the archive's path
+        and size. Seekable archives also get an index at the archive path
+        plus `INDEX_SUFFIX`, `file_ids` maps member names to Drive file IDs
+        in it.
+
+        With a `volume_size`, the archive is split into volumes at the
+        archive path plus `.0000`, `.0001`... and the returned path is the
+        one of their manifest. `on_volume` gets the path of every volume as
+        soon as it is complete, e.g. to upload it."""
         if not os.path.isdir(path):
             raise ValueError(f"{path} is not a directory")
 
@@ -20,33 +109,285 @@ class Compressor:
         file_name = path_parts[-1]
         directory = "/".join(path_parts[:-1])
 
+        if self.algorithm not in ARCHIVE_EXTENSIONS:
+            raise NotImplementedError(
+                f"Compression algorithm {self.algorithm} not implemented"
+            )
+        tar_path = f"{directory}/{file_name}.{ARCHIVE_EXTENSIONS[self.algorithm]}"
+
+        if self.engine == "native":
+            tar_size = self._compress_folder_native(
+                path, directory, file_name, tar_path, file_ids, on_volume
+            )
+        else:
+            self._compress_folder_shell(directory, file_name, tar_path)
+            tar_size = os.path.getsize(tar_path)
+        if self.volume_size:
+            tar_path = f"{tar_path}{MANIFEST_SUFFIX}"
+
+        if delete_original:
+            shutil.rmtree(path)
+
+        return tar_path, tar_size
+
+    def _compress_folder_native(
+        self,
+        path: Union[str, os.PathLike],
+        directory: str,
+        file_name: str,
+        tar_path: str,
+        file_ids: Optional[Dict[str, str]] = None,
+        on_volume: Optional[Callable[[str], None]] = None,
+    ) -> int:
+        index_path = f"{tar_path}{INDEX_SUFFIX}"
+        manifest_path = f"{tar_path}{MANIFEST_SUFFIX}"
+        leftovers = [tar_path, index_path, manifest_path]
+        if self.volume_size:
+
+            def volume_closed(number: int) -> None:
+                if on_volume is not None:
+                    on_volume(volume_name(tar_path, number))
+
+            output = VolumeWriter(
+                lambda number: open(volume_name(tar_path, number), "wb"),
+                self.volume_size,
+                volume_closed,
+            )
+        else:
+            output = open(tar_path, "wb")
+        try:
+            with output:
+                with self.open_writer(output) as writer:
+                    indexer = self.open_indexer(writer)
+                    with open_tar_stream(writer) as tar:
+                        tar.add(
+                            path,
+                            arcname=file_name,
+                            filter=self.member_filter(
+                                writer,
+                                lambda info: os.path.join(directory, info.name),
+                                indexer=indexer,
+                            ),
+                        )
+            if indexer is not None:
+                with open(index_path, "w") as f:
+                    json.dump(indexer.build(os.path.basename(tar_path), file_ids), f)
+            if isinstance(output, VolumeWriter):
+                with open(manifest_path, "w") as f:
+                    json.dump(output.manifest(os.path.basename(tar_path)), f)
+            return writer.bytes_out
+        except Exception:
+            if isinstance(output, VolumeWriter):
+                leftovers += [
+                    volume_name(tar_path, number)
+                    for number in range(len(output.volume_sizes))
+                ]
+            for leftover in leftovers:
+                # Uploaded volumes may be removed concurrently
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(leftover)
+            raise
+
+    def _compress_folder_shell(
+        self, directory: str, file_name: str, tar_path: str
+    ) -> None:
         match self.algorithm:
             case "lz4":
-                tar_path = f"{directory}/{file_name}.tar.lz4"
                 exit_code = os.system(
                     f"tar c - -C {directory} {file_name} | lz4 - {tar_path}"
                 )
             case "pigz":
-                tar_path = f"{directory}/{file_name}.tar.gz"
                 exit_code = os.system(
                     f"tar cf - -C {directory} {file_name} | pigz -p {self.max_processes} > {tar_path}"
                 )
             case "pzstd":
-                tar_path = f"{directory}/{file_name}.tar.zst"
                 exit_code = os.system(
                     f"tar cf - -C {directory} {file_name} | pzstd -{self.max_processes} > {tar_path}"
                 )
-            case _:
-                raise NotImplementedError(
-                    f"Compression algorithm {self.algorithm} not implemented"
+
+        if exit_code != 0:
+            if os.path.exists(tar_path):
+                os.remove(tar_path)
+            raise RuntimeError(f"Compression failed with exit code {exit_code}")
+
+    def member_filter(
+        self,
+        writer: CompressedWriter,
+        source_path: Callable[[tarfile.TarInfo], str],
+        mime_type: Optional[str] = None,
+        indexer: Optional[ArchiveIndexer] = None,
+    ) -> Optional[Callable[[tarfile.TarInfo], tarfile.TarInfo]]:
+        """Tar filter of the adaptive mode and seekable archives, called
+        right before every member is written. `source_path` maps members
+        back to the files they are read from."""
+        if not self.adaptive and indexer is None:
+            return None
+
+        def before_member(info: tarfile.TarInfo) -> tarfile.TarInfo:
+            if self.adaptive:
+                choose_compression(writer, info, source_path(info), mime_type)
+            if indexer is not None:
+                indexer.start_member(info)
+            return info
+
+        return before_member
+
+    def open_indexer(self, writer: CompressedWriter) -> Optional[ArchiveIndexer]:
+        if not self.seekable:
+            return None
+        return ArchiveIndexer(writer, NATIVE_ALGORITHMS[self.algorithm])
+
+    def open_writer(self, output: BinaryIO) -> CompressedWriter:
+        """Returns a file object compressing into `output` in-process."""
+        return open_compressed_writer(
+            NATIVE_ALGORITHMS[self.algorithm],
+            output,
+            level=self.level,
+            threads=self.max_processes,
+            progress=self.progress,
+        )
+
+
+class StreamingArchive:
+    """Tar archive that is compressed and written out while files are still
+    being added to it.
+
+    Files are appended to a tar stream compressed by `compressor`, in-process
+    with the native engine or piped through the CLI with the shell one (a
+    background thread then copies its output). The compressed stream goes to
+    the file object returned by `open_output` (e.g. an S3 multipart upload).
+    Nothing is started until the first file is added, so an empty archive
+    writes nothing.
+    """
+
+    def __init__(
+        self, compressor: Compressor, open_output: Callable[[], BinaryIO]
+    ) -> None:
+        if compressor.algorithm not in ARCHIVE_EXTENSIONS:
+            raise NotImplementedError(
+                f"Compression algorithm {compressor.algorithm} not implemented"
+            )
+        self.compressor = compressor
+        self.open_output = open_output
+        self.compressed_size = 0
+        self._started = False
+        self._writer: Optional[CompressedWriter] = None
+        self._indexer: Optional[ArchiveIndexer] = None
+        self._process: Optional[subprocess.Popen] = None
+        self._tar: Optional[tarfile.TarFile] = None
+        self._output: Optional[BinaryIO] = None
+        self._pump: Optional[threading.Thread] = None
+        self._pump_error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+
+    def _command(self) -> list:
+        max_processes = str(self.compressor.max_processes)
+        match self.compressor.algorithm:
+            case "lz4":
+                return ["lz4", "-c"]
+            case "pigz":
+                return ["pigz", "-c", "-p", max_processes]
+            case "pzstd":
+                return ["pzstd", "-c", "-p", max_processes]
+
+    def _start(self) -> None:
+        self._started = True
+        self._output = self.open_output()
+        if self.compressor.engine == "native":
+            self._writer = self.compressor.open_writer(self._output)
+            self._indexer = self.compressor.open_indexer(self._writer)
+            self._tar = open_tar_stream(self._writer)
+            return
+        self._process = subprocess.Popen(
+            self._command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self._pump = threading.Thread(target=self._pump_output, daemon=True)
+        self._pump.start()
+        self._tar = open_tar_stream(self._process.stdin)
+
+    def _pump_output(self) -> None:
+        try:
+            for chunk in iter(lambda: self._process.stdout.read(PIPE_CHUNK_SIZE), b""):
+                self._output.write(chunk)
+                self.compressed_size += len(chunk)
+        except BaseException as e:
+            self._pump_error = e
+            # Unblock the tar writer, the error is raised by add() or close()
+            self._process.kill()
+
+    def add(
+        self,
+        path: Union[str, os.PathLike],
+        arcname: str,
+        mime_type: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            if not self._started:
+                self._start()
+            try:
+                self._tar.add(
+                    path,
+                    arcname=arcname,
+                    filter=self.compressor.member_filter(
+                        self._writer, lambda info: path, mime_type, self._indexer
+                    ),
+                )
+            except BrokenPipeError:
+                raise RuntimeError(
+                    f"Compression stopped while adding {arcname}: {self._pump_error}"
                 )
 
-        tar_size = os.path.getsize(tar_path)
+    def close(self) -> int:
+        """Finishes the archive and returns its compressed size."""
+        with self._lock:
+            if not self._started:
+                return 0
+            self._tar.close()
+            if self._writer is not None:
+                self._writer.close()
+                self.compressed_size = self._writer.bytes_out
+            else:
+                self._close_process()
+            self._output.close()
+            return self.compressed_size
 
+    def index(
+        self, archive_name: str, file_ids: Optional[Dict[str, str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Index of a closed seekable archive, None for other archives."""
+        if self._indexer is None:
+            return None
+        return self._indexer.build(archive_name, file_ids)
+
+    def manifest(self, archive_name: str) -> Optional[Dict[str, Any]]:
+        """Volume manifest of a closed archive written to a `VolumeWriter`,
+        None for other outputs."""
+        if not isinstance(self._output, VolumeWriter):
+            return None
+        return self._output.manifest(archive_name)
+
+    def _close_process(self) -> None:
+        self._process.stdin.close()
+        exit_code = self._process.wait()
+        self._pump.join()
+        if self._pump_error is not None:
+            raise RuntimeError(f"Writing archive failed: {self._pump_error}")
         if exit_code != 0:
             raise RuntimeError(f"Compression failed with exit code {exit_code}")
 
-        if delete_original:
-            shutil.rmtree(path)
-
-        return tar_path, tar_size
+    def abort(self) -> None:
+        with self._lock:
+            if not self._started:
+                return
+            if self._process is not None:
+                self._process.kill()
+                self._process.wait()
+                self._pump.join()
+            try:
+                self._tar.close()
+            except Exception:
+                pass  # The archive is discarded anyway
+            if hasattr(self._output, "abort"):
+                self._output.abort()
+            else:
+                self._output.close()
@@ -0,0 +1,42 @@
+import time
+from typing import Any
+
+NEAR_LIMIT_RATIO = 0.9
+
+
+class DiskBudget:
+    """Bytes staged on the local disk by all drive processes.
+
+    Downloads reserve their size before writing and release it once the
+    files are uploaded and deleted. A reservation waits while it doesn't fit,
+    except when nothing else is staged, so files (or drives) larger than the
+    whole budget still get processed, one at a time.
+    """
+
+    def __init__(self, manager: Any, limit: int) -> None:
+        self.limit = limit
+        self._state = manager.dict({"used": 0})
+        self._lock = manager.Lock()
+
+    @property
+    def used(self) -> int:
+        return self._state["used"]
+
+    def near_limit(self) -> bool:
+        return self.used >= self.limit * NEAR_LIMIT_RATIO
+
+    def try_reserve(self, size: int) -> bool:
+        with self._lock:
+            used = self._state["used"]
+            if used > 0 and used + size > self.limit:
+                return False
+            self._state["used"] = used + size
+            return True
+
+    def reserve(self, size: int, interval: float = 1) -> None:
+        while not self.try_reserve(size):
+            time.sleep(interval)
+
+    def release(self, size: int) -> None:
+        with self._lock:
+            self._state["used"] = max(0, self._state["used"] - size)
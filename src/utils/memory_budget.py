@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator, List
+
+DEFAULT_CHUNK_SIZE = 100 * 1024 * 1024  # 100MB, same as MediaIoBaseDownload
+MIN_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class MemoryBudget:
+    """Process-wide budget for the buffers of in-flight downloads.
+
+    Every download reserves its chunk size for as long as it runs, and
+    threads wait when the budget is used up. The chunk size is picked so that
+    `max_concurrency` downloads fit at once. A limit of 0 disables the budget.
+    """
+
+    def __init__(self, limit: int = 0, max_concurrency: int = 1) -> None:
+        self._condition = threading.Condition()
+        self._wakers: List[Callable[[], None]] = []
+        self.configure(limit, max_concurrency)
+
+    def configure(self, limit: int, max_concurrency: int) -> None:
+        with self._condition:
+            self.limit = limit
+            self.used = 0
+            if limit > 0:
+                self.chunk_size = min(
+                    DEFAULT_CHUNK_SIZE,
+                    max(MIN_CHUNK_SIZE, limit // max(1, max_concurrency)),
+                )
+            else:
+                self.chunk_size = DEFAULT_CHUNK_SIZE
+
+    @contextmanager
+    def reserve(self, size: int) -> Iterator[None]:
+        if self.limit <= 0:
+            yield
+            return
+        # A reservation larger than the budget waits until it has it all
+        size = min(size, self.limit)
+        with self._condition:
+            while self.used + size > self.limit:
+                self._condition.wait()
+            self.used += size
+        try:
+            yield
+        finally:
+            self._release(size)
+
+    @asynccontextmanager
+    async def reserve_async(self, size: int) -> AsyncIterator[None]:
+        """Same as `reserve`, waiting without blocking the event loop."""
+        if self.limit <= 0:
+            yield
+            return
+        size = min(size, self.limit)
+        if not self._try_take(size):
+            loop = asyncio.get_running_loop()
+            freed = asyncio.Event()
+
+            def waker() -> None:
+                loop.call_soon_threadsafe(freed.set)
+
+            with self._condition:
+                self._wakers.append(waker)
+            try:
+                while not self._try_take(size):
+                    await freed.wait()
+                    freed.clear()
+            finally:
+                with self._condition:
+                    self._wakers.remove(waker)
+        try:
+            yield
+        finally:
+            self._release(size)
+
+    def _try_take(self, size: int) -> bool:
+        with self._condition:
+            if self.used + size > self.limit:
+                return False
+            self.used += size
+            return True
+
+    def _release(self, size: int) -> None:
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+            for waker in self._wakers:
+                waker()
+
+
+memory_budget = MemoryBudget()
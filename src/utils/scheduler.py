@@ -0,0 +1,65 @@
+import queue
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+class WorkQueues:
+    """Per-drive queues of work items shared by all drive processes.
+
+    Every process takes work from its own (home) drives first and steals from
+    the drive with the most pending items once those are empty. A drive is
+    finished once its listing is done and all of its items are processed;
+    exactly one caller is told so, and it is responsible for finalizing it.
+    """
+
+    def __init__(self, manager: Any, drive_ids: Iterable[str]) -> None:
+        drive_ids = list(drive_ids)
+        self._queues = {drive_id: manager.Queue() for drive_id in drive_ids}
+        self._pending = manager.dict({drive_id: 0 for drive_id in drive_ids})
+        self._unfinished = manager.dict({drive_id: 0 for drive_id in drive_ids})
+        self._listed = manager.dict({drive_id: False for drive_id in drive_ids})
+        self._lock = manager.Lock()
+
+    def put(self, drive_id: str, items: List[Any]) -> None:
+        with self._lock:
+            for item in items:
+                self._queues[drive_id].put(item)
+            self._pending[drive_id] += len(items)
+            self._unfinished[drive_id] += len(items)
+
+    def finish_listing(self, drive_id: str) -> bool:
+        """Marks the drive as fully listed. Returns True if the drive has no
+        unfinished items, i.e. the caller must finalize it."""
+        with self._lock:
+            self._listed[drive_id] = True
+            return self._unfinished[drive_id] == 0
+
+    def get(self, home_drive_ids: Iterable[str]) -> Optional[Tuple[str, Any]]:
+        with self._lock:
+            pending = dict(self._pending)
+            drive_id = next((d for d in home_drive_ids if pending.get(d, 0) > 0), None)
+            if drive_id is None:
+                drive_id = max(pending, key=pending.get, default=None)
+                if drive_id is None or pending[drive_id] == 0:
+                    return None
+            try:
+                item = self._queues[drive_id].get_nowait()
+            except queue.Empty:
+                return None
+            self._pending[drive_id] -= 1
+            return drive_id, item
+
+    def has_pending(self, drive_id: str) -> bool:
+        """Whether items of the drive are still waiting to be taken."""
+        with self._lock:
+            return not self._listed[drive_id] or self._pending[drive_id] > 0
+
+    def task_done(self, drive_id: str) -> bool:
+        """Marks one item of the drive as processed. Returns True if it was
+        the last one of a fully listed drive, i.e. the caller must finalize it."""
+        with self._lock:
+            self._unfinished[drive_id] -= 1
+            return self._listed[drive_id] and self._unfinished[drive_id] == 0
+
+    def all_done(self) -> bool:
+        with self._lock:
+            return all(self._listed.values()) and not any(self._unfinished.values())
@@ -32,6 +32,36 @@ class Settings(BaseSettings):
     COMPRESS_DRIVES: bool = Field(False, env="COMPRESS_DRIVES")
     COMPRESSION_ALGORITHM: str = Field("pigz", env="COMPRESSION_ALGORITHM")
     COMPRESSION_PROCESSES: int = Field(cpu_count(), env="COMPRESSION_PROCESSES")
+    COMPRESSION_ENGINE: str = Field("shell", env="COMPRESSION_ENGINE")
+    COMPRESSION_LEVEL: int | None = Field(None, env="COMPRESSION_LEVEL")
+    ADAPTIVE_COMPRESSION: bool = Field(False, env="ADAPTIVE_COMPRESSION")
+    SEEKABLE_ARCHIVES: bool = Field(False, env="SEEKABLE_ARCHIVES")
+    ARCHIVE_VOLUME_SIZE_MB: int = Field(0, env="ARCHIVE_VOLUME_SIZE_MB")
+    ARCHIVE_VOLUME_UPLOADS: int = Field(4, env="ARCHIVE_VOLUME_UPLOADS")
+    BUNDLE_FILE_SIZE_KB: int = Field(0, env="BUNDLE_FILE_SIZE_KB")
+    BUNDLE_SIZE_MB: int = Field(64, env="BUNDLE_SIZE_MB")
+    BUNDLE_MAX_AGE_SECONDS: int = Field(60, env="BUNDLE_MAX_AGE_SECONDS")
+    STREAM_DOWNLOADS: bool = Field(False, env="STREAM_DOWNLOADS")
+    DOWNLOAD_ENGINE: str = Field("threads", env="DOWNLOAD_ENGINE")
+    ASYNC_DOWNLOAD_CONCURRENCY: int = Field(200, env="ASYNC_DOWNLOAD_CONCURRENCY")
+    ADAPTIVE_CONCURRENCY: bool = Field(False, env="ADAPTIVE_CONCURRENCY")
+    LISTING_REQUESTS_PER_MINUTE: int = Field(0, env="LISTING_REQUESTS_PER_MINUTE")
+    PERMISSION_REQUESTS_PER_MINUTE: int = Field(0, env="PERMISSION_REQUESTS_PER_MINUTE")
+    EXPORT_REQUESTS_PER_MINUTE: int = Field(0, env="EXPORT_REQUESTS_PER_MINUTE")
+    MEDIA_REQUESTS_PER_MINUTE: int = Field(0, env="MEDIA_REQUESTS_PER_MINUTE")
+    INCREMENTAL_BACKUPS: bool = Field(False, env="INCREMENTAL_BACKUPS")
+    REUSE_UNCHANGED_FILES: str = Field("none", env="REUSE_UNCHANGED_FILES")
+    CONTENT_ADDRESSED_STORAGE: bool = Field(False, env="CONTENT_ADDRESSED_STORAGE")
+    BATCH_SHORTCUT_LOOKUPS: bool = Field(False, env="BATCH_SHORTCUT_LOOKUPS")
+    WORK_STEALING_SCHEDULER: bool = Field(False, env="WORK_STEALING_SCHEDULER")
+    PIPELINED_COMPRESSION: bool = Field(False, env="PIPELINED_COMPRESSION")
+    RANGED_DOWNLOAD_THRESHOLD_MB: int = Field(0, env="RANGED_DOWNLOAD_THRESHOLD_MB")
+    RANGED_DOWNLOAD_THREADS: int = Field(8, env="RANGED_DOWNLOAD_THREADS")
+    ZERO_STAGING_UPLOADS: bool = Field(False, env="ZERO_STAGING_UPLOADS")
+    UPLOAD_PART_SIZE_MB: int = Field(16, env="UPLOAD_PART_SIZE_MB")
+    UPLOAD_BUFFERS: int = Field(40, env="UPLOAD_BUFFERS")
+    S3_UPLOAD_CONCURRENCY: int = Field(16, env="S3_UPLOAD_CONCURRENCY")
+    MEMORY_BUDGET_MB: int = Field(0, env="MEMORY_BUDGET_MB")
     DRIVE_WHITELIST: List[str] = Field([], env="DRIVE_WHITELIST")
     DRIVE_BLACKLIST: List[str] = Field([], env="DRIVE_BLACKLIST")
     SERVICE_ACCOUNT_FILE: str = Field(
@@ -46,15 +76,41 @@ class Settings(BaseSettings):
     S3_SECRET_KEY: str | None = Field(None, env="S3_SECRET_KEY")
     AUTO_CLEANUP: bool = Field(True, env="AUTO_CLEANUP")
     INCLUDE_SHARED_WITH_ME: bool = Field(True, env="INCLUDE_SHARED_WITH_ME")
+    DISK_BUDGET_MB: int = Field(0, env="DISK_BUDGET_MB")
 
     @field_validator(
-        "MAX_DOWNLOAD_THREADS", "MAX_DRIVE_PROCESSES", "COMPRESSION_PROCESSES"
+        "MAX_DOWNLOAD_THREADS",
+        "MAX_DRIVE_PROCESSES",
+        "COMPRESSION_PROCESSES",
+        "RANGED_DOWNLOAD_THREADS",
+        "UPLOAD_BUFFERS",
+        "S3_UPLOAD_CONCURRENCY",
+        "ASYNC_DOWNLOAD_CONCURRENCY",
+        "ARCHIVE_VOLUME_UPLOADS",
+        "BUNDLE_SIZE_MB",
+        "BUNDLE_MAX_AGE_SECONDS",
     )
     def validate_positive_values(cls, v, info):
         if v <= 0:
             raise ValueError(f"{info.field_name} must be positive")
         return v
 
+    @field_validator(
+        "RANGED_DOWNLOAD_THRESHOLD_MB",
+        "MEMORY_BUDGET_MB",
+        "DISK_BUDGET_MB",
+        "ARCHIVE_VOLUME_SIZE_MB",
+        "BUNDLE_FILE_SIZE_KB",
+        "LISTING_REQUESTS_PER_MINUTE",
+        "PERMISSION_REQUESTS_PER_MINUTE",
+        "EXPORT_REQUESTS_PER_MINUTE",
+        "MEDIA_REQUESTS_PER_MINUTE",
+    )
+    def validate_non_negative_values(cls, v, info):
+        if v < 0:
+            raise ValueError(f"{info.field_name} must not be negative")
+        return v
+
     @field_validator("COMPRESS_DRIVES")
     def validate_compress_drives(cls, v, info):
         if v and info.data.get("JIT_S3_UPLOAD"):
@@ -67,6 +123,148 @@ class Settings(BaseSettings):
             raise ValueError(f"{info.field_name} must be 'pigz' or 'lz4'")
         return v
 
+    @field_validator("COMPRESSION_ENGINE")
+    def validate_compression_engine(cls, v, info):
+        if v not in ["native", "shell"]:
+            raise ValueError(f"{info.field_name} must be 'native' or 'shell'")
+        return v
+
+    @field_validator("DOWNLOAD_ENGINE")
+    def validate_download_engine(cls, v, info):
+        if v not in ["threads", "asyncio"]:
+            raise ValueError(f"{info.field_name} must be 'threads' or 'asyncio'")
+        if v == "asyncio" and info.data.get("STREAM_DOWNLOADS"):
+            raise ValueError(
+                f"{info.field_name} must be 'threads' when STREAM_DOWNLOADS is True"
+            )
+        return v
+
+    @field_validator("ADAPTIVE_COMPRESSION")
+    def validate_adaptive_compression(cls, v, info):
+        if v and info.data.get("COMPRESSION_ENGINE") != "native":
+            raise ValueError(
+                f"{info.field_name} requires COMPRESSION_ENGINE to be 'native'"
+            )
+        return v
+
+    @field_validator("SEEKABLE_ARCHIVES")
+    def validate_seekable_archives(cls, v, info):
+        if not v:
+            return v
+        if not info.data.get("COMPRESS_DRIVES"):
+            raise ValueError(f"{info.field_name} requires COMPRESS_DRIVES to be True")
+        if info.data.get("COMPRESSION_ENGINE") != "native":
+            raise ValueError(
+                f"{info.field_name} requires COMPRESSION_ENGINE to be 'native'"
+            )
+        return v
+
+    @field_validator("ARCHIVE_VOLUME_SIZE_MB")
+    def validate_archive_volume_size(cls, v, info):
+        if v <= 0:
+            return v
+        if not info.data.get("COMPRESS_DRIVES"):
+            raise ValueError(f"{info.field_name} requires COMPRESS_DRIVES to be True")
+        if info.data.get("COMPRESSION_ENGINE") != "native":
+            raise ValueError(
+                f"{info.field_name} requires COMPRESSION_ENGINE to be 'native'"
+            )
+        return v
+
+    @field_validator("BUNDLE_FILE_SIZE_KB")
+    def validate_bundle_file_size(cls, v, info):
+        if v > 0 and not info.data.get("JIT_S3_UPLOAD"):
+            raise ValueError(f"{info.field_name} requires JIT_S3_UPLOAD to be True")
+        return v
+
+    @field_validator("REUSE_UNCHANGED_FILES")
+    def validate_reuse_unchanged_files(cls, v, info):
+        if v not in ["none", "copy", "reference"]:
+            raise ValueError(f"{info.field_name} must be 'none', 'copy' or 'reference'")
+        if v != "none" and info.data.get("COMPRESS_DRIVES"):
+            raise ValueError(
+                f"{info.field_name} must be 'none' when COMPRESS_DRIVES is True"
+            )
+        if v != "none" and info.data.get("STREAM_DOWNLOADS"):
+            raise ValueError(
+                f"{info.field_name} must be 'none' when STREAM_DOWNLOADS is True"
+            )
+        return v
+
+    @field_validator("CONTENT_ADDRESSED_STORAGE")
+    def validate_content_addressed_storage(cls, v, info):
+        if v and not info.data.get("JIT_S3_UPLOAD"):
+            raise ValueError(
+                "CONTENT_ADDRESSED_STORAGE requires JIT_S3_UPLOAD to be True"
+            )
+        return v
+
+    @field_validator("WORK_STEALING_SCHEDULER")
+    def validate_work_stealing_scheduler(cls, v, info):
+        if not v:
+            return v
+        if info.data.get("STREAM_DOWNLOADS") or info.data.get("INCREMENTAL_BACKUPS"):
+            raise ValueError(
+                f"{info.field_name} can't be combined with STREAM_DOWNLOADS or INCREMENTAL_BACKUPS"
+            )
+        if info.data.get("REUSE_UNCHANGED_FILES", "none") != "none":
+            raise ValueError(
+                f"{info.field_name} requires REUSE_UNCHANGED_FILES to be 'none'"
+            )
+        if info.data.get("DOWNLOAD_ENGINE") == "asyncio":
+            raise ValueError(
+                f"{info.field_name} requires DOWNLOAD_ENGINE to be 'threads'"
+            )
+        return v
+
+    @field_validator("PIPELINED_COMPRESSION")
+    def validate_pipelined_compression(cls, v, info):
+        if v and not info.data.get("COMPRESS_DRIVES"):
+            raise ValueError(f"{info.field_name} requires COMPRESS_DRIVES to be True")
+        if v and info.data.get("WORK_STEALING_SCHEDULER"):
+            raise ValueError(
+                f"{info.field_name} can't be combined with WORK_STEALING_SCHEDULER"
+            )
+        return v
+
+    @field_validator("ZERO_STAGING_UPLOADS")
+    def validate_zero_staging_uploads(cls, v, info):
+        if v and not info.data.get("JIT_S3_UPLOAD"):
+            raise ValueError("ZERO_STAGING_UPLOADS requires JIT_S3_UPLOAD to be True")
+        return v
+
+    @field_validator("UPLOAD_PART_SIZE_MB")
+    def validate_upload_part_size(cls, v, info):
+        if v < 5:
+            raise ValueError(f"{info.field_name} must be at least 5 (S3 limit)")
+        return v
+
+    @field_validator("MEMORY_BUDGET_MB")
+    def validate_memory_budget(cls, v, info):
+        if v > 0 and info.data.get("ZERO_STAGING_UPLOADS"):
+            upload_buffers_mb = info.data.get("UPLOAD_BUFFERS", 0) * info.data.get(
+                "UPLOAD_PART_SIZE_MB", 0
+            )
+            if v <= upload_buffers_mb:
+                raise ValueError(
+                    f"{info.field_name} must be larger than UPLOAD_BUFFERS * UPLOAD_PART_SIZE_MB ({upload_buffers_mb})"
+                )
+        return v
+
+    @field_validator("DISK_BUDGET_MB")
+    def validate_disk_budget(cls, v, info):
+        if v <= 0:
+            return v
+        if not info.data.get("AUTO_CLEANUP"):
+            raise ValueError(f"{info.field_name} requires AUTO_CLEANUP to be True")
+        if info.data.get("STREAM_DOWNLOADS") or info.data.get(
+            "WORK_STEALING_SCHEDULER"
+        ):
+            raise ValueError(
+                f"{info.field_name} can't be combined with STREAM_DOWNLOADS or WORK_STEALING_SCHEDULER"
+            )
+        return v
+
     @field_validator("SERVICE_ACCOUNT_FILE")
     def validate_file_exists(cls, v, info):
         if not os.path.exists(v):
@@ -0,0 +1,104 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set, Tuple
+
+from src.aws.s3 import S3
+from src.google.gdrive import GDrive, GFile
+from src.utils.logger import app_logger as logger
+
+MANIFEST_FILE_NAME = "files.json"
+SNAPSHOT_FILE_NAME = "snapshot.json"
+
+
+def load_previous_snapshot(
+    s3: S3, drive_id: str, before: str
+) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[Dict[str, GFile]]]:
+    """Returns the timestamp, snapshot info and manifest of the newest backup of
+    the drive made before `before`, or Nones if there is none."""
+    timestamp = s3.find_latest_snapshot(drive_id, before, marker=SNAPSHOT_FILE_NAME)
+    if timestamp is None:
+        return None, None, None
+    snapshot = s3.download_json(f"{timestamp}/{drive_id}/{SNAPSHOT_FILE_NAME}")
+    files = s3.download_json(f"{timestamp}/{drive_id}/{MANIFEST_FILE_NAME}")
+    if snapshot is None or files is None:
+        return None, None, None
+    for file in files.values():
+        file.setdefault("backup_timestamp", timestamp)
+    return timestamp, snapshot, files
+
+
+def write_snapshot(path: str, snapshot: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(snapshot, f, indent=4)
+
+
+def mark_backed_up_files(drive: GDrive, timestamp: str) -> None:
+    for file in drive.files.values():
+        if "backup_path" in file:
+            file.setdefault("backup_timestamp", timestamp)
+
+
+def reuse_unchanged_files(
+    drive: GDrive,
+    s3: S3,
+    previous_files: Dict[str, GFile],
+    current_timestamp: str,
+    files_path: str,
+    mode: str,
+    threads: int = 20,
+) -> Set[str]:
+    """Points unchanged files at the content stored by a previous backup.
+
+    In `copy` mode the objects are copied server-side into the current backup,
+    in `reference` mode only the manifest entry points at the previous backup.
+    Returns the ids of reused files, which do not need to be downloaded.
+    """
+    drive_id = drive.drive_id
+    drive_path = os.path.dirname(files_path)
+    unchanged = drive.find_unchanged_files(previous_files)
+    if mode == "copy":
+        # Bundled files have no object of their own to copy
+        unchanged = {
+            file_id: previous
+            for file_id, previous in unchanged.items()
+            if "bundle" not in previous
+        }
+
+    # Reserve the previous paths first, so new downloads don't take them
+    reserved = {}
+    for file_id, previous in unchanged.items():
+        local_path = os.path.join(drive_path, previous["backup_path"])
+        if drive.reserve_file_path(local_path):
+            reserved[file_id] = local_path
+
+    def reuse(file_id: str) -> None:
+        previous = unchanged[file_id]
+        backup_path = previous["backup_path"]
+        backup_timestamp = previous["backup_timestamp"]
+        if mode == "copy":
+            s3.copy_object(
+                f"{backup_timestamp}/{drive_id}/{backup_path}",
+                f"{current_timestamp}/{drive_id}/{backup_path}",
+            )
+            backup_timestamp = current_timestamp
+        file = drive.files[file_id]
+        file["backup_path"] = backup_path
+        file["backup_timestamp"] = backup_timestamp
+        if "bundle" in previous:
+            file["bundle"] = previous["bundle"]
+
+    reused = set()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = {executor.submit(reuse, file_id): file_id for file_id in reserved}
+        for future, file_id in futures.items():
+            try:
+                future.result()
+                reused.add(file_id)
+            except Exception as e:
+                logger.warning(
+                    f"({drive_id}) Could not reuse file {file_id}, downloading it instead: {e}"
+                )
+                drive.release_file_path(reserved[file_id])
+    return reused
@@ -0,0 +1,38 @@
+import time
+from typing import Any, Dict
+
+BURST_SECONDS = 1
+
+
+class TokenBuckets:
+    """Request rates shared by all drive processes, one bucket per kind of
+    request.
+
+    `rates` gives the requests per second of every kind, kinds without a
+    rate are not limited. Each bucket holds up to `BURST_SECONDS` worth of
+    tokens. `reserve` always takes its tokens, going into debt when the bucket
+    is empty, and returns how long the caller must wait before sending its
+    request, so waiting requests go out in order at the bucket's rate.
+    """
+
+    def __init__(self, manager: Any, rates: Dict[str, float]) -> None:
+        self.rates = {kind: rate for kind, rate in rates.items() if rate > 0}
+        now = time.monotonic()
+        self._state = manager.dict(
+            {kind: (self._capacity(kind), now) for kind in self.rates}
+        )
+        self._lock = manager.Lock()
+
+    def _capacity(self, kind: str) -> float:
+        return max(1.0, self.rates[kind] * BURST_SECONDS)
+
+    def reserve(self, kind: str, count: int = 1) -> float:
+        rate = self.rates.get(kind)
+        if rate is None:
+            return 0.0
+        with self._lock:
+            tokens, updated = self._state[kind]
+            now = time.monotonic()
+            tokens = min(self._capacity(kind), tokens + (now - updated) * rate) - count
+            self._state[kind] = (tokens, now)
+        return max(0.0, -tokens / rate)
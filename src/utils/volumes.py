@@ -0,0 +1,142 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def volume_name(archive_name: str, number: int) -> str:
+    return f"{archive_name}.{number:04d}"
+
+
+class VolumeWriter:
+    """Write-only file object splitting an archive into volumes of
+    `volume_size` bytes, concatenated they are the whole archive.
+
+    Volumes are opened with `open_volume(number)` when the first byte goes
+    into them, and closed as soon as they are full, then handed to the
+    optional `on_volume_closed(number)` (e.g. to upload them).
+    """
+
+    def __init__(
+        self,
+        open_volume: Callable[[int], BinaryIO],
+        volume_size: int,
+        on_volume_closed: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        if volume_size <= 0:
+            raise ValueError("Volume size must be positive")
+        self.open_volume = open_volume
+        self.volume_size = volume_size
+        self.on_volume_closed = on_volume_closed
+        self.volume_sizes: List[int] = []
+        self._volume: Optional[BinaryIO] = None
+        self._position = 0
+
+    def __enter__(self) -> "VolumeWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def tell(self) -> int:
+        return self._position
+
+    def write(self, data: bytes) -> int:
+        view = memoryview(data)
+        while view:
+            if self._volume is None:
+                self._volume = self.open_volume(len(self.volume_sizes))
+                self.volume_sizes.append(0)
+            room = self.volume_size - self.volume_sizes[-1]
+            self._volume.write(view[:room])
+            self.volume_sizes[-1] += len(view[:room])
+            view = view[room:]
+            if self.volume_sizes[-1] == self.volume_size:
+                self._close_volume()
+        self._position += len(data)
+        return len(data)
+
+    def _close_volume(self) -> None:
+        volume, self._volume = self._volume, None
+        volume.close()
+        if self.on_volume_closed is not None:
+            self.on_volume_closed(len(self.volume_sizes) - 1)
+
+    def close(self) -> None:
+        if self._volume is not None:
+            self._close_volume()
+
+    def abort(self) -> None:
+        volume, self._volume = self._volume, None
+        if volume is None:
+            return
+        if hasattr(volume, "abort"):
+            volume.abort()
+        else:
+            volume.close()
+
+    def manifest(self, archive_name: str) -> Dict[str, Any]:
+        """Lists the volumes of the archive in order."""
+        return {
+            "archive": archive_name,
+            "size": self._position,
+            "volume_size": self.volume_size,
+            "volumes": [
+                {"name": volume_name(archive_name, number), "size": size}
+                for number, size in enumerate(self.volume_sizes)
+            ],
+        }
+
+
+class VolumeUploader:
+    """Runs `upload(path)` for closed volumes in the background, with at
+    most `max_in_flight` at once. `submit` waits for a free slot, which
+    also bounds the disk used by volumes waiting for their upload."""
+
+    def __init__(self, upload: Callable[[str], None], max_in_flight: int) -> None:
+        self.upload = upload
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._futures: List[Future] = []
+
+    def submit(self, path: str) -> None:
+        self._slots.acquire()
+        future = self._executor.submit(self.upload, path)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def wait(self) -> None:
+        """Waits for all uploads and raises the first error."""
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._executor.shutdown()
+
+
+def read_range(
+    manifest: Dict[str, Any],
+    read_volume_range: Callable[[str, int, int], bytes],
+    offset: int,
+    length: int,
+) -> bytes:
+    """Reads a byte range of a split archive, e.g. a file of its index, from
+    the volumes holding it. `read_volume_range(name, offset, length)`
+    reads from one volume."""
+    chunks = []
+    volume_size = manifest["volume_size"]
+    while length > 0:
+        number, volume_offset = divmod(offset, volume_size)
+        chunk_length = min(length, volume_size - volume_offset)
+        chunks.append(
+            read_volume_range(
+                manifest["volumes"][number]["name"], volume_offset, chunk_length
+            )
+        )
+        offset += chunk_length
+        length -= chunk_length
+    return b"".join(chunks)
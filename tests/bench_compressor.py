@@ -0,0 +1,70 @@
+"""Benchmark of the native compression engine against the shell pipelines,
+and of its adaptive mode.
+
+Run with: python -m tests.bench_compressor [size_mb] [processes]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from src.utils.compressor import Compressor
+
+
+def build_folder(path: str, size_mb: int) -> None:
+    # Half compressible text, half random bytes, like a typical drive
+    files_dir = os.path.join(path, "files")
+    os.makedirs(files_dir)
+    text = b"".join(f"Line {i} of some document text\n".encode() for i in range(35000))
+    for i in range(size_mb // 2):
+        with open(os.path.join(files_dir, f"doc{i}.txt"), "wb") as f:
+            f.write(text[: 1024 * 1024])
+        with open(os.path.join(files_dir, f"blob{i}.bin"), "wb") as f:
+            f.write(os.urandom(1024 * 1024))
+
+
+def run(
+    engine: str,
+    algorithm: str,
+    files_dir: str,
+    processes: int,
+    adaptive: bool = False,
+) -> None:
+    label = "adaptive" if adaptive else engine
+    if engine == "shell" and shutil.which(algorithm) is None:
+        print(f"{label:>8} {algorithm:>5}: {algorithm} not installed, skipped")
+        return
+    compressor = Compressor(
+        algorithm, max_processes=processes, engine=engine, adaptive=adaptive
+    )
+    start = time.process_time()
+    wall_start = time.perf_counter()
+    tar_path, tar_size = compressor.compress_folder(files_dir)
+    elapsed = time.perf_counter() - wall_start
+    cpu = time.process_time() - start
+    os.remove(tar_path)
+    print(
+        f"{label:>8} {algorithm:>5}: {elapsed:.2f}s, {cpu:.2f}s CPU in-process ({tar_size/1024/1024:.1f}MB)"
+    )
+
+
+def main() -> None:
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    path = tempfile.mkdtemp()
+    try:
+        build_folder(path, size_mb)
+        files_dir = os.path.join(path, "files")
+        print(f"Synthetic folder: {size_mb}MB, {processes} processes")
+        for algorithm in ("pigz", "pzstd", "lz4"):
+            for engine in ("shell", "native"):
+                run(engine, algorithm, files_dir, processes)
+            run("native", algorithm, files_dir, processes, adaptive=True)
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
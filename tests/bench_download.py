@@ -0,0 +1,83 @@
+"""Benchmark of the download engines against a local fake Drive server with
+simulated network latency.
+
+Run with: python -m tests.bench_download [files] [size_kb] [latency_ms]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+from googleapiclient.discovery import build
+
+from src.google.gdrive import DRIVE_TYPE, GDrive
+from src.google.transport import SessionHttp, authorized_session
+from tests.fake_drive_server import FakeCredentials, FakeDriveServer
+
+
+def make_drive(server: FakeDriveServer, file_count: int) -> GDrive:
+    credentials = FakeCredentials()
+    session = authorized_session(credentials)
+    session.mount("http://", session.adapters["https://"])
+    drive = GDrive("bench@example.com", credentials, DRIVE_TYPE.USER)
+    drive._drive_service = build(
+        "drive",
+        "v3",
+        http=SessionHttp(session),
+        client_options={"api_endpoint": f"{server.api_url}/"},
+    )
+    drive._files_fetched = True
+    for i in range(file_count):
+        drive.files[f"file{i}"] = {
+            "id": f"file{i}",
+            "name": f"file{i}.bin",
+            "path": f"folder{i % 10}",
+            "mimeType": "application/octet-stream",
+            "md5Checksum": f"md5-{i}",
+        }
+    return drive
+
+
+def run(
+    label: str, server: FakeDriveServer, file_count: int, threads: int, concurrency: int
+) -> None:
+    drive = make_drive(server, file_count)
+    drive.async_download_concurrency = concurrency
+    path = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        drive.download_all_files(os.path.join(path, "files"), threads=threads)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+    finally:
+        shutil.rmtree(path)
+    downloaded = sum(1 for file in drive.files.values() if "backup_path" in file)
+    print(
+        f"{label:>22}: {elapsed:.2f}s, {downloaded / elapsed:.0f} files/s, {cpu:.2f}s CPU ({downloaded}/{file_count} files)"
+    )
+
+
+def main() -> None:
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    latency_ms = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    server = FakeDriveServer(latency=latency_ms / 1000).start()
+    content = os.urandom(size_kb * 1024)
+    for i in range(file_count):
+        server.files[f"file{i}"] = content
+    print(f"{file_count} files of {size_kb}KB, {latency_ms}ms latency per request")
+    try:
+        with patch("src.google.async_download.API_URL", server.api_url):
+            run("threads (20)", server, file_count, threads=20, concurrency=0)
+            run("threads (100)", server, file_count, threads=100, concurrency=0)
+            run("asyncio (200)", server, file_count, threads=20, concurrency=200)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark of drive path resolution on a synthetic tree.
+
+Run with: python -m tests.bench_path_resolver [file_count]
+"""
+
+import random
+import sys
+import time
+
+from src.google.path_resolver import PathResolver
+
+
+def build_tree(file_count: int, folder_count: int, max_depth: int) -> dict:
+    random.seed(42)
+    files = {}
+    depths = {}
+    folder_ids = []
+    for i in range(folder_count):
+        folder_id = f"folder-{i}"
+        candidates = [f for f in folder_ids[-1000:] if depths[f] < max_depth]
+        if candidates and random.random() < 0.95:
+            parent = random.choice(candidates)
+            depths[folder_id] = depths[parent] + 1
+        else:
+            parent = "root"
+            depths[folder_id] = 1
+        files[folder_id] = {
+            "id": folder_id,
+            "name": f"Folder {i}",
+            "parents": [parent],
+            "mimeType": "application/vnd.google-apps.folder",
+        }
+        folder_ids.append(folder_id)
+    for i in range(file_count - folder_count):
+        file_id = f"file-{i}"
+        files[file_id] = {
+            "id": file_id,
+            "name": f"File {i}.bin",
+            "parents": [random.choice(folder_ids)],
+        }
+    return files
+
+
+def naive_build_file_path(files: dict, file_id: str) -> str:
+    f = files.get(file_id)
+    file_path = []
+    while "parents" in f:
+        parent = files.get(f["parents"][0])
+        if parent is None:
+            break
+        file_path.append(parent["name"])
+        f = parent
+    return "/".join(reversed(file_path))
+
+
+def main() -> None:
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    files = build_tree(file_count, folder_count=file_count // 20, max_depth=15)
+    print(f"Synthetic tree: {len(files)} files")
+
+    start = time.perf_counter()
+    naive = {file_id: naive_build_file_path(files, file_id) for file_id in files}
+    naive_time = time.perf_counter() - start
+    print(f"Parent walk per file: {naive_time:.2f}s")
+
+    start = time.perf_counter()
+    resolver = PathResolver(files)
+    memoized = {file_id: resolver.resolve(file_id) for file_id in files}
+    memoized_time = time.perf_counter() - start
+    print(f"Memoized resolver:    {memoized_time:.2f}s")
+
+    assert naive == memoized, "Resolved paths differ"
+    print(f"Speedup: {naive_time / memoized_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""In-memory stand-in for the parts of the Drive v3 API used by GDrive."""
+
+from typing import Any, Callable, Dict, List, Optional
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+API_URL = "https://www.googleapis.com/drive/v3"
+
+
+class FakeRequest:
+    def __init__(self, handler: Callable[[], Any], uri: str = "") -> None:
+        self.handler = handler
+        self.uri = uri
+
+    def execute(self) -> Any:
+        return self.handler()
+
+
+class FakeFiles:
+    def __init__(self, service: "FakeDriveService") -> None:
+        self.service = service
+
+    def list(self, pageSize: int = 100, pageToken: Optional[str] = None, **kwargs):
+        self.service.calls.append(("files.list", kwargs))
+        files = list(self.service.files_by_id.values())
+        if kwargs.get("orderBy") == "folder":
+            files.sort(key=lambda f: f["mimeType"] != FOLDER_MIMETYPE)
+        start = int(pageToken or 0)
+
+        def handler():
+            response = {"files": files[start : start + pageSize]}
+            if start + pageSize < len(files):
+                response["nextPageToken"] = str(start + pageSize)
+            return response
+
+        request = FakeRequest(handler)
+        request.params = {"pageSize": pageSize, **kwargs}
+        return request
+
+    def list_next(self, request: FakeRequest, response: Dict[str, Any]):
+        if "nextPageToken" not in response:
+            return None
+        return self.list(pageToken=response["nextPageToken"], **request.params)
+
+    def get(self, fileId: str, **kwargs):
+        self.service.calls.append(("files.get", fileId))
+
+        def handler():
+            if fileId == "root":
+                return {"id": self.service.root_id}
+            return self.service.files_by_id[fileId]
+
+        return FakeRequest(handler, f"{API_URL}/files/{fileId}")
+
+
+class FakePermissions:
+    def __init__(self, service: "FakeDriveService") -> None:
+        self.service = service
+
+    def get(self, fileId: str, permissionId: str, **kwargs):
+        self.service.calls.append(("permissions.get", permissionId))
+
+        def handler():
+            failures = self.service.permission_failures
+            if failures.get(permissionId, 0) > 0:
+                failures[permissionId] -= 1
+                raise RuntimeError(f"Rate limit exceeded for {permissionId}")
+            return {"id": permissionId, "role": "reader"}
+
+        return FakeRequest(
+            handler, f"{API_URL}/files/{fileId}/permissions/{permissionId}"
+        )
+
+
+class FakeDrives:
+    def __init__(self, service: "FakeDriveService") -> None:
+        self.service = service
+
+    def get(self, driveId: str, **kwargs):
+        self.service.calls.append(("drives.get", driveId))
+
+        def handler():
+            if driveId not in self.service.drive_names:
+                raise HttpError(httplib2.Response({"status": 404}), b"Not Found")
+            return {"id": driveId, "name": self.service.drive_names[driveId]}
+
+        return FakeRequest(handler)
+
+
+class FakeBatch:
+    def __init__(self, service: "FakeDriveService", callback: Callable) -> None:
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request: FakeRequest, request_id: str) -> None:
+        if len(self.requests) >= 100:
+            raise ValueError("Too many requests in batch")
+        self.requests.append((request_id, request))
+
+    def execute(self) -> None:
+        self.service.calls.append(("batch", len(self.requests)))
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request.execute(), None)
+            except Exception as e:
+                self.callback(request_id, None, e)
+
+
+class FakeChanges:
+    def __init__(self, service: "FakeDriveService") -> None:
+        self.service = service
+
+    def getStartPageToken(self, **kwargs):
+        self.service.calls.append(("changes.getStartPageToken", kwargs))
+        return FakeRequest(
+            lambda: {"startPageToken": str(len(self.service.change_log))}
+        )
+
+    def list(self, pageToken: str, pageSize: int = 100, **kwargs):
+        self.service.calls.append(("changes.list", kwargs))
+        start = int(pageToken)
+        changes = self.service.change_log
+
+        def handler():
+            response = {"changes": changes[start : start + pageSize]}
+            if start + pageSize < len(changes):
+                response["nextPageToken"] = str(start + pageSize)
+            else:
+                response["newStartPageToken"] = str(len(changes))
+            return response
+
+        return FakeRequest(handler)
+
+
+FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
+
+
+class FakeDriveService:
+    def __init__(self, files: List[Dict[str, Any]], root_id: str = "root-id") -> None:
+        self.files_by_id = {f["id"]: f for f in files}
+        self.root_id = root_id
+        self.change_log = []
+        self.permission_failures = {}
+        self.drive_names = {}
+        self.calls = []
+
+    def update_file(self, file: Dict[str, Any]) -> None:
+        self.files_by_id[file["id"]] = file
+        self.change_log.append(
+            {"changeType": "file", "fileId": file["id"], "file": dict(file)}
+        )
+
+    def remove_file(self, file_id: str) -> None:
+        self.files_by_id.pop(file_id)
+        self.change_log.append(
+            {"changeType": "file", "fileId": file_id, "removed": True}
+        )
+
+    def files(self) -> FakeFiles:
+        return FakeFiles(self)
+
+    def permissions(self) -> FakePermissions:
+        return FakePermissions(self)
+
+    def drives(self) -> FakeDrives:
+        return FakeDrives(self)
+
+    def changes(self) -> FakeChanges:
+        return FakeChanges(self)
+
+    def new_batch_http_request(self, callback: Callable) -> FakeBatch:
+        return FakeBatch(self, callback)
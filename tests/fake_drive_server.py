@@ -0,0 +1,137 @@
+"""Local HTTP server answering the Drive v3 metadata, download and export
+endpoints, for the transport, the download engines and their benchmark."""
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Set
+from urllib.parse import parse_qs, urlparse
+
+import google.auth.credentials
+
+MEDIA_PATH = re.compile(r"^/drive/v3/files/([^/]+)$")
+EXPORT_PATH = re.compile(r"^/drive/v3/files/([^/]+)/export$")
+EXPORT_LINK_PATH = re.compile(r"^/export-links/([^/]+)$")
+
+
+class FakeCredentials(google.auth.credentials.Credentials):
+    def __init__(self):
+        super().__init__()
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server: FakeDriveServer = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with server.lock:
+            server.requests.append(self.path)
+            server.clients.add(self.client_address)
+            server.tokens.append(self.headers["Authorization"])
+        if server.latency:
+            time.sleep(server.latency)
+        if self.headers["Authorization"] in server.rejected_tokens:
+            return self._error(401, "Invalid Credentials")
+
+        if (match := MEDIA_PATH.match(url.path)) and query.get("alt") != ["media"]:
+            return self._reply(200, {"id": match.group(1)})
+        if match := MEDIA_PATH.match(url.path):
+            file_id = match.group(1)
+            if file_id in server.forbidden:
+                return self._error(403, "This file cannot be downloaded by the user")
+            content = server.files.get(file_id)
+        elif match := EXPORT_PATH.match(url.path):
+            file_id = match.group(1)
+            if file_id in server.export_failures:
+                return self._error(403, "This file is too large to be exported.")
+            content = server.exports.get(file_id, {}).get(query["mimeType"][0])
+        elif match := EXPORT_LINK_PATH.match(url.path):
+            file_id = match.group(1)
+            content = server.export_links.get(file_id)
+        else:
+            file_id, content = None, None
+        if content is None:
+            return self._error(404, "File not found")
+        self._send(file_id, content)
+
+    def _send(self, file_id, content):
+        server: FakeDriveServer = self.server
+        start = 0
+        range_header = self.headers["Range"]
+        if range_header:
+            start = int(range_header.removeprefix("bytes=").split("-")[0])
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}"
+            )
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content) - start))
+        self.end_headers()
+        with server.lock:
+            interrupt = file_id in server.interrupt_once
+            server.interrupt_once.discard(file_id)
+        if interrupt:
+            # Drop the connection halfway through the body
+            self.wfile.write(content[start : start + (len(content) - start) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(content[start:])
+
+    def _error(self, status, message):
+        self._reply(status, {"error": {"code": status, "message": message}})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeDriveServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency: float = 0) -> None:
+        super().__init__(("127.0.0.1", 0), FakeDriveHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = []
+        self.clients = set()
+        self.tokens: List[str] = []
+        self.files: Dict[str, bytes] = {}
+        self.exports: Dict[str, Dict[str, bytes]] = {}
+        self.export_links: Dict[str, bytes] = {}
+        self.forbidden: Set[str] = set()
+        self.export_failures: Set[str] = set()
+        self.interrupt_once: Set[str] = set()
+        self.rejected_tokens: Set[str] = set()
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self.api_url = f"{self.url}/drive/v3"
+
+    def start(self) -> "FakeDriveServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def export_link(self, file_id: str) -> str:
+        return f"{self.url}/export-links/{file_id}"
@@ -0,0 +1,97 @@
+"""In-memory stand-in for the parts of the boto3 S3 client used by S3."""
+
+import io
+import threading
+from typing import Any, Dict
+
+from botocore.exceptions import ClientError
+
+
+def _not_found(operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, operation)
+
+
+class FakePaginator:
+    def __init__(self, client: "FakeS3Client") -> None:
+        self.client = client
+
+    def paginate(self, Bucket: str, Delimiter: str = None, Prefix: str = ""):
+        keys = sorted(k for k in self.client.objects if k.startswith(Prefix))
+        if Delimiter is None:
+            yield {"Contents": [{"Key": k} for k in keys]}
+            return
+        prefixes = sorted(
+            {Prefix + k[len(Prefix) :].split(Delimiter)[0] + Delimiter for k in keys}
+        )
+        yield {"CommonPrefixes": [{"Prefix": p} for p in prefixes]}
+
+
+class FakeS3Client:
+    def __init__(self) -> None:
+        self.objects: Dict[str, bytes] = {}
+        self.uploads: Dict[str, Dict[int, bytes]] = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _record(self, *call: Any) -> None:
+        with self._lock:
+            self.calls.append(call)
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes = b"", **kwargs):
+        self._record("put_object", Key)
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.read()
+        return {}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs):
+        self._record("get_object", Key)
+        if Key not in self.objects:
+            raise _not_found("GetObject")
+        body = self.objects[Key]
+        if "Range" in kwargs:
+            start, end = kwargs["Range"].removeprefix("bytes=").split("-")
+            body = body[int(start) : int(end) + 1]
+        return {"Body": io.BytesIO(body)}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs):
+        self._record("head_object", Key)
+        if Key not in self.objects:
+            raise _not_found("HeadObject")
+        return {"ContentLength": len(self.objects[Key])}
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, **kwargs):
+        self._record("upload_file", Key)
+        with open(Filename, "rb") as f:
+            self.objects[Key] = f.read()
+
+    def copy(self, CopySource: Dict[str, str], Bucket: str, Key: str, **kwargs):
+        self._record("copy", CopySource["Key"], Key)
+        if CopySource["Key"] not in self.objects:
+            raise _not_found("CopyObject")
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs):
+        self._record("create_multipart_upload", Key)
+        with self._lock:
+            upload_id = f"upload-{len(self.uploads)}"
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._record("upload_part", Key, PartNumber)
+        self.uploads[UploadId][PartNumber] = Body.read()
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._record("complete_multipart_upload", Key)
+        parts = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        self.objects[Key] = b"".join(parts[number] for number in numbers)
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._record("abort_multipart_upload", Key)
+        self.uploads.pop(UploadId, None)
+        return {}
+
+    def get_paginator(self, operation: str) -> FakePaginator:
+        return FakePaginator(self)
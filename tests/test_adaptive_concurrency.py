@@ -0,0 +1,148 @@
+import asyncio
+import json
+import threading
+import unittest
+from unittest.mock import patch
+
+import httplib2
+from googleapiclient.errors import HttpError
+from tenacity import wait_none
+
+from src.google import retries
+from src.google.adaptive_concurrency import AdaptiveConcurrency
+
+MB = 1024 * 1024
+
+
+def http_error(status, reason=None):
+    errors = [{"reason": reason}] if reason else []
+    content = json.dumps({"error": {"code": status, "errors": errors}}).encode()
+    return HttpError(httplib2.Response({"status": str(status)}), content)
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        # Only the controller's clock, threading keeps the real one
+        patcher = patch("src.google.adaptive_concurrency.time")
+        patcher.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def _finish_window(self, controller, seconds, size=MB):
+        # A window lasts as many downloads as the current limit
+        downloads = controller.limit
+        for _ in range(downloads):
+            self.assertTrue(controller.try_acquire())
+        self.now += seconds
+        for _ in range(downloads):
+            controller.release(size)
+
+    def test_starts_at_half_and_grows_while_throughput_does(self):
+        controller = AdaptiveConcurrency(8)
+        self.assertEqual(controller.limit, 4)
+        for _ in range(10):
+            self._finish_window(controller, 1)
+        self.assertEqual(controller.limit, 8)
+
+    def test_slower_window_takes_a_slot_back(self):
+        controller = AdaptiveConcurrency(8)
+        self._finish_window(controller, 1)
+        self.assertEqual(controller.limit, 5)
+        self._finish_window(controller, 2)
+        self.assertEqual(controller.limit, 4)
+
+    def test_rate_limit_halves_once_per_burst(self):
+        controller = AdaptiveConcurrency(16)
+        controller.throttled()
+        controller.throttled()
+        self.assertEqual(controller.limit, 4)
+        self.now += 60
+        for _ in range(5):
+            controller.throttled()
+        self.assertEqual(controller.limit, 2)
+        self.now += 60
+        controller.throttled()
+        controller.throttled()
+        self.assertEqual(controller.limit, 1)
+
+    def test_throttled_window_does_not_grow(self):
+        controller = AdaptiveConcurrency(8)
+        controller.throttled()
+        self._finish_window(controller, 1)
+        self.assertEqual(controller.limit, 2)
+        self._finish_window(controller, 1)
+        self.assertEqual(controller.limit, 3)
+
+    def test_slot_waits_for_limit(self):
+        controller = AdaptiveConcurrency(2)
+        started = threading.Event()
+
+        def download():
+            with controller.slot(MB):
+                started.set()
+
+        with controller.slot(MB):
+            threading.Thread(target=download, daemon=True).start()
+            self.assertFalse(started.wait(0.05))
+        self.assertTrue(started.wait(1))
+
+    def test_async_slot_is_woken_by_threads(self):
+        controller = AdaptiveConcurrency(2)
+
+        async def download():
+            async with controller.async_slot(MB):
+                return controller.in_flight
+
+        async def main():
+            self.assertTrue(controller.try_acquire())
+            waiting = asyncio.ensure_future(download())
+            await asyncio.sleep(0.05)
+            self.assertFalse(waiting.done())
+            threading.Thread(target=controller.release, args=(MB,)).start()
+            return await asyncio.wait_for(waiting, 1)
+
+        self.assertEqual(asyncio.run(main()), 1)
+        self.assertEqual(controller.in_flight, 0)
+
+    def test_disabled_never_waits(self):
+        controller = AdaptiveConcurrency()
+        with controller.slot(MB), controller.slot(MB):
+            self.assertEqual(controller.in_flight, 2)
+        controller.throttled()
+        self.assertEqual(controller.limit, 1)
+
+
+class TestRateLimitErrors(unittest.TestCase):
+    def test_rate_limit_errors(self):
+        self.assertTrue(retries.is_rate_limit_error(http_error(429)))
+        self.assertTrue(
+            retries.is_rate_limit_error(http_error(403, "userRateLimitExceeded"))
+        )
+        self.assertTrue(
+            retries.is_transient_error(http_error(403, "rateLimitExceeded"))
+        )
+        self.assertFalse(retries.is_rate_limit_error(http_error(403, "forbidden")))
+        self.assertFalse(retries.is_transient_error(http_error(403, "forbidden")))
+        self.assertFalse(retries.is_rate_limit_error(http_error(503)))
+
+    def test_rate_limit_retries_throttle_downloads(self):
+        calls = []
+
+        def download():
+            calls.append(None)
+            if len(calls) < 3:
+                raise http_error(403, "rateLimitExceeded")
+
+        with (
+            patch.object(retries, "DOWNLOAD_RETRY_WAIT", wait_none()),
+            patch.object(retries, "download_concurrency") as controller,
+        ):
+            for attempt in retries.download_retrying():
+                with attempt:
+                    download()
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(controller.throttled.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
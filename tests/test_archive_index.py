@@ -0,0 +1,151 @@
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from fake_s3 import FakeS3Client
+from src.aws.multipart import MIN_PART_SIZE, BufferPool
+from src.aws.s3 import S3
+from src.utils.archive_index import INDEX_SUFFIX, MIN_FRAME_SIZE, read_member
+from src.utils.compression_engine import decompress
+from src.utils.compressor import NATIVE_ALGORITHMS, Compressor, StreamingArchive
+
+FILES = {
+    "small1": b"small file\n" * 10,
+    "small2": b"another small file\n" * 10,
+    "large1": b"large compressible file\n" * (MIN_FRAME_SIZE // 10),
+    "large2": os.urandom(MIN_FRAME_SIZE * 3),
+    "small3": b"after the large ones\n" * 10,
+}
+
+
+class TestSeekableArchive(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.files_dir = os.path.join(self.test_dir, "files")
+        os.makedirs(os.path.join(self.files_dir, "folder"))
+        self.file_ids = {}
+        for name, content in FILES.items():
+            with open(os.path.join(self.files_dir, "folder", name), "wb") as f:
+                f.write(content)
+            self.file_ids[f"files/folder/{name}"] = f"id-{name}"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_restore_single_files(self):
+        for algorithm in ("pzstd", "pigz", "lz4"):
+            with self.subTest(algorithm=algorithm):
+                compressor = Compressor(
+                    algorithm, max_processes=2, engine="native", seekable=True
+                )
+                tar_path, tar_size = compressor.compress_folder(
+                    self.files_dir, file_ids=self.file_ids
+                )
+                with open(tar_path, "rb") as f:
+                    archive = f.read()
+                with open(f"{tar_path}{INDEX_SUFFIX}") as f:
+                    index = json.load(f)
+
+                self.assertEqual(index["archive"], os.path.basename(tar_path))
+                self.assertEqual(len(index["files"]), len(FILES))
+                for name, content in FILES.items():
+                    ranges = []
+
+                    def read_range(offset, length):
+                        ranges.append(length)
+                        return archive[offset : offset + length]
+
+                    self.assertEqual(
+                        read_member(index, f"id-{name}", read_range), content
+                    )
+                    self.assertLess(ranges[0], tar_size)
+
+                # Still one stream for the usual tools
+                tar_data = decompress(NATIVE_ALGORITHMS[algorithm], archive)
+                with tarfile.open(fileobj=io.BytesIO(tar_data)) as tar:
+                    self.assertEqual(
+                        tar.extractfile("files/folder/large2").read(), FILES["large2"]
+                    )
+                os.remove(tar_path)
+                os.remove(f"{tar_path}{INDEX_SUFFIX}")
+
+    def test_small_files_share_frames(self):
+        compressor = Compressor("pzstd", engine="native", seekable=True)
+        tar_path, _ = compressor.compress_folder(self.files_dir, file_ids=self.file_ids)
+        with open(f"{tar_path}{INDEX_SUFFIX}") as f:
+            members = json.load(f)["members"]
+        small1 = members["files/folder/small1"]
+        small2 = members["files/folder/small2"]
+        self.assertEqual(small1["offset"], small2["offset"])
+        self.assertGreater(small2["tar_offset"], small1["tar_offset"])
+        # Members are added in name order, the large files come first
+        large2 = members["files/folder/large2"]
+        self.assertGreater(large2["offset"], members["files/folder/large1"]["offset"])
+        self.assertEqual(small1["offset"], large2["offset"] + large2["length"])
+
+    def test_adaptive_and_seekable(self):
+        compressor = Compressor(
+            "pigz", max_processes=2, engine="native", adaptive=True, seekable=True
+        )
+        tar_path, _ = compressor.compress_folder(self.files_dir, file_ids=self.file_ids)
+        with open(tar_path, "rb") as f:
+            archive = f.read()
+        with open(f"{tar_path}{INDEX_SUFFIX}") as f:
+            index = json.load(f)
+        for name, content in FILES.items():
+            self.assertEqual(
+                read_member(
+                    index,
+                    f"id-{name}",
+                    lambda offset, length: archive[offset : offset + length],
+                ),
+                content,
+            )
+
+    def test_streaming_archive_restored_with_ranged_get(self):
+        client = FakeS3Client()
+        with patch("src.aws.s3.boto3.client", return_value=client):
+            s3 = S3("bucket", "key", "secret")
+        executor = ThreadPoolExecutor(max_workers=2)
+        archive = StreamingArchive(
+            Compressor("pzstd", engine="native", seekable=True),
+            lambda: s3.open_multipart_writer(
+                "files.tar.zst", BufferPool(4, MIN_PART_SIZE), executor
+            ),
+        )
+        for name in FILES:
+            archive.add(
+                os.path.join(self.files_dir, "folder", name), f"files/folder/{name}"
+            )
+        archive.close()
+        executor.shutdown()
+        s3.upload_json(
+            f"files.tar.zst{INDEX_SUFFIX}",
+            archive.index("files.tar.zst", self.file_ids),
+        )
+
+        index = s3.download_json(f"files.tar.zst{INDEX_SUFFIX}")
+        self.assertEqual(
+            read_member(
+                index,
+                "id-small3",
+                lambda offset, length: s3.download_range(
+                    "files.tar.zst", offset, length
+                ),
+            ),
+            FILES["small3"],
+        )
+
+    def test_requires_native_engine(self):
+        with self.assertRaises(ValueError):
+            Compressor("pigz", engine="shell", seekable=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
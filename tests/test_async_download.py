@@ -0,0 +1,231 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from googleapiclient.discovery import build
+from tenacity import wait_none
+
+from fake_drive_server import FakeCredentials, FakeDriveServer
+from fake_s3 import FakeS3Client
+from src.aws.s3 import S3
+from src.google import retries
+from src.google.gdrive import DRIVE_TYPE, EXPORT_FORMATS, GDrive
+from src.google.transport import SessionHttp, authorized_session
+from src.utils.memory_budget import MemoryBudget
+
+DOCUMENT = "application/vnd.google-apps.document"
+DOCX = EXPORT_FORMATS[DOCUMENT][0]
+
+
+def binary(file_id, name, path=""):
+    return {
+        "id": file_id,
+        "name": name,
+        "path": path,
+        "mimeType": "application/octet-stream",
+        "md5Checksum": f"md5-{file_id}",
+    }
+
+
+def document(file_id, name, export_link):
+    return {
+        "id": file_id,
+        "name": name,
+        "path": "",
+        "mimeType": DOCUMENT,
+        "exportLinks": {DOCX: export_link},
+    }
+
+
+class TestAsyncDownloads(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.server = FakeDriveServer().start()
+        self.credentials = FakeCredentials()
+        for patcher in (
+            patch("src.google.async_download.API_URL", self.server.api_url),
+            patch.object(retries, "DOWNLOAD_RETRY_WAIT", wait_none()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.test_dir)
+
+    def _drive(self, files, concurrency=8, **kwargs):
+        drive = GDrive("user@example.com", self.credentials, DRIVE_TYPE.USER, **kwargs)
+        drive.async_download_concurrency = concurrency
+        drive._files_fetched = True
+        for file in files:
+            drive.files[file["id"]] = dict(file)
+        return drive
+
+    def _thread_drive(self, files):
+        drive = self._drive(files, concurrency=0)
+        session = authorized_session(self.credentials)
+        session.mount("http://", session.adapters["https://"])
+        drive._drive_service = build(
+            "drive",
+            "v3",
+            http=SessionHttp(session),
+            client_options={"api_endpoint": f"{self.server.api_url}/"},
+        )
+        return drive
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_same_files_as_thread_engine(self):
+        files = [
+            binary("f1", "same.bin"),
+            binary("f2", "same.bin"),
+            binary("f3", "nested.bin", "folder/sub"),
+            document("d1", "notes", self.server.export_link("d1")),
+        ]
+        for i, file in enumerate(files[:3]):
+            self.server.files[file["id"]] = os.urandom(1000 + i)
+        self.server.exports["d1"] = {DOCX: b"exported document"}
+
+        # One at a time, so that both engines give the same file its name
+        results = {}
+        for name, drive in (
+            ("threads", self._thread_drive(files)),
+            ("asyncio", self._drive(files, concurrency=1)),
+        ):
+            base_path = os.path.join(self.test_dir, name, "files")
+            drive.download_all_files(base_path, threads=1)
+            results[name] = {
+                file_id: (
+                    file["backup_path"],
+                    self._read(os.path.join(self.test_dir, name, file["backup_path"])),
+                )
+                for file_id, file in drive.files.items()
+            }
+        self.assertEqual(results["asyncio"], results["threads"])
+        self.assertEqual(
+            results["asyncio"]["d1"], ("files/notes.docx", b"exported document")
+        )
+        self.assertEqual(results["asyncio"]["f2"][0], "files/same_f2_1.bin")
+
+    def test_interrupted_download_resumes(self):
+        content = os.urandom(256 * 1024)
+        self.server.files["f1"] = content
+        self.server.interrupt_once.add("f1")
+        drive = self._drive([binary("f1", "large.bin")])
+        drive.download_all_files(os.path.join(self.test_dir, "files"))
+
+        self.assertEqual(
+            self._read(os.path.join(self.test_dir, "files", "large.bin")), content
+        )
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_reads_share_the_memory_budget(self):
+        files = [binary(f"f{i}", f"{i}.bin") for i in range(4)]
+        for file in files:
+            self.server.files[file["id"]] = os.urandom(1000)
+        # Room for a single read buffer at a time
+        budget = MemoryBudget(1024 * 1024, 1)
+        peak = []
+        take = budget._try_take
+
+        def try_take(size):
+            taken = take(size)
+            peak.append(budget.used)
+            return taken
+
+        drive = self._drive(files)
+        with (
+            patch("src.google.async_download.memory_budget", budget),
+            patch.object(budget, "_try_take", side_effect=try_take),
+        ):
+            drive.download_all_files(os.path.join(self.test_dir, "files"))
+
+        for file in files:
+            self.assertEqual(
+                self._read(os.path.join(self.test_dir, "files", file["name"])),
+                self.server.files[file["id"]],
+            )
+        self.assertEqual(max(peak), 1024 * 1024)
+        self.assertEqual(budget.used, 0)
+
+    def test_errors_are_recorded(self):
+        self.server.files["f1"] = b"content"
+        self.server.forbidden.add("f2")
+        drive = self._drive(
+            [
+                binary("f1", "ok.bin"),
+                binary("f2", "forbidden.bin"),
+                binary("f3", "missing.bin"),
+            ]
+        )
+        base_path = os.path.join(self.test_dir, "files")
+        drive.download_all_files(base_path)
+
+        self.assertEqual(drive.files["f1"]["backup_path"], "files/ok.bin")
+        self.assertNotIn("backup_path", drive.files["f2"])
+        self.assertNotIn("backup_path", drive.files["f3"])
+        with open(os.path.join(base_path, "permission_errors.txt")) as f:
+            self.assertIn("forbidden.bin", f.read())
+        with open(os.path.join(base_path, "errors.txt")) as f:
+            self.assertIn("missing.bin", f.read())
+        self.assertFalse(os.path.exists(os.path.join(base_path, "missing.bin")))
+
+    def test_export_falls_back_to_export_link(self):
+        self.server.export_failures.add("d1")
+        self.server.export_links["d1"] = b"exported through the link"
+        drive = self._drive([document("d1", "large", self.server.export_link("d1"))])
+        base_path = os.path.join(self.test_dir, "files")
+        drive.download_all_files(base_path)
+
+        saved = os.path.join(self.test_dir, drive.files["d1"]["backup_path"])
+        self.assertEqual(self._read(saved), b"exported through the link")
+
+    def test_expired_token_is_refreshed_once(self):
+        files = [binary(f"f{i}", f"{i}.bin") for i in range(20)]
+        for file in files:
+            self.server.files[file["id"]] = b"content"
+        drive = self._drive(files)
+        drive.download_all_files(os.path.join(self.test_dir, "first"))
+        self.server.rejected_tokens.add("Bearer token-1")
+        drive.download_all_files(os.path.join(self.test_dir, "second"))
+
+        self.assertEqual(self.credentials.refreshes, 2)
+        self.assertEqual(len(os.listdir(os.path.join(self.test_dir, "second"))), 20)
+
+    def test_jit_upload(self):
+        self.server.files["f1"] = b"uploaded right away"
+        client = FakeS3Client()
+        with patch("src.aws.s3.boto3.client", return_value=client):
+            s3 = S3("bucket", "key", "secret")
+        drive = self._drive([binary("f1", "jit.bin")], jit_s3_upload=True)
+        drive._get_s3_service = lambda: s3
+        base_path = os.path.join(self.test_dir, "files")
+        drive.download_all_files(base_path, threads=2)
+
+        key = drive._s3_key(os.path.join(base_path, "jit.bin"))
+        self.assertEqual(client.objects[key], b"uploaded right away")
+        self.assertEqual(os.listdir(base_path), [])
+
+    def test_other_files_use_threads(self):
+        drive = self._drive(
+            [
+                {
+                    "id": "s1",
+                    "name": "link",
+                    "path": "",
+                    "mimeType": "application/vnd.google-apps.shortcut",
+                }
+            ]
+        )
+        with patch.object(drive, "download_file") as download_file:
+            drive.download_all_files(os.path.join(self.test_dir, "files"))
+        download_file.assert_called_once()
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
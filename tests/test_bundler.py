@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.utils.bundler import Bundler
+
+
+class TestBundler(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.bundles_dir = os.path.join(self.test_dir, "bundles")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _file(self, name, content):
+        path = os.path.join(self.test_dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return {"id": name}, path
+
+    def test_offsets_point_at_file_contents(self):
+        bundler = Bundler(self.bundles_dir, 1024, 1024 * 1024, 60)
+        contents = {
+            "a.txt": b"first file",
+            "b.txt": b"x" * 1000,
+            "c" * 150 + ".txt": b"long name needs an extended header",
+        }
+        files = {}
+        for name, content in contents.items():
+            file, path = self._file(name, content)
+            self.assertIsNone(bundler.add(file, path, f"files/{name}"))
+            files[name] = file
+        bundle = bundler.flush()
+        Bundler.locate(bundle, "bundles/test.tar")
+
+        with open(bundle.path, "rb") as f:
+            data = f.read()
+        for name, content in contents.items():
+            location = files[name]["bundle"]
+            self.assertEqual(location["path"], "bundles/test.tar")
+            self.assertEqual(location["size"], len(content))
+            offset = location["offset"]
+            self.assertEqual(data[offset : offset + len(content)], content)
+        self.assertIsNone(bundler.flush())
+
+    def test_full_bundle_is_returned(self):
+        bundler = Bundler(self.bundles_dir, 4096, 8192, 60)
+        bundles = []
+        for i in range(6):
+            file, path = self._file(f"{i}.bin", os.urandom(3000))
+            bundle = bundler.add(file, path, f"files/{i}.bin")
+            if bundle is not None:
+                bundles.append(bundle)
+        self.assertEqual([len(bundle.files) for bundle in bundles], [2, 2, 2])
+        self.assertNotEqual(bundles[0].path, bundles[1].path)
+        self.assertIsNone(bundler.flush())
+
+    def test_old_bundle_is_returned(self):
+        bundler = Bundler(self.bundles_dir, 4096, 1024 * 1024, 60)
+        file, path = self._file("a.bin", b"a")
+        with patch("src.utils.bundler.time.monotonic", return_value=0):
+            self.assertIsNone(bundler.add(file, path, "files/a.bin"))
+        with patch("src.utils.bundler.time.monotonic", return_value=61):
+            bundle = bundler.add(file, path, "files/b.bin")
+        self.assertEqual(len(bundle.files), 2)
+
+    def test_accepts_small_files_only(self):
+        bundler = Bundler(self.bundles_dir, 10, 1024, 60)
+        _, small = self._file("small", b"x" * 10)
+        _, large = self._file("large", b"x" * 11)
+        self.assertTrue(bundler.accepts(small))
+        self.assertFalse(bundler.accepts(large))
+
+
+if __name__ == "__main__":
+    unittest.main()
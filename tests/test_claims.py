@@ -0,0 +1,99 @@
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+from src.utils.claims import ClaimRegistry
+
+
+class TestClaimRegistry(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.registry = ClaimRegistry(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_claim_once(self):
+        self.assertTrue(self.registry.claim("abc"))
+        self.assertFalse(self.registry.claim("abc"))
+        self.assertFalse(ClaimRegistry(self.test_dir).claim("abc"))
+        self.assertTrue(self.registry.claim("def"))
+
+    def test_release_allows_new_claim(self):
+        self.registry.claim("abc")
+        self.registry.release("abc")
+        self.assertTrue(self.registry.claim("abc"))
+
+    def test_wait_for_completion(self):
+        self.registry.claim("abc")
+        threading.Timer(0.05, self.registry.complete, args=("abc",)).start()
+        self.assertTrue(self.registry.wait("abc", timeout=5, interval=0.01))
+
+    def test_wait_for_release(self):
+        self.registry.claim("abc")
+        threading.Timer(0.05, self.registry.release, args=("abc",)).start()
+        self.assertFalse(self.registry.wait("abc", timeout=5, interval=0.01))
+
+    def _claim_of_dead_process(self, key):
+        process = subprocess.Popen(["true"])
+        process.wait()
+        with open(self.registry._marker(key, "claim"), "w") as f:
+            f.write(str(process.pid))
+
+    def test_claim_of_dead_process_is_abandoned(self):
+        self._claim_of_dead_process("abc")
+        self.assertFalse(self.registry.is_claimed("abc"))
+        self.assertFalse(self.registry.wait("abc", timeout=5, interval=0.01))
+        self.assertTrue(self.registry.claim("abc"))
+        self.assertFalse(self.registry.claim("abc"))
+
+    def test_dead_claim_is_taken_over_once(self):
+        self._claim_of_dead_process("abc")
+        marker = self.registry._marker("abc", "claim")
+        owner = self.registry._owner("abc")
+        # Both saw the dead owner, only the first one takes the claim over
+        self.assertTrue(self.registry._take_over(marker, owner))
+        self.assertFalse(self.registry._take_over(marker, owner))
+        self.assertTrue(self.registry.is_claimed("abc"))
+
+    def test_concurrent_takeovers(self):
+        self._claim_of_dead_process("abc")
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.registry.claim("abc")))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+    def test_wait_all_shares_one_deadline(self):
+        for key in ("a", "b", "c"):
+            self.registry.claim(key)
+        self.registry.complete("a")
+        threading.Timer(0.05, self.registry.complete, args=("b",)).start()
+        started = time.monotonic()
+        done = self.registry.wait_all(["a", "b", "c"], timeout=0.3, interval=0.01)
+        self.assertEqual(done, {"a", "b"})
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_concurrent_claims(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.registry.claim("x")))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,38 @@
+import gzip
+import io
 import os
 import shutil
+import subprocess
+import tarfile
 import tempfile
 import unittest
-from src.utils.compressor import Compressor
+from unittest.mock import patch
+
+import lz4.frame
+import zstandard
+
+from src.utils.compressibility import MIN_ADAPTIVE_SIZE, byte_entropy, should_store
+from src.utils.compression_engine import BLOCK_SIZE, open_compressed_writer
+from src.utils.compressor import COMPRESSION_PAX_HEADER, Compressor, StreamingArchive
+
+
+def decompress_lz4_frames(data):
+    # lz4.frame.decompress stops after the first frame
+    decompressed = b""
+    while data:
+        decompressor = lz4.frame.LZ4FrameDecompressor()
+        decompressed += decompressor.decompress(data)
+        data = decompressor.unused_data
+    return decompressed
+
+
+class FakeOutput(io.BytesIO):
+    def close(self):
+        self.closed_data = self.getvalue()
+        super().close()
+
+    def abort(self):
+        self.aborted = True
 
 
 class TestCompressor(unittest.TestCase):
@@ -54,5 +84,253 @@ class TestCompressor(unittest.TestCase):
         os.remove(tar_path)
 
 
+class TestNativeCompressor(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.files_dir = os.path.join(self.test_dir, "files")
+        os.makedirs(os.path.join(self.files_dir, "A"))
+        self.contents = {}
+        for name in ("test_file.txt", "A/nested.txt"):
+            content = ("This is a test file.\n" + "Random content " * 1000).encode()
+            with open(os.path.join(self.files_dir, name), "wb") as f:
+                f.write(content)
+            self.contents[f"files/{name}"] = content
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _assert_archive(self, tar_data):
+        with tarfile.open(fileobj=io.BytesIO(tar_data)) as tar:
+            for name, content in self.contents.items():
+                self.assertEqual(tar.extractfile(name).read(), content)
+
+    def test_compress_folder_all_algorithms(self):
+        decompress = {
+            "pigz": gzip.decompress,
+            "pzstd": lambda data: zstandard.ZstdDecompressor()
+            .decompressobj()
+            .decompress(data),
+            "lz4": decompress_lz4_frames,
+        }
+        for algorithm, decompress_archive in decompress.items():
+            with self.subTest(algorithm=algorithm):
+                compressor = Compressor(algorithm, max_processes=2, engine="native")
+                tar_path, tar_size = compressor.compress_folder(self.files_dir)
+                self.assertEqual(tar_size, os.path.getsize(tar_path))
+                self.assertLess(tar_size, sum(map(len, self.contents.values())))
+                with open(tar_path, "rb") as f:
+                    self._assert_archive(decompress_archive(f.read()))
+                os.remove(tar_path)
+
+    def test_multithreaded_blocks_are_one_stream(self):
+        data = os.urandom(1024) * (BLOCK_SIZE * 3 // 1024)
+        for algorithm, decompress in (
+            ("gzip", gzip.decompress),
+            ("lz4", decompress_lz4_frames),
+        ):
+            with self.subTest(algorithm=algorithm):
+                output = io.BytesIO()
+                with open_compressed_writer(algorithm, output, threads=4) as writer:
+                    for i in range(0, len(data), 100_000):
+                        writer.write(data[i : i + 100_000])
+                self.assertEqual(decompress(output.getvalue()), data)
+
+    def test_progress_callback(self):
+        progress = []
+        compressor = Compressor(
+            "pzstd",
+            engine="native",
+            progress=lambda read, written: progress.append((read, written)),
+        )
+        tar_path, tar_size = compressor.compress_folder(self.files_dir)
+        self.assertGreater(len(progress), 0)
+        self.assertEqual(progress[-1][1], tar_size)
+        self.assertGreater(progress[-1][0], sum(map(len, self.contents.values())))
+
+    def test_failed_shell_compression_has_no_size(self):
+        compressor = Compressor("pigz", engine="shell")
+        with (
+            patch("src.utils.compressor.os.system", return_value=256),
+            self.assertRaises(RuntimeError),
+        ):
+            compressor.compress_folder(self.files_dir)
+
+    def test_streaming_archive(self):
+        output = FakeOutput()
+        archive = StreamingArchive(Compressor("pzstd", engine="native"), lambda: output)
+        archive.add(
+            os.path.join(self.files_dir, "test_file.txt"), "files/test_file.txt"
+        )
+        size = archive.close()
+        self.assertEqual(size, len(output.closed_data))
+        tar_data = (
+            zstandard.ZstdDecompressor().decompressobj().decompress(output.closed_data)
+        )
+        with tarfile.open(fileobj=io.BytesIO(tar_data)) as tar:
+            self.assertEqual(tar.getnames(), ["files/test_file.txt"])
+
+
+class TestStreamingArchive(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.test_dir, f"file{i}.txt")
+            with open(path, "w") as f:
+                f.write(f"File {i}\n" + "Random content " * 1000)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_files_added_while_streaming(self):
+        output = FakeOutput()
+        archive = StreamingArchive(Compressor("lz4", engine="shell"), lambda: output)
+        for i, path in enumerate(self.paths):
+            archive.add(path, f"files/A/file{i}.txt")
+        size = archive.close()
+
+        self.assertEqual(size, len(output.closed_data))
+        tar_data = subprocess.run(
+            ["lz4", "-d", "-c"], input=output.closed_data, capture_output=True
+        ).stdout
+        with tarfile.open(fileobj=io.BytesIO(tar_data)) as tar:
+            self.assertEqual(tar.getnames(), [f"files/A/file{i}.txt" for i in range(3)])
+            with open(self.paths[1], "rb") as f:
+                self.assertEqual(tar.extractfile("files/A/file1.txt").read(), f.read())
+
+    def test_empty_archive_writes_nothing(self):
+        opened = []
+        archive = StreamingArchive(
+            Compressor("lz4", engine="shell"), lambda: opened.append(True)
+        )
+        self.assertEqual(archive.close(), 0)
+        self.assertEqual(opened, [])
+
+    def test_abort(self):
+        output = FakeOutput()
+        archive = StreamingArchive(Compressor("lz4", engine="shell"), lambda: output)
+        archive.add(self.paths[0], "files/file0.txt")
+        archive.abort()
+        self.assertTrue(output.aborted)
+
+
+class TestAdaptiveCompression(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.files_dir = os.path.join(self.test_dir, "files")
+        os.mkdir(self.files_dir)
+        self.contents = {
+            "text.txt": b"Random content " * (MIN_ADAPTIVE_SIZE // 10),
+            "photo.jpg": b"jpeg" * (MIN_ADAPTIVE_SIZE // 4),
+            "random.bin": os.urandom(MIN_ADAPTIVE_SIZE * 2),
+            "small.bin": os.urandom(1000),
+        }
+        for name, content in self.contents.items():
+            with open(os.path.join(self.files_dir, name), "wb") as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _path(self, name):
+        return os.path.join(self.files_dir, name)
+
+    def test_byte_entropy(self):
+        self.assertEqual(byte_entropy(b""), 0)
+        self.assertEqual(byte_entropy(b"a" * 100), 0)
+        self.assertAlmostEqual(byte_entropy(bytes(range(256)) * 10), 8)
+
+    def test_should_store(self):
+        self.assertFalse(should_store(self._path("text.txt")))
+        self.assertTrue(should_store(self._path("photo.jpg")))
+        self.assertTrue(should_store(self._path("random.bin")))
+        self.assertIsNone(should_store(self._path("small.bin")))
+        self.assertTrue(should_store(self._path("text.txt"), "video/mp4"))
+        self.assertTrue(
+            should_store(
+                self._path("text.txt"),
+                "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            )
+        )
+        self.assertFalse(should_store(self._path("text.txt"), "audio/wav"))
+
+    def _assert_adaptive_archive(self, tar_data):
+        with tarfile.open(fileobj=io.BytesIO(tar_data)) as tar:
+            modes = {
+                os.path.basename(member.name): member.pax_headers.get(
+                    COMPRESSION_PAX_HEADER
+                )
+                for member in tar.getmembers()
+                if member.isfile()
+            }
+            for name, content in self.contents.items():
+                self.assertEqual(tar.extractfile(f"files/{name}").read(), content)
+        self.assertEqual(modes["text.txt"], "compress")
+        self.assertEqual(modes["photo.jpg"], "store")
+        self.assertEqual(modes["random.bin"], "store")
+        self.assertIn(modes["small.bin"], ("store", "compress"))
+
+    def test_compress_folder(self):
+        decompress = {
+            "pigz": gzip.decompress,
+            "pzstd": lambda data: zstandard.ZstdDecompressor()
+            .decompressobj(read_across_frames=True)
+            .decompress(data),
+        }
+        for algorithm, decompress_archive in decompress.items():
+            with self.subTest(algorithm=algorithm):
+                compressor = Compressor(
+                    algorithm, max_processes=2, engine="native", adaptive=True
+                )
+                tar_path, _ = compressor.compress_folder(self.files_dir)
+                with open(tar_path, "rb") as f:
+                    self._assert_adaptive_archive(decompress_archive(f.read()))
+                os.remove(tar_path)
+
+    def test_stored_blocks_are_not_compressed(self):
+        output = io.BytesIO()
+        with open_compressed_writer("gzip", output, threads=2) as writer:
+            writer.set_stored(True)
+            writer.write(self.contents["text.txt"])
+            writer.set_stored(False)
+            writer.write(self.contents["text.txt"])
+        stored_size = len(self.contents["text.txt"])
+        self.assertGreater(len(output.getvalue()), stored_size)
+        self.assertLess(len(output.getvalue()), stored_size * 1.1)
+        self.assertEqual(
+            gzip.decompress(output.getvalue()), self.contents["text.txt"] * 2
+        )
+
+    def test_lz4_has_no_stored_mode(self):
+        compressor = Compressor("lz4", engine="native", adaptive=True)
+        tar_path, _ = compressor.compress_folder(self.files_dir)
+        with open(tar_path, "rb") as f:
+            tar_data = decompress_lz4_frames(f.read())
+        with tarfile.open(fileobj=io.BytesIO(tar_data)) as tar:
+            for member in tar.getmembers():
+                self.assertNotIn(COMPRESSION_PAX_HEADER, member.pax_headers)
+
+    def test_streaming_archive_uses_mime_type(self):
+        output = FakeOutput()
+        archive = StreamingArchive(
+            Compressor("pzstd", engine="native", adaptive=True), lambda: output
+        )
+        archive.add(self._path("text.txt"), "files/text.txt", "video/mp4")
+        archive.close()
+        tar_data = (
+            zstandard.ZstdDecompressor()
+            .decompressobj(read_across_frames=True)
+            .decompress(output.closed_data)
+        )
+        with tarfile.open(fileobj=io.BytesIO(tar_data)) as tar:
+            member = tar.getmember("files/text.txt")
+            self.assertEqual(member.pax_headers[COMPRESSION_PAX_HEADER], "store")
+
+    def test_requires_native_engine(self):
+        with self.assertRaises(ValueError):
+            Compressor("pigz", engine="shell", adaptive=True)
+
+
 if __name__ == "__main__":
     unittest.main()
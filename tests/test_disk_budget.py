@@ -0,0 +1,50 @@
+import threading
+import unittest
+from multiprocessing import Manager
+
+from src.utils.disk_budget import DiskBudget
+
+
+class TestDiskBudget(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.manager = Manager()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.manager.shutdown()
+
+    def test_reservations_fit_in_limit(self):
+        budget = DiskBudget(self.manager, 100)
+        self.assertTrue(budget.try_reserve(60))
+        self.assertFalse(budget.try_reserve(60))
+        self.assertTrue(budget.try_reserve(40))
+        self.assertTrue(budget.near_limit())
+        budget.release(60)
+        self.assertEqual(budget.used, 40)
+        self.assertFalse(budget.near_limit())
+
+    def test_oversized_reservation_runs_alone(self):
+        budget = DiskBudget(self.manager, 100)
+        self.assertTrue(budget.try_reserve(500))
+        self.assertFalse(budget.try_reserve(1))
+        budget.release(500)
+        self.assertEqual(budget.used, 0)
+
+    def test_reserve_waits_for_release(self):
+        budget = DiskBudget(self.manager, 100)
+        budget.reserve(80)
+        reserved = threading.Event()
+
+        def reserve():
+            budget.reserve(50, interval=0.01)
+            reserved.set()
+
+        threading.Thread(target=reserve, daemon=True).start()
+        self.assertFalse(reserved.wait(0.05))
+        budget.release(80)
+        self.assertTrue(reserved.wait(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
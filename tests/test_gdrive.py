@@ -0,0 +1,776 @@
+import copy
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from multiprocessing import Manager
+from unittest.mock import Mock, patch
+
+import requests
+from tenacity import wait_none
+
+from fake_drive import FOLDER_MIMETYPE, FakeDriveService
+from fake_s3 import FakeS3Client
+from src.aws.s3 import S3
+from src.aws.transfer import MAX_PARTS, MB
+from src.google.gdrive import DRIVE_TYPE, GDrive
+from src.google.folder_cache import folder_cache
+from src.google.permissions import permission_cache
+from src.google.rate_limits import PERMISSIONS, drive_rate_limits
+from src.google import retries
+from src.utils.bundler import Bundler
+from src.utils.claims import ClaimRegistry
+from src.utils.disk_budget import DiskBudget
+
+
+def folder(file_id, name, parent):
+    return {
+        "id": file_id,
+        "name": name,
+        "mimeType": FOLDER_MIMETYPE,
+        "parents": [parent],
+    }
+
+
+def binary(file_id, name, parent):
+    return {
+        "id": file_id,
+        "name": name,
+        "mimeType": "application/octet-stream",
+        "md5Checksum": f"md5-{file_id}",
+        "parents": [parent],
+    }
+
+
+def shortcut(file_id, target_id):
+    return {
+        "id": file_id,
+        "name": file_id,
+        "mimeType": "application/vnd.google-apps.shortcut",
+        "shortcutDetails": {"targetId": target_id},
+        "parents": ["drive-id"],
+    }
+
+
+# Files are listed before their folders on purpose
+DRIVE_FILES = [
+    binary("f1", "deep.bin", "c"),
+    binary("f2", "top.bin", "root-id"),
+    binary("f3", "orphan.bin", "someone-elses-folder"),
+    folder("c", "C", "b"),
+    binary("f4", "middle.bin", "b"),
+    folder("b", "B", "a"),
+    folder("a", "A", "root-id"),
+]
+
+EXPECTED_PATHS = {
+    "f1": "A/B/C",
+    "f2": "",
+    "f3": "",
+    "f4": "A/B",
+    "a": "",
+    "b": "A",
+    "c": "A/B",
+}
+
+
+class TestGDriveListing(unittest.TestCase):
+    def setUp(self):
+        self.drive = GDrive("user@example.com", None, DRIVE_TYPE.USER)
+
+    def _service(self):
+        return FakeDriveService(copy.deepcopy(DRIVE_FILES))
+
+    def test_fetch_file_list_builds_paths(self):
+        with patch("src.google.gdrive.build", return_value=self._service()):
+            self.drive.fetch_file_list(page_size=2)
+        paths = {file_id: f["path"] for file_id, f in self.drive.files.items()}
+        self.assertEqual(paths, EXPECTED_PATHS)
+
+    def test_stream_download_all_files(self):
+        downloaded = {}
+        lock = threading.Lock()
+
+        def download_file(file, base_path):
+            with lock:
+                downloaded[file["id"]] = file["path"]
+
+        service = self._service()
+        with (
+            patch("src.google.gdrive.build", return_value=service),
+            patch.object(self.drive, "download_file", side_effect=download_file),
+        ):
+            self.drive.stream_download_all_files("downloads", threads=2, page_size=2)
+
+        self.assertEqual(downloaded, EXPECTED_PATHS)
+        self.assertEqual(len(self.drive.files), len(DRIVE_FILES))
+        self.assertIn(
+            ("files.list", {"fields": unittest.mock.ANY, "orderBy": "folder"}),
+            service.calls,
+        )
+
+
+class TestGDriveChanges(unittest.TestCase):
+    def _fetch_previous(self, drive, service):
+        with patch("src.google.gdrive.build", return_value=service):
+            token = drive.get_start_page_token()
+            drive.fetch_file_list()
+        previous_files = copy.deepcopy(drive.files)
+        for file in previous_files.values():
+            if file["mimeType"] != FOLDER_MIMETYPE:
+                file["backup_path"] = f"files/{file['name']}"
+        return token, previous_files
+
+    def test_fetch_changes_user_drive(self):
+        service = FakeDriveService(copy.deepcopy(DRIVE_FILES))
+        drive = GDrive("user@example.com", None, DRIVE_TYPE.USER)
+        token, previous_files = self._fetch_previous(drive, service)
+
+        service.update_file(binary("f5", "new.bin", "c"))
+        service.update_file({**folder("b", "Renamed", "a")})
+        service.remove_file("f2")
+
+        drive = GDrive("user@example.com", None, DRIVE_TYPE.USER)
+        with patch("src.google.gdrive.build", return_value=service):
+            changed_ids, new_token = drive.fetch_changes(token, previous_files)
+
+        self.assertEqual(changed_ids, {"f5", "b"})
+        self.assertEqual(new_token, "3")
+        self.assertNotIn("f2", drive.files)
+        self.assertEqual(drive.files["f5"]["path"], "A/Renamed/C")
+        self.assertEqual(drive.files["f1"]["path"], "A/Renamed/C")
+        self.assertEqual(drive.files["f4"]["path"], "A/Renamed")
+
+    def test_fetch_changes_retries_files_missing_from_previous_backup(self):
+        service = FakeDriveService(copy.deepcopy(DRIVE_FILES))
+        drive = GDrive("user@example.com", None, DRIVE_TYPE.USER)
+        token, previous_files = self._fetch_previous(drive, service)
+        # Download failed (f2), refused by Drive (f3) or content addressed
+        # (f4) last time
+        del previous_files["f2"]["backup_path"]
+        del previous_files["f3"]["backup_path"]
+        previous_files["f3"]["unavailable"] = "no download permission"
+        del previous_files["f4"]["backup_path"]
+        previous_files["f4"]["blob"] = "blobs/md5-f4"
+
+        drive = GDrive("user@example.com", None, DRIVE_TYPE.USER)
+        with patch("src.google.gdrive.build", return_value=service):
+            changed_ids, _ = drive.fetch_changes(token, previous_files)
+        self.assertEqual(changed_ids, {"f2"})
+
+        with (
+            tempfile.TemporaryDirectory() as base_path,
+            patch.object(drive, "download_file") as download_file,
+        ):
+            drive.download_all_files(base_path, file_ids=changed_ids)
+        self.assertEqual(
+            [call.args[0]["id"] for call in download_file.call_args_list], ["f2"]
+        )
+
+    def test_fetch_changes_shared_drive(self):
+        service = FakeDriveService(copy.deepcopy(DRIVE_FILES))
+        drive = GDrive("drive-id", None, DRIVE_TYPE.SHARED)
+        token, previous_files = self._fetch_previous(drive, service)
+
+        service.update_file({**binary("f1", "deep.bin", "c"), "permissionIds": ["p1"]})
+        service.remove_file("f1")
+        service.update_file({**binary("f6", "other.bin", "a"), "permissionIds": ["p2"]})
+
+        drive = GDrive("drive-id", None, DRIVE_TYPE.SHARED)
+        with patch("src.google.gdrive.build", return_value=service):
+            changed_ids, _ = drive.fetch_changes(token, previous_files)
+
+        self.assertEqual(changed_ids, {"f6"})
+        self.assertNotIn("f1", drive.files)
+        self.assertEqual(
+            drive.files["f6"]["permissions"], [{"id": "p2", "role": "reader"}]
+        )
+        self.assertIn(
+            (
+                "changes.getStartPageToken",
+                {"driveId": "drive-id", "supportsAllDrives": True},
+            ),
+            service.calls,
+        )
+
+
+class TestGDriveContentAddressedStorage(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.client = FakeS3Client()
+        self.registry = ClaimRegistry(os.path.join(self.test_dir, ".blobs"))
+        self.base_path = os.path.join(self.test_dir, "drive", "files")
+        # Drives share the S3 client of the process
+        shared_clients = patch.dict("src.aws.s3._shared", clear=True)
+        shared_clients.start()
+        self.addCleanup(shared_clients.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _drive(self, drive_id):
+        drive = GDrive(
+            drive_id,
+            None,
+            DRIVE_TYPE.USER,
+            jit_s3_upload=True,
+            s3_bucket_name="bucket",
+            content_addressed_storage=True,
+        )
+        drive.blob_registry = self.registry
+        drive._files_fetched = True
+        return drive
+
+    def _download(self, file, base_path):
+        path = os.path.join(base_path, file["name"])
+        os.makedirs(base_path, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"content")
+        self.downloads.append(file["id"])
+        return path
+
+    def test_blob_downloaded_once_across_drives(self):
+        self.downloads = []
+        files = [
+            {**binary("f1", "a.bin", "root-id"), "md5Checksum": "abcdef"},
+            {**binary("f2", "b.bin", "root-id"), "md5Checksum": "abcdef"},
+        ]
+        for i, file in enumerate(files):
+            drive = self._drive(f"user{i}@example.com")
+            drive.files[file["id"]] = file
+            with (
+                patch("src.aws.s3.boto3.client", return_value=self.client),
+                patch.object(drive, "download_binary_file", side_effect=self._download),
+            ):
+                drive.download_all_files(self.base_path, threads=1)
+
+        self.assertEqual(self.downloads, ["f1"])
+        self.assertEqual(self.client.objects["blobs/ab/abcdef"], b"content")
+        self.assertEqual(files[0]["blob"], "blobs/ab/abcdef")
+        self.assertEqual(files[1]["blob"], "blobs/ab/abcdef")
+        self.assertNotIn("backup_path", files[0])
+        self.assertFalse(os.listdir(self.base_path))
+
+    def test_blob_already_in_s3(self):
+        self.downloads = []
+        self.client.objects["blobs/ab/abcdef"] = b"content"
+        file = {**binary("f1", "a.bin", "root-id"), "md5Checksum": "abcdef"}
+        drive = self._drive("user@example.com")
+        drive.files[file["id"]] = file
+        with (
+            patch("src.aws.s3.boto3.client", return_value=self.client),
+            patch.object(drive, "download_binary_file", side_effect=self._download),
+        ):
+            drive.download_all_files(self.base_path, threads=1)
+        self.assertEqual(self.downloads, [])
+        self.assertEqual(file["blob"], "blobs/ab/abcdef")
+
+    def test_blob_claimed_by_failed_worker_is_downloaded(self):
+        self.downloads = []
+        self.registry.claim("abcdef")
+        threading.Timer(0.05, self.registry.release, args=("abcdef",)).start()
+        file = {**binary("f1", "a.bin", "root-id"), "md5Checksum": "abcdef"}
+        drive = self._drive("user@example.com")
+        drive.files[file["id"]] = file
+        with (
+            patch("src.aws.s3.boto3.client", return_value=self.client),
+            patch.object(drive, "download_binary_file", side_effect=self._download),
+        ):
+            drive.download_all_files(self.base_path, threads=1)
+        self.assertEqual(self.downloads, ["f1"])
+        self.assertEqual(file["blob"], "blobs/ab/abcdef")
+
+    def _download_with_live_claim(self, blob_content=None):
+        self.downloads = []
+        if blob_content is not None:
+            self.client.objects["blobs/ab/abcdef"] = blob_content
+        self.registry.claim("abcdef")
+        file = {**binary("f1", "a.bin", "root-id"), "md5Checksum": "abcdef"}
+        drive = self._drive("user@example.com")
+        drive.files[file["id"]] = file
+        wait_all = self.registry.wait_all
+        with (
+            patch("src.aws.s3.boto3.client", return_value=self.client),
+            patch.object(drive, "download_binary_file", side_effect=self._download),
+            patch.object(
+                self.registry,
+                "wait_all",
+                lambda keys: wait_all(keys, timeout=0.05, interval=0.01),
+            ),
+        ):
+            drive.download_all_files(self.base_path, threads=1)
+        return file
+
+    def test_blob_stored_by_slow_worker(self):
+        file = self._download_with_live_claim(b"content")
+        self.assertEqual(self.downloads, [])
+        self.assertEqual(file["blob"], "blobs/ab/abcdef")
+
+    def test_blob_still_claimed_is_downloaded_as_plain_file(self):
+        file = self._download_with_live_claim()
+        self.assertEqual(self.downloads, ["f1"])
+        self.assertNotIn("blob", file)
+        self.assertEqual(file["backup_path"], "files/a.bin")
+        self.assertNotIn("blobs/ab/abcdef", self.client.objects)
+
+    def test_blob_claimed_by_dead_worker_is_taken_over(self):
+        self.downloads = []
+        process = subprocess.Popen(["true"])
+        process.wait()
+        with open(self.registry._marker("abcdef", "claim"), "w") as f:
+            f.write(str(process.pid))
+        file = {**binary("f1", "a.bin", "root-id"), "md5Checksum": "abcdef"}
+        drive = self._drive("user@example.com")
+        drive.files[file["id"]] = file
+        with (
+            patch("src.aws.s3.boto3.client", return_value=self.client),
+            patch.object(drive, "download_binary_file", side_effect=self._download),
+        ):
+            drive.download_all_files(self.base_path, threads=1)
+        self.assertEqual(self.downloads, ["f1"])
+        self.assertEqual(file["blob"], "blobs/ab/abcdef")
+        self.assertEqual(self.client.objects["blobs/ab/abcdef"], b"content")
+
+
+class TestGDrivePermissions(unittest.TestCase):
+    def setUp(self):
+        permission_cache.clear()
+        self.files = [
+            {
+                **binary(f"f{i}", f"{i}.bin", "drive-id"),
+                "permissionIds": [f"p{i % 250}", "p-common"],
+            }
+            for i in range(500)
+        ]
+
+    def tearDown(self):
+        permission_cache.clear()
+
+    def _list(self, drive_id, service):
+        drive = GDrive(drive_id, None, DRIVE_TYPE.SHARED)
+        with patch("src.google.gdrive.build", return_value=service):
+            drive.fetch_file_list()
+        return drive
+
+    def test_permissions_fetched_in_batches(self):
+        service = FakeDriveService(copy.deepcopy(self.files))
+        drive = self._list("drive-id", service)
+
+        batches = [call[1] for call in service.calls if call[0] == "batch"]
+        self.assertEqual(sum(batches), 251)
+        self.assertTrue(all(size <= 100 for size in batches))
+        self.assertEqual(
+            drive.files["f3"]["permissions"],
+            [{"id": "p3", "role": "reader"}, {"id": "p-common", "role": "reader"}],
+        )
+
+    def test_batched_lookups_draw_from_permission_budget(self):
+        buckets = Mock(reserve=Mock(return_value=0.0))
+        drive_rate_limits.share(buckets)
+        self.addCleanup(drive_rate_limits.share, None)
+        self._list("drive-id", FakeDriveService(copy.deepcopy(self.files)))
+        self.assertEqual(
+            sorted(call.args for call in buckets.reserve.call_args_list),
+            [(PERMISSIONS, 51), (PERMISSIONS, 100), (PERMISSIONS, 100)],
+        )
+
+    def test_permission_cache_shared_across_drives(self):
+        self._list("drive-1", FakeDriveService(copy.deepcopy(self.files)))
+        service = FakeDriveService(copy.deepcopy(self.files))
+        drive = self._list("drive-2", service)
+        self.assertFalse([call for call in service.calls if call[0] == "batch"])
+        self.assertEqual(len(drive.files["f1"]["permissions"]), 2)
+
+    def test_failed_batch_lookups_are_retried(self):
+        service = FakeDriveService(copy.deepcopy(self.files[:10]))
+        service.permission_failures = {"p3": 1}
+        drive = self._list("drive-id", service)
+        self.assertEqual(
+            drive.files["f3"]["permissions"][0], {"id": "p3", "role": "reader"}
+        )
+
+
+class TestGDriveShortcuts(unittest.TestCase):
+    def setUp(self):
+        folder_cache.clear()
+        self.test_dir = tempfile.mkdtemp()
+        self.other_drive_files = [
+            {**folder("other-root", "Drive", None), "parents": None},
+            folder("x", "X", "other-root"),
+            binary("target-outside", "t.bin", "x"),
+        ]
+        for f in self.other_drive_files:
+            if f["parents"] is None:
+                del f["parents"]
+        self.drive_files = [
+            folder("a", "A", "drive-id"),
+            folder("b", "B", "a"),
+            binary("target", "t.bin", "b"),
+            {"id": "drive-id", "name": "Drive", "mimeType": FOLDER_MIMETYPE},
+        ]
+        shortcuts = [
+            shortcut(f"s{i}", target)
+            for i, target in enumerate(["target"] * 5 + ["target-outside"] * 5)
+        ]
+        self.service = FakeDriveService(
+            self.drive_files + self.other_drive_files + shortcuts
+        )
+        self.service.drive_names = {"drive-id": "Team", "other-root": "Other team"}
+        self.drive = GDrive("drive-id", None, DRIVE_TYPE.SHARED)
+        self.drive._files_fetched = True
+        for f in copy.deepcopy(self.drive_files[:3] + shortcuts):
+            f["path"] = ""
+            self.drive.files[f["id"]] = f
+
+    def tearDown(self):
+        folder_cache.clear()
+        shutil.rmtree(self.test_dir)
+
+    def _download_shortcuts(self):
+        with (
+            patch("src.google.gdrive.build", return_value=self.service),
+            patch.object(self.drive, "download_binary_file", return_value=None),
+        ):
+            self.drive.download_all_files(self.test_dir, threads=4)
+        paths = {}
+        for i in range(10):
+            with open(os.path.join(self.test_dir, f"s{i}.lnk.txt")) as f:
+                paths[f"s{i}"] = f.read()
+        return paths
+
+    def test_shortcut_paths_use_listed_files_and_cache(self):
+        paths = self._download_shortcuts()
+        self.assertEqual(paths["s0"], "Team/A/B")
+        self.assertEqual(paths["s9"], "Other team/X")
+        fetched = [call[1] for call in self.service.calls if call[0] == "files.get"]
+        self.assertEqual(
+            sorted(set(fetched)), ["drive-id", "other-root", "target-outside", "x"]
+        )
+        self.assertLessEqual(len(fetched), 4 * 4)
+        drive_lookups = [call for call in self.service.calls if call[0] == "drives.get"]
+        self.assertLessEqual(len(drive_lookups), 2 * 4)
+
+    def test_prefetch_shortcut_targets(self):
+        self.drive.batch_shortcut_lookups = True
+        paths = self._download_shortcuts()
+        self.assertEqual(paths["s9"], "Other team/X")
+        fetched = [call[1] for call in self.service.calls if call[0] == "files.get"]
+        self.assertEqual(fetched.count("target-outside"), 1)
+        self.assertEqual(fetched.count("x"), 1)
+        self.assertTrue(any(call[0] == "batch" for call in self.service.calls))
+
+    def test_my_drive_root_uses_folder_name(self):
+        service = FakeDriveService([{"id": "root-id", "name": "My Drive"}])
+        drive = GDrive("user@example.com", None, DRIVE_TYPE.USER)
+        drive._files_fetched = True
+        drive.files["f1"] = binary("f1", "a.bin", "root-id")
+        self.assertEqual(drive.fetch_file_path("f1", service), "My Drive")
+
+
+class FakeExportResponse:
+    def __init__(self, status_code, chunks, fail_after=None):
+        self.status_code = status_code
+        self.chunks = chunks
+        self.fail_after = fail_after
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(response=self)
+
+    def iter_content(self, chunk_size):
+        for i, chunk in enumerate(self.chunks):
+            if i == self.fail_after:
+                raise requests.exceptions.ChunkedEncodingError("connection reset")
+            yield chunk
+
+
+class FakeExportSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.ranges = []
+
+    def get(self, url, stream=False, headers=None):
+        self.ranges.append((headers or {}).get("Range"))
+        return self.responses.pop(0)
+
+
+class FakeChunkDownloader:
+    """Writes one chunk per call and fails on the calls listed in `failures`,
+    like MediaIoBaseDownload it only advances after a chunk is written."""
+
+    def __init__(self, chunks, failures):
+        self.chunks = chunks
+        self.failures = failures
+        self.calls = 0
+        self.progress = 0
+
+    def __call__(self, fd, request, chunksize=None):
+        self.fd = fd
+        return self
+
+    def next_chunk(self):
+        self.calls += 1
+        if self.calls in self.failures:
+            raise ConnectionError("connection reset")
+        self.fd.write(self.chunks[self.progress])
+        self.progress += 1
+        return None, self.progress == len(self.chunks)
+
+
+class TestGDriveDownloadRetries(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.drive = GDrive("user@example.com", None, DRIVE_TYPE.USER)
+        self.path = os.path.join(self.test_dir, "files", "doc.pdf")
+        self.wait_patch = patch.object(retries, "DOWNLOAD_RETRY_WAIT", wait_none())
+        self.wait_patch.start()
+
+    def tearDown(self):
+        self.wait_patch.stop()
+        shutil.rmtree(self.test_dir)
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_binary_download_resumes_after_error(self):
+        downloader = FakeChunkDownloader([b"aa", b"bb", b"cc"], failures={2, 3})
+        with patch("src.google.gdrive.MediaIoBaseDownload", downloader):
+            path = self.drive.write_request_to_file("f1", None, self.path)
+        self.assertEqual(self._read(path), b"aabbcc")
+        self.assertEqual(downloader.calls, 5)
+
+    def test_binary_download_gives_up_and_removes_partial_file(self):
+        downloader = FakeChunkDownloader([b"aa", b"bb"], failures=set(range(2, 10)))
+        with (
+            patch("src.google.gdrive.MediaIoBaseDownload", downloader),
+            self.assertRaises(ConnectionError),
+        ):
+            self.drive.write_request_to_file("f1", None, self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_export_link_resumes_with_range_request(self):
+        session = FakeExportSession(
+            [
+                FakeExportResponse(200, [b"aa", b"bb"], fail_after=1),
+                FakeExportResponse(206, [b"bb"]),
+            ]
+        )
+        with patch.object(self.drive, "_get_auth_session", return_value=session):
+            path = self.drive.download_via_export_link("f1", "link", self.path)
+        self.assertEqual(self._read(path), b"aabb")
+        self.assertEqual(session.ranges, [None, "bytes=2-"])
+
+    def test_export_link_restarts_when_range_is_ignored(self):
+        session = FakeExportSession(
+            [
+                FakeExportResponse(503, []),
+                FakeExportResponse(200, [b"aa", b"bb"], fail_after=1),
+                FakeExportResponse(200, [b"aa", b"bb"]),
+            ]
+        )
+        with patch.object(self.drive, "_get_auth_session", return_value=session):
+            path = self.drive.download_via_export_link("f1", "link", self.path)
+        self.assertEqual(self._read(path), b"aabb")
+
+    def test_export_link_does_not_retry_permanent_errors(self):
+        session = FakeExportSession([FakeExportResponse(404, [])])
+        with (
+            patch.object(self.drive, "_get_auth_session", return_value=session),
+            self.assertRaises(requests.HTTPError),
+        ):
+            self.drive.download_via_export_link("f1", "link", self.path)
+        self.assertEqual(len(session.ranges), 1)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_refused_files_are_marked_unavailable(self):
+        base_path = os.path.join(self.test_dir, "files")
+        for status, unavailable in ((404, True), (503, False), (429, False)):
+            file = binary("f1", "doc.bin", "root-id")
+            error = requests.HTTPError(response=FakeExportResponse(status, []))
+            with patch.object(self.drive, "download_binary_file", side_effect=error):
+                self.drive.download_file(file, base_path)
+            self.assertEqual("unavailable" in file, unavailable, status)
+
+
+class TestGDriveZeroStagingUploads(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.client = FakeS3Client()
+        with patch("src.aws.s3.boto3.client", return_value=self.client):
+            self.s3 = S3("bucket", "key", "secret")
+        self.drive = GDrive(
+            "user@example.com",
+            None,
+            DRIVE_TYPE.USER,
+            jit_s3_upload=True,
+            zero_staging_uploads=True,
+            upload_part_size=5 * 1024 * 1024,
+            upload_buffers=2,
+        )
+        self.drive._get_s3_service = lambda: self.s3
+        self.path = os.path.join(self.test_dir, "files", "doc.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_download_is_streamed_to_s3(self):
+        downloader = FakeChunkDownloader([b"aa", b"bb"], failures={2})
+        with patch("src.google.gdrive.MediaIoBaseDownload", downloader):
+            path = self.drive.write_request_to_file("f1", None, self.path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.client.objects[self.drive._s3_key(path)], b"aabb")
+
+    def test_large_file_is_streamed_in_larger_parts(self):
+        # A 200GB file can't fit in 10000 parts of 16MB
+        size = 200 * 1024**3
+        writer = self.drive._open_s3_output("key", None, size)
+        self.assertGreater(writer.part_size, 16 * MB)
+        self.assertGreaterEqual(writer.part_size * MAX_PARTS, size)
+
+        data = os.urandom(12 * MB)
+        chunks = [data[i : i + MB] for i in range(0, len(data), MB)]
+        downloader = FakeChunkDownloader(chunks, failures=set())
+        with (
+            patch("src.aws.transfer.MAX_PARTS", 2),
+            patch("src.google.gdrive.MediaIoBaseDownload", downloader),
+        ):
+            path = self.drive.write_request_to_file(
+                "f1", None, self.path, size=len(data)
+            )
+        self.assertEqual(self.client.objects[self.drive._s3_key(path)], data)
+        parts = [call for call in self.client.calls if call[0] == "upload_part"]
+        self.assertEqual(len(parts), 2)
+
+    def test_export_link_is_streamed_to_s3(self):
+        session = FakeExportSession([FakeExportResponse(200, [b"aa", b"bb"])])
+        with patch.object(self.drive, "_get_auth_session", return_value=session):
+            path = self.drive.download_via_export_link("f1", "link", self.path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.client.objects[self.drive._s3_key(path)], b"aabb")
+
+
+class TestGDriveDiskBudget(unittest.TestCase):
+    def setUp(self):
+        self.manager = Manager()
+        self.budget = DiskBudget(self.manager, 1000)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def _drive(self, jit_s3_upload):
+        drive = GDrive(
+            "user@example.com", None, DRIVE_TYPE.USER, jit_s3_upload=jit_s3_upload
+        )
+        drive.disk_budget = self.budget
+        drive._files_fetched = True
+        drive.files["f1"] = {**binary("f1", "a.bin", "root-id"), "size": "300"}
+        drive.files["f2"] = {**binary("f2", "b.bin", "root-id"), "size": "200"}
+        return drive
+
+    def test_staged_drive_holds_its_size_until_released(self):
+        drive = self._drive(jit_s3_upload=False)
+        with patch.object(drive, "download_file"):
+            drive.download_all_files("downloads", threads=2)
+        self.assertEqual(self.budget.used, 500)
+        drive.release_staged_bytes()
+        self.assertEqual(self.budget.used, 0)
+
+    def test_compressed_drive_holds_room_for_its_archive(self):
+        drive = self._drive(jit_s3_upload=False)
+        drive.expected_archive_size = lambda size: size
+        with patch.object(drive, "download_file"):
+            drive.download_all_files("downloads", threads=2)
+        self.assertEqual(self.budget.used, 1000)
+        drive.release_staged_bytes()
+        self.assertEqual(self.budget.used, 0)
+
+    def test_jit_files_release_their_size_after_upload(self):
+        drive = self._drive(jit_s3_upload=True)
+        used = []
+        with patch.object(
+            drive, "download_file", side_effect=lambda *_: used.append(self.budget.used)
+        ):
+            drive.download_all_files("downloads", threads=1)
+        self.assertEqual(sorted(used), [200, 300])
+        self.assertEqual(self.budget.used, 0)
+
+
+class TestGDriveBundles(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.drive_path = os.path.join(self.test_dir, "downloads", "drive")
+        self.base_path = os.path.join(self.drive_path, "files")
+        self.client = FakeS3Client()
+        with patch("src.aws.s3.boto3.client", return_value=self.client):
+            self.s3 = S3("bucket", "key", "secret")
+        self.drive = GDrive(
+            "user@example.com", None, DRIVE_TYPE.USER, jit_s3_upload=True
+        )
+        self.drive._get_s3_service = lambda: self.s3
+        self.drive.bundler = Bundler(
+            os.path.join(self.drive_path, "bundles"), 100, 1024 * 1024, 60
+        )
+        self.drive._files_fetched = True
+        self.contents = {"f1": b"small", "f2": b"tiny", "f3": b"large" * 100}
+        for file_id in self.contents:
+            self.drive.files[file_id] = binary(file_id, f"{file_id}.bin", "root-id")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _save(self, file, base_path):
+        path = os.path.join(base_path, file["name"])
+        os.makedirs(base_path, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(self.contents[file["id"]])
+        return path
+
+    def test_small_files_are_bundled(self):
+        with patch.object(self.drive, "download_binary_file", side_effect=self._save):
+            # One bundle across calls, e.g. scheduler chunks
+            self.drive.download_all_files(self.base_path, threads=2, file_ids=["f1"])
+            self.drive.download_all_files(
+                self.base_path, threads=2, file_ids=["f2", "f3"]
+            )
+            self.assertNotIn("bundle", self.drive.files["f1"])
+            self.drive.flush_bundle(self.base_path)
+
+        large = self.drive.files["f3"]
+        self.assertNotIn("bundle", large)
+        large_key = self.drive._s3_key(os.path.join(self.base_path, "f3.bin"))
+        self.assertEqual(self.client.objects[large_key], self.contents["f3"])
+
+        bundle_paths = set()
+        for file_id in ("f1", "f2"):
+            file = self.drive.files[file_id]
+            self.assertEqual(file["backup_path"], f"files/{file_id}.bin")
+            location = file["bundle"]
+            bundle_paths.add(location["path"])
+            key = self.drive._s3_key(os.path.join(self.drive_path, location["path"]))
+            data = self.client.objects[key]
+            self.assertEqual(
+                data[location["offset"] : location["offset"] + location["size"]],
+                self.contents[file_id],
+            )
+        self.assertEqual(len(bundle_paths), 1)
+        self.assertEqual(os.listdir(os.path.join(self.drive_path, "bundles")), [])
+        self.assertEqual(os.listdir(self.base_path), [])
+
+    def test_failed_bundle_upload_is_recorded(self):
+        with (
+            patch.object(self.drive, "download_binary_file", side_effect=self._save),
+            patch.object(self.client, "upload_file", side_effect=RuntimeError("down")),
+        ):
+            self.drive.download_all_files(self.base_path, threads=1)
+            self.drive.flush_bundle(self.base_path)
+        for file_id in ("f1", "f2", "f3"):
+            self.assertNotIn("backup_path", self.drive.files[file_id])
+        with open(os.path.join(self.base_path, "errors.txt")) as f:
+            self.assertIn("bundles", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import unittest
+
+from src.utils.memory_budget import (
+    DEFAULT_CHUNK_SIZE,
+    MIN_CHUNK_SIZE,
+    MemoryBudget,
+)
+
+MB = 1024 * 1024
+
+
+class TestMemoryBudget(unittest.TestCase):
+    def test_chunk_size_fits_all_threads(self):
+        self.assertEqual(MemoryBudget(0, 20).chunk_size, DEFAULT_CHUNK_SIZE)
+        self.assertEqual(MemoryBudget(200 * MB, 20).chunk_size, 10 * MB)
+        self.assertEqual(MemoryBudget(10 * MB, 20).chunk_size, MIN_CHUNK_SIZE)
+        self.assertEqual(MemoryBudget(8000 * MB, 20).chunk_size, DEFAULT_CHUNK_SIZE)
+
+    def test_reserve_waits_for_budget(self):
+        budget = MemoryBudget(10 * MB, 2)
+        reserved = threading.Event()
+
+        def reserve():
+            with budget.reserve(6 * MB):
+                reserved.set()
+
+        with budget.reserve(6 * MB):
+            threading.Thread(target=reserve, daemon=True).start()
+            self.assertFalse(reserved.wait(0.05))
+        self.assertTrue(reserved.wait(1))
+        self.assertEqual(budget.used, 0)
+
+    def test_reservation_larger_than_budget_is_clamped(self):
+        budget = MemoryBudget(10 * MB, 2)
+        with budget.reserve(100 * MB):
+            self.assertEqual(budget.used, 10 * MB)
+
+    def test_async_reservation_is_woken_by_threads(self):
+        budget = MemoryBudget(10 * MB, 2)
+
+        async def download():
+            async with budget.reserve_async(6 * MB):
+                return budget.used
+
+        async def main():
+            with budget.reserve(6 * MB):
+                waiting = asyncio.ensure_future(download())
+                await asyncio.sleep(0.05)
+                self.assertFalse(waiting.done())
+            return await asyncio.wait_for(waiting, 1)
+
+        self.assertEqual(asyncio.run(main()), 6 * MB)
+        self.assertEqual(budget.used, 0)
+
+    def test_disabled_budget_never_waits(self):
+        budget = MemoryBudget()
+        with budget.reserve(100 * MB), budget.reserve(100 * MB):
+            self.assertEqual(budget.used, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from fake_s3 import FakeS3Client
+from src.aws.multipart import MIN_PART_SIZE, BufferPool, MultipartUploadWriter
+
+PART_SIZE = MIN_PART_SIZE
+
+
+class TestBufferPool(unittest.TestCase):
+    def test_acquire_blocks_until_release(self):
+        pool = BufferPool(1, PART_SIZE)
+        buffer = pool.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            pool.acquire()
+            acquired.set()
+
+        threading.Thread(target=acquire, daemon=True).start()
+        self.assertFalse(acquired.wait(0.05))
+        pool.release(buffer)
+        self.assertTrue(acquired.wait(1))
+
+    def test_larger_parts_take_several_buffers(self):
+        pool = BufferPool(3, PART_SIZE)
+        buffer = pool.acquire(2 * PART_SIZE)
+        pool.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            pool.acquire()
+            acquired.set()
+
+        threading.Thread(target=acquire, daemon=True).start()
+        self.assertFalse(acquired.wait(0.05))
+        pool.release(buffer, 2 * PART_SIZE)
+        self.assertTrue(acquired.wait(1))
+
+    def test_part_size_limit(self):
+        with self.assertRaises(ValueError):
+            BufferPool(1, PART_SIZE - 1)
+
+
+class TestMultipartUploadWriter(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeS3Client()
+        self.pool = BufferPool(2, PART_SIZE)
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def _writer(self, key="key", expected_md5=None):
+        return MultipartUploadWriter(
+            self.client,
+            "bucket",
+            key,
+            self.pool,
+            self.executor,
+            expected_md5=expected_md5,
+        )
+
+    def test_small_object_uses_put_object(self):
+        with self._writer() as f:
+            f.write(b"hello")
+        self.assertEqual(self.client.objects["key"], b"hello")
+        self.assertEqual([call[0] for call in self.client.calls], ["put_object"])
+
+    def test_large_object_uploaded_in_parts(self):
+        data = bytes(range(256)) * (PART_SIZE * 5 // 2 // 256)
+        with self._writer() as f:
+            for i in range(0, len(data), 1024 * 1024):
+                f.write(data[i : i + 1024 * 1024])
+        self.assertEqual(self.client.objects["key"], data)
+        parts = [call for call in self.client.calls if call[0] == "upload_part"]
+        self.assertEqual(len(parts), 3)
+        # Every buffer went back to the pool
+        self.assertEqual(len(self.pool._available), self.pool._created)
+
+    def test_parts_grow_with_their_count(self):
+        data = os.urandom(PART_SIZE * 7)
+        with patch("src.aws.multipart.PARTS_PER_SIZE", 2):
+            with self._writer() as f:
+                f.write(data)
+        self.assertEqual(self.client.objects["key"], data)
+        # Two parts of each size: 1, 1, 2, 2 and the last one
+        parts = [call for call in self.client.calls if call[0] == "upload_part"]
+        self.assertEqual(len(parts), 5)
+        self.assertEqual(len(self.pool._available), self.pool._created)
+        self.assertEqual(self.pool._in_use, 0)
+
+    def test_error_aborts_upload(self):
+        with self.assertRaises(RuntimeError):
+            with self._writer() as f:
+                f.write(b"x" * (PART_SIZE + 1))
+                raise RuntimeError("download failed")
+        self.assertNotIn("key", self.client.objects)
+        self.assertEqual(self.client.uploads, {})
+        self.assertIn(("abort_multipart_upload", "key"), self.client.calls)
+
+    def test_checksum_mismatch_is_not_completed(self):
+        with self.assertRaises(ValueError):
+            with self._writer(expected_md5="0" * 32) as f:
+                f.write(b"hello")
+        self.assertNotIn("key", self.client.objects)
+
+    def test_truncate_restarts_upload(self):
+        with self._writer() as f:
+            f.write(b"x" * (PART_SIZE + 1))
+            f.seek(0)
+            f.truncate()
+            f.write(b"hello")
+        self.assertEqual(self.client.objects["key"], b"hello")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from src.google.path_resolver import PathResolver
+
+
+def folder(file_id, name, parent=None):
+    f = {"id": file_id, "name": name, "mimeType": "application/vnd.google-apps.folder"}
+    if parent is not None:
+        f["parents"] = [parent]
+    return f
+
+
+class TestPathResolver(unittest.TestCase):
+    def setUp(self):
+        self.files = {
+            "a": folder("a", "A", "root"),
+            "b": folder("b", "B", "a"),
+            "c": folder("c", "C", "b"),
+            "f1": {"id": "f1", "name": "file1.txt", "parents": ["c"]},
+            "f2": {"id": "f2", "name": "file2.txt", "parents": ["a"]},
+            "f3": {"id": "f3", "name": "file3.txt", "parents": ["root"]},
+            "f4": {"id": "f4", "name": "file4.txt"},
+        }
+        self.resolver = PathResolver(self.files)
+
+    def test_resolve_nested_file(self):
+        self.assertEqual(self.resolver.resolve("f1"), "A/B/C")
+        self.assertEqual(self.resolver.resolve("f2"), "A")
+
+    def test_resolve_file_in_unlisted_parent(self):
+        self.assertEqual(self.resolver.resolve("f3"), "")
+
+    def test_resolve_file_without_parents(self):
+        self.assertEqual(self.resolver.resolve("f4"), "")
+
+    def test_resolve_unknown_file(self):
+        self.assertIsNone(self.resolver.resolve("missing"))
+
+    def test_folder_paths_are_memoized(self):
+        self.resolver.resolve("f1")
+        self.files["a"]["name"] = "Renamed"
+        self.assertEqual(self.resolver.resolve("f2"), "A")
+        self.resolver.clear()
+        self.assertEqual(self.resolver.resolve("f2"), "Renamed")
+
+    def test_resolve_parent_cycle(self):
+        self.files["x"] = folder("x", "X", "y")
+        self.files["y"] = folder("y", "Y", "x")
+        self.files["f5"] = {"id": "f5", "name": "file5.txt", "parents": ["x"]}
+        self.assertEqual(self.resolver.resolve("f5"), "Y/X")
+        self.assertEqual(self.resolver.folder_path("y"), "Y")
+
+    def test_resolve_self_parent(self):
+        self.files["s"] = folder("s", "S", "s")
+        self.files["f6"] = {"id": "f6", "name": "file6.txt", "parents": ["s"]}
+        self.assertEqual(self.resolver.resolve("f6"), "S")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from tenacity import wait_none
+
+from src.google import retries
+
+from src.google.ranged_download import (
+    ChecksumMismatchError,
+    download_in_ranges,
+    split_into_segments,
+)
+
+
+class FakeResponse:
+    def __init__(self, status_code, content, fail_after=None):
+        self.status_code = status_code
+        self.content = content
+        self.fail_after = fail_after
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size):
+        if self.fail_after is not None:
+            chunk_size = self.fail_after
+        for i in range(0, len(self.content), chunk_size):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ConnectionError("connection reset")
+            yield self.content[i : i + chunk_size]
+
+
+class FakeRangeSession:
+    def __init__(self, content, support_ranges=True, fail_after=None, status=206):
+        self.content = content
+        self.support_ranges = support_ranges
+        self.fail_after = fail_after
+        self.status = status
+        self.ranges = []
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, stream=False):
+        if not self.support_ranges:
+            return FakeResponse(200, self.content)
+        start, end = headers["Range"].removeprefix("bytes=").split("-")
+        start, end = int(start), int(end)
+        with self._lock:
+            self.ranges.append((start, end))
+            fail_after, self.fail_after = self.fail_after, None
+        return FakeResponse(self.status, self.content[start : end + 1], fail_after)
+
+
+class TestRangedDownload(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "big.bin")
+        self.content = os.urandom(1000)
+        self.md5 = hashlib.md5(self.content).hexdigest()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_split_into_segments(self):
+        self.assertEqual(split_into_segments(10, 4), [(0, 3), (4, 7), (8, 9)])
+        self.assertEqual(split_into_segments(8, 4), [(0, 3), (4, 7)])
+
+    def test_downloads_all_segments_in_place(self):
+        session = FakeRangeSession(self.content)
+        download_in_ranges(
+            session, "url", self.path, len(self.content), self.md5, segment_size=128
+        )
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(len(session.ranges), 8)
+
+    def test_interrupted_segment_resumes_from_last_byte(self):
+        session = FakeRangeSession(self.content, fail_after=100)
+        with patch.object(retries, "DOWNLOAD_RETRY_WAIT", wait_none()):
+            download_in_ranges(
+                session,
+                "url",
+                self.path,
+                len(self.content),
+                self.md5,
+                threads=1,
+                segment_size=512,
+            )
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertIn((100, 511), session.ranges)
+
+    def test_checksum_mismatch(self):
+        session = FakeRangeSession(self.content)
+        with self.assertRaises(ChecksumMismatchError):
+            download_in_ranges(
+                session, "url", self.path, len(self.content), "0" * 32, segment_size=128
+            )
+
+    def test_failed_segment_cancels_the_others(self):
+        session = FakeRangeSession(self.content, status=404)
+        with (
+            patch.object(retries, "DOWNLOAD_RETRY_WAIT", wait_none()),
+            self.assertRaises(RuntimeError),
+        ):
+            download_in_ranges(
+                session,
+                "url",
+                self.path,
+                len(self.content),
+                self.md5,
+                threads=1,
+                segment_size=128,
+            )
+        # The only thread may have started the next segment before the error
+        # got to the caller, none of the later ones
+        self.assertLessEqual(len({start for start, _ in session.ranges}), 2)
+
+    def test_server_without_range_support(self):
+        session = FakeRangeSession(self.content, support_ranges=False)
+        with self.assertRaises(RuntimeError):
+            download_in_ranges(
+                session, "url", self.path, len(self.content), self.md5, segment_size=128
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+from unittest.mock import Mock, patch
+
+from src.google.rate_limits import (
+    EXPORT,
+    LISTING,
+    MEDIA,
+    PERMISSIONS,
+    DriveRateLimits,
+    request_kind,
+)
+
+API = "https://www.googleapis.com/drive/v3"
+
+
+class TestRateLimits(unittest.TestCase):
+    def test_request_kind(self):
+        self.assertEqual(request_kind(f"{API}/files?pageSize=1000"), LISTING)
+        self.assertEqual(request_kind(f"{API}/changes?pageToken=1"), LISTING)
+        self.assertEqual(request_kind(f"{API}/files/f1?fields=id"), LISTING)
+        self.assertEqual(
+            request_kind(f"{API}/files/f1/permissions?fields=*"), PERMISSIONS
+        )
+        self.assertEqual(request_kind(f"{API}/files/f1?alt=media"), MEDIA)
+        self.assertEqual(request_kind(f"{API}/files/f1/export?mimeType=x"), EXPORT)
+        self.assertEqual(
+            request_kind(f"{API}/files/f1/export?mimeType=x&alt=media"), EXPORT
+        )
+        self.assertEqual(
+            request_kind(
+                "https://docs.google.com/feeds/download/documents/export/Export?id=f1"
+            ),
+            EXPORT,
+        )
+        self.assertIsNone(
+            request_kind("https://admin.googleapis.com/admin/directory/v1/users")
+        )
+        # Charged per inner request instead
+        self.assertIsNone(request_kind("https://www.googleapis.com/batch/drive/v3"))
+
+    def test_waits_for_reservation(self):
+        limits = DriveRateLimits()
+        buckets = Mock(reserve=Mock(return_value=0.5))
+        with patch("src.google.rate_limits.time.sleep") as sleep:
+            limits.wait(f"{API}/files")
+            sleep.assert_not_called()
+            limits.share(buckets)
+            limits.wait(f"{API}/files/f1?alt=media")
+            limits.wait("https://admin.googleapis.com/admin/directory/v1/users")
+        buckets.reserve.assert_called_once_with(MEDIA, 1)
+        sleep.assert_called_once_with(0.5)
+
+    def test_batch_waits_for_every_inner_request(self):
+        limits = DriveRateLimits()
+        buckets = Mock(reserve=Mock(side_effect=lambda kind, count: count / 10))
+        limits.share(buckets)
+        with patch("src.google.rate_limits.time.sleep") as sleep:
+            limits.wait_batch(
+                [f"{API}/files/f{i}/permissions/p{i}" for i in range(30)]
+                + [f"{API}/files/f{i}" for i in range(5)]
+            )
+        self.assertEqual(
+            sorted(call.args for call in buckets.reserve.call_args_list),
+            [(LISTING, 5), (PERMISSIONS, 30)],
+        )
+        sleep.assert_called_once_with(3.0)
+
+    def test_waits_without_blocking_event_loop(self):
+        limits = DriveRateLimits()
+        limits.share(Mock(reserve=Mock(return_value=0.05)))
+
+        async def main():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            ticker = asyncio.ensure_future(tick())
+            await limits.wait_async(f"{API}/files/f1/export")
+            ticker.cancel()
+            return ticks
+
+        self.assertGreater(asyncio.run(main()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from multiprocessing import Manager
+
+from src.utils.scheduler import WorkQueues
+
+
+class TestWorkQueues(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.manager = Manager()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.manager.shutdown()
+
+    def setUp(self):
+        self.queues = WorkQueues(self.manager, ["small", "big", "empty"])
+
+    def test_home_drives_first(self):
+        self.queues.put("small", ["s1"])
+        self.queues.put("big", ["b1", "b2"])
+        self.assertEqual(self.queues.get(["small"]), ("small", "s1"))
+
+    def test_steal_from_biggest_drive(self):
+        self.queues.put("small", ["s1"])
+        self.queues.put("big", ["b1", "b2"])
+        self.assertEqual(self.queues.get(["empty"]), ("big", "b1"))
+        self.assertIn(self.queues.get(["empty"]), [("big", "b2"), ("small", "s1")])
+
+    def test_nothing_to_do(self):
+        self.assertIsNone(self.queues.get(["small"]))
+
+    def test_drive_finished_once(self):
+        self.queues.put("small", ["s1", "s2"])
+        self.assertFalse(self.queues.finish_listing("small"))
+        self.queues.get(["small"])
+        self.queues.get(["small"])
+        self.assertFalse(self.queues.task_done("small"))
+        self.assertTrue(self.queues.task_done("small"))
+
+    def test_drive_finished_before_listing_done(self):
+        self.queues.put("small", ["s1"])
+        self.queues.get(["small"])
+        self.assertFalse(self.queues.task_done("small"))
+        self.assertTrue(self.queues.finish_listing("small"))
+
+    def test_has_pending_until_listed_and_taken(self):
+        self.queues.put("small", ["s1"])
+        self.assertTrue(self.queues.has_pending("small"))
+        self.queues.get(["small"])
+        self.assertTrue(self.queues.has_pending("small"))
+        self.queues.finish_listing("small")
+        self.assertFalse(self.queues.has_pending("small"))
+
+    def test_all_done(self):
+        self.queues.put("small", ["s1"])
+        for drive_id in ["small", "big", "empty"]:
+            self.queues.finish_listing(drive_id)
+        self.assertFalse(self.queues.all_done())
+        self.queues.get([])
+        self.queues.task_done("small")
+        self.assertTrue(self.queues.all_done())
+
+
+if __name__ == "__main__":
+    unittest.main()
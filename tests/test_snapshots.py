@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tenacity import wait_none
+
+from fake_s3 import FakeS3Client
+from src.aws.s3 import S3
+from src.google.gdrive import DRIVE_TYPE, GDrive
+from src.utils.snapshots import load_previous_snapshot, reuse_unchanged_files
+
+DRIVE_ID = "user@example.com"
+
+
+def previous_manifest():
+    return {
+        "bin": {
+            "id": "bin",
+            "name": "photo.jpg",
+            "path": "A",
+            "md5Checksum": "aaa",
+            "backup_path": "files/A/photo.jpg",
+        },
+        "doc": {
+            "id": "doc",
+            "name": "Notes",
+            "path": "A",
+            "mimeType": "application/vnd.google-apps.document",
+            "version": "7",
+            "modifiedTime": "2024-01-01T00:00:00Z",
+            "backup_path": "files/A/Notes.docx",
+            "backup_timestamp": "20240101-000000",
+        },
+        "changed": {
+            "id": "changed",
+            "name": "data.csv",
+            "path": "",
+            "md5Checksum": "old",
+            "backup_path": "files/data.csv",
+        },
+    }
+
+
+class TestSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.client = FakeS3Client()
+        with patch("src.aws.s3.boto3.client", return_value=self.client):
+            self.s3 = S3("bucket", "key", "secret")
+        self.client.objects["20240102-000000/user@example.com/snapshot.json"] = (
+            json.dumps({"compressed": False}).encode()
+        )
+        self.client.objects["20240102-000000/user@example.com/files.json"] = json.dumps(
+            previous_manifest()
+        ).encode()
+        self.client.objects["20240102-000000/user@example.com/files/A/photo.jpg"] = (
+            b"jpg"
+        )
+        self.client.objects["20240101-000000/user@example.com/files/A/Notes.docx"] = (
+            b"docx"
+        )
+
+        self.drive = GDrive(DRIVE_ID, None, DRIVE_TYPE.USER)
+        self.drive._files_fetched = True
+        current = previous_manifest()
+        for file in current.values():
+            del file["backup_path"]
+            file.pop("backup_timestamp", None)
+        current["changed"]["md5Checksum"] = "new"
+        self.drive.files.update(current)
+        self.files_path = os.path.join(self.test_dir, DRIVE_ID, "files")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_load_previous_snapshot(self):
+        timestamp, snapshot, files = load_previous_snapshot(
+            self.s3, DRIVE_ID, before="20240103-000000"
+        )
+        self.assertEqual(timestamp, "20240102-000000")
+        self.assertEqual(snapshot, {"compressed": False})
+        self.assertEqual(files["bin"]["backup_timestamp"], "20240102-000000")
+        self.assertEqual(files["doc"]["backup_timestamp"], "20240101-000000")
+
+        self.assertEqual(
+            load_previous_snapshot(self.s3, DRIVE_ID, before="20240102-000000"),
+            (None, None, None),
+        )
+
+    def test_reuse_unchanged_files_copy(self):
+        _, _, files = load_previous_snapshot(self.s3, DRIVE_ID, "20240103-000000")
+        reused = reuse_unchanged_files(
+            self.drive, self.s3, files, "20240103-000000", self.files_path, "copy"
+        )
+        self.assertEqual(reused, {"bin", "doc"})
+        self.assertEqual(
+            self.client.objects["20240103-000000/user@example.com/files/A/photo.jpg"],
+            b"jpg",
+        )
+        self.assertEqual(
+            self.client.objects["20240103-000000/user@example.com/files/A/Notes.docx"],
+            b"docx",
+        )
+        self.assertEqual(self.drive.files["doc"]["backup_timestamp"], "20240103-000000")
+        self.assertNotIn("backup_path", self.drive.files["changed"])
+        self.assertIn(
+            os.path.join(self.test_dir, DRIVE_ID, "files/A/photo.jpg"),
+            self.drive.locked_files,
+        )
+
+    def test_reuse_unchanged_files_reference(self):
+        _, _, files = load_previous_snapshot(self.s3, DRIVE_ID, "20240103-000000")
+        reused = reuse_unchanged_files(
+            self.drive, self.s3, files, "20240103-000000", self.files_path, "reference"
+        )
+        self.assertEqual(reused, {"bin", "doc"})
+        self.assertFalse(any(call[0] == "copy" for call in self.client.calls))
+        self.assertEqual(self.drive.files["bin"]["backup_timestamp"], "20240102-000000")
+        self.assertEqual(self.drive.files["doc"]["backup_timestamp"], "20240101-000000")
+        self.assertEqual(self.drive.files["doc"]["backup_path"], "files/A/Notes.docx")
+
+    def test_reuse_falls_back_when_copy_fails(self):
+        del self.client.objects["20240102-000000/user@example.com/files/A/photo.jpg"]
+        _, _, files = load_previous_snapshot(self.s3, DRIVE_ID, "20240103-000000")
+        with patch.object(S3.copy_object.retry, "wait", wait_none()):
+            reused = reuse_unchanged_files(
+                self.drive, self.s3, files, "20240103-000000", self.files_path, "copy"
+            )
+        self.assertEqual(reused, {"doc"})
+        self.assertNotIn("backup_path", self.drive.files["bin"])
+        self.assertEqual(len(self.drive.locked_files), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
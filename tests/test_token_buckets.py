@@ -0,0 +1,54 @@
+import unittest
+from multiprocessing import Manager
+from unittest.mock import patch
+
+from src.utils.token_buckets import TokenBuckets
+
+
+class TestTokenBuckets(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.manager = Manager()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.manager.shutdown()
+
+    def setUp(self):
+        self.now = 100.0
+        patcher = patch("src.utils.token_buckets.time")
+        patcher.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_rate(self):
+        buckets = TokenBuckets(self.manager, {"media": 4})
+        self.assertEqual([buckets.reserve("media") for _ in range(4)], [0, 0, 0, 0])
+        # Requests past the burst are spaced out at the rate, in order
+        self.assertEqual(buckets.reserve("media"), 0.25)
+        self.assertEqual(buckets.reserve("media"), 0.5)
+        self.now += 0.5
+        self.assertEqual(buckets.reserve("media"), 0.25)
+        self.now += 10
+        self.assertEqual(buckets.reserve("media"), 0)
+
+    def test_reserve_several_tokens(self):
+        buckets = TokenBuckets(self.manager, {"permissions": 10})
+        self.assertEqual(buckets.reserve("permissions", 10), 0)
+        self.assertEqual(buckets.reserve("permissions", 20), 2)
+        self.assertEqual(buckets.reserve("permissions"), 2.1)
+
+    def test_kinds_have_separate_budgets(self):
+        buckets = TokenBuckets(self.manager, {"listing": 1, "export": 1})
+        self.assertEqual(buckets.reserve("listing"), 0)
+        self.assertEqual(buckets.reserve("listing"), 1)
+        self.assertEqual(buckets.reserve("export"), 0)
+
+    def test_kinds_without_rate_are_not_limited(self):
+        buckets = TokenBuckets(self.manager, {"listing": 1, "media": 0})
+        for _ in range(10):
+            self.assertEqual(buckets.reserve("media"), 0)
+            self.assertEqual(buckets.reserve("permissions"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
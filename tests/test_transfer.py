@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from tenacity import wait_none
+
+from fake_s3 import FakeS3Client
+from src.aws.s3 import S3, shared_s3
+from src.aws.transfer import (
+    MAX_PART_CONCURRENCY,
+    MAX_PARTS,
+    MB,
+    MIN_PART_SIZE,
+    MULTIPART_THRESHOLD,
+    transfer_config_for,
+)
+
+
+class TestTransferConfig(unittest.TestCase):
+    def test_small_files_use_single_request(self):
+        config = transfer_config_for(MULTIPART_THRESHOLD)
+        self.assertFalse(config.use_threads)
+        self.assertGreater(config.multipart_threshold, MULTIPART_THRESHOLD)
+
+    def test_part_concurrency_follows_size(self):
+        config = transfer_config_for(MIN_PART_SIZE * 2)
+        self.assertEqual(config.multipart_chunksize, MIN_PART_SIZE)
+        self.assertEqual(config.max_concurrency, 2)
+        config = transfer_config_for(MIN_PART_SIZE * 100)
+        self.assertEqual(config.max_concurrency, MAX_PART_CONCURRENCY)
+
+    def test_large_files_fit_in_part_limit(self):
+        size = 1024 * 1024 * MB  # 1TB
+        config = transfer_config_for(size)
+        self.assertLessEqual(-(-size // config.multipart_chunksize), MAX_PARTS)
+        self.assertEqual(config.multipart_chunksize % MB, 0)
+
+
+class TestUploadFolder(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.contents = {}
+        for i in range(20):
+            path = os.path.join(self.test_dir, f"folder{i % 3}", f"file{i}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.contents[path] = os.urandom(100 + i)
+            with open(path, "wb") as f:
+                f.write(self.contents[path])
+        self.client = FakeS3Client()
+        with patch("src.aws.s3.boto3.client", return_value=self.client):
+            self.s3 = S3("bucket", "key", "secret", max_pool_connections=64)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_uploads_files_concurrently(self):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+        upload_file = self.client.upload_file
+
+        def slow_upload(Filename, *args, **kwargs):
+            with lock:
+                in_flight.append(Filename)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            upload_file(Filename, *args, **kwargs)
+            with lock:
+                in_flight.remove(Filename)
+
+        with patch.object(self.client, "upload_file", side_effect=slow_upload):
+            size = self.s3.upload_folder(self.test_dir, "ts/drive", concurrency=4)
+
+        self.assertEqual(size, sum(len(c) for c in self.contents.values()))
+        self.assertLessEqual(max(peak), 4)
+        self.assertGreater(max(peak), 1)
+        for path, content in self.contents.items():
+            key = f"ts/drive{path.replace(self.test_dir, '')}"
+            self.assertEqual(self.client.objects[key], content)
+        # The largest files start first
+        self.assertEqual(self.client.calls[0][1], "ts/drive/folder1/file19")
+
+    def test_failed_file_is_retried_on_its_own(self):
+        upload_file = self.client.upload_file
+        failures = []
+
+        def flaky_upload(Filename, Bucket, Key, **kwargs):
+            if Key.endswith("/file7") and not failures:
+                failures.append(Key)
+                raise ConnectionError("Connection reset")
+            upload_file(Filename, Bucket, Key, **kwargs)
+
+        with (
+            patch.object(S3.upload_file.retry, "wait", wait_none()),
+            patch.object(self.client, "upload_file", side_effect=flaky_upload),
+        ):
+            self.s3.upload_folder(self.test_dir, "ts/drive", concurrency=4)
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(len(self.client.objects), len(self.contents))
+
+    def test_persistent_failure_is_raised(self):
+        with (
+            patch.object(S3.upload_file.retry, "wait", wait_none()),
+            patch.object(
+                self.client, "upload_file", side_effect=ConnectionError("Down")
+            ),
+            self.assertRaises(ConnectionError),
+        ):
+            self.s3.upload_folder(self.test_dir, "ts/drive", concurrency=4)
+
+
+class TestSharedS3(unittest.TestCase):
+    def setUp(self):
+        shared_clients = patch.dict("src.aws.s3._shared", clear=True)
+        shared_clients.start()
+        self.addCleanup(shared_clients.stop)
+
+    def test_one_client_for_all_threads(self):
+        with patch("src.aws.s3.boto3.client", return_value=FakeS3Client()) as client:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                clients = set(
+                    executor.map(
+                        lambda _: shared_s3("shared", "key", "secret", False, 64),
+                        range(32),
+                    )
+                )
+        self.assertEqual(len(clients), 1)
+        client.assert_called_once()
+        self.assertEqual(client.call_args.kwargs["config"].max_pool_connections, 64)
+
+    def test_client_per_settings_and_process(self):
+        with patch(
+            "src.aws.s3.boto3.client",
+            side_effect=lambda *args, **kwargs: FakeS3Client(),
+        ):
+            first = shared_s3("shared", "key", "secret")
+            self.assertIsNot(shared_s3("other", "key", "secret"), first)
+            self.assertIs(shared_s3("shared", "key", "secret"), first)
+            with patch("src.aws.s3.os.getpid", return_value=-1):
+                self.assertIsNot(shared_s3("shared", "key", "secret"), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from googleapiclient.discovery import build
+
+from fake_drive_server import FakeCredentials, FakeDriveServer
+from src.google.rate_limits import drive_rate_limits
+from src.google.transport import SessionHttp, authorized_session
+
+
+class TestTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeDriveServer().start()
+        self.endpoint = f"{self.server.api_url}/"
+        self.credentials = FakeCredentials()
+        self.session = authorized_session(self.credentials)
+        self.session.mount("http://", self.session.adapters["https://"])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _service(self):
+        return build(
+            "drive",
+            "v3",
+            http=SessionHttp(self.session),
+            client_options={"api_endpoint": self.endpoint},
+        )
+
+    def test_one_session_per_credentials(self):
+        self.assertIs(authorized_session(self.credentials), self.session)
+        other = authorized_session(FakeCredentials())
+        self.assertIsNot(other, self.session)
+        # Sessions of all drives share the connection pool
+        self.assertIs(other.adapters["https://"], self.session.adapters["https://"])
+
+    def test_threads_share_connections(self):
+        service = self._service()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(
+                    lambda i: service.files().get(fileId=f"file{i}").execute(),
+                    range(40),
+                )
+            )
+        self.assertEqual([r["id"] for r in results], [f"file{i}" for i in range(40)])
+        self.assertLessEqual(len(self.server.clients), 4)
+
+    def test_expired_token_is_refreshed(self):
+        service = self._service()
+        service.files().get(fileId="file1").execute()
+        self.server.rejected_tokens.add("Bearer token-1")
+        self.assertEqual(service.files().get(fileId="file2").execute()["id"], "file2")
+        self.assertEqual(self.credentials.refreshes, 2)
+        self.assertEqual(self.server.tokens[-1], "Bearer token-2")
+
+    def test_requests_wait_for_rate_limits(self):
+        service = self._service()
+        with patch.object(drive_rate_limits, "wait") as wait:
+            service.files().get(fileId="file1").execute()
+            self.session.get(f"{self.endpoint}files/file2?alt=media")
+        self.assertEqual(
+            [call.args[0].split("?")[0] for call in wait.call_args_list],
+            [f"{self.endpoint}files/file1", f"{self.endpoint}files/file2"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,246 @@
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from fake_s3 import FakeS3Client
+from src.aws.multipart import MIN_PART_SIZE, BufferPool
+from src.aws.s3 import S3
+from src.utils.archive_index import INDEX_SUFFIX, read_member
+from src.utils.compression_engine import decompress
+from src.utils.compressor import Compressor, StreamingArchive
+from src.utils.volumes import (
+    MANIFEST_SUFFIX,
+    VolumeUploader,
+    VolumeWriter,
+    read_range,
+    volume_name,
+)
+
+VOLUME_SIZE = 64 * 1024
+
+
+class ClosingBytesIO(io.BytesIO):
+    def close(self):
+        self.closed_data = self.getvalue()
+        super().close()
+
+
+class TestVolumeWriter(unittest.TestCase):
+    def test_split_into_volumes(self):
+        volumes = []
+        closed = []
+
+        def open_volume(number):
+            self.assertEqual(number, len(volumes))
+            volumes.append(ClosingBytesIO())
+            return volumes[-1]
+
+        data = os.urandom(VOLUME_SIZE * 2 + 100)
+        with VolumeWriter(open_volume, VOLUME_SIZE, closed.append) as writer:
+            for i in range(0, len(data), 1000):
+                writer.write(data[i : i + 1000])
+            # Full volumes are handed over before the archive is finished
+            self.assertEqual(closed, [0, 1])
+
+        self.assertEqual(closed, [0, 1, 2])
+        self.assertEqual(b"".join(v.closed_data for v in volumes), data)
+        manifest = writer.manifest("files.tar.zst")
+        self.assertEqual(manifest["size"], len(data))
+        self.assertEqual(
+            manifest["volumes"],
+            [
+                {"name": "files.tar.zst.0000", "size": VOLUME_SIZE},
+                {"name": "files.tar.zst.0001", "size": VOLUME_SIZE},
+                {"name": "files.tar.zst.0002", "size": 100},
+            ],
+        )
+
+    def test_exact_multiple_has_no_empty_volume(self):
+        closed = []
+        writer = VolumeWriter(lambda number: io.BytesIO(), VOLUME_SIZE, closed.append)
+        writer.write(b"x" * VOLUME_SIZE * 2)
+        writer.close()
+        self.assertEqual(closed, [0, 1])
+        self.assertEqual(writer.volume_sizes, [VOLUME_SIZE, VOLUME_SIZE])
+
+    def test_read_range_across_volumes(self):
+        data = os.urandom(VOLUME_SIZE * 3)
+        volumes = {}
+
+        def open_volume(number):
+            volumes[volume_name("archive", number)] = ClosingBytesIO()
+            return volumes[volume_name("archive", number)]
+
+        with VolumeWriter(open_volume, VOLUME_SIZE) as writer:
+            writer.write(data)
+        manifest = writer.manifest("archive")
+
+        def read_volume_range(name, offset, length):
+            return volumes[name].closed_data[offset : offset + length]
+
+        offset, length = VOLUME_SIZE - 10, VOLUME_SIZE + 20
+        self.assertEqual(
+            read_range(manifest, read_volume_range, offset, length),
+            data[offset : offset + length],
+        )
+
+
+class TestVolumeUploader(unittest.TestCase):
+    def test_bounded_uploads_in_flight(self):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def upload(path):
+            with lock:
+                in_flight.append(path)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(path)
+
+        uploader = VolumeUploader(upload, max_in_flight=2)
+        for number in range(8):
+            uploader.submit(volume_name("files.tar.zst", number))
+        uploader.wait()
+        self.assertEqual(len(peak), 8)
+        self.assertLessEqual(max(peak), 2)
+
+    def test_wait_raises_upload_errors(self):
+        def upload(path):
+            raise RuntimeError(f"upload of {path} failed")
+
+        uploader = VolumeUploader(upload, max_in_flight=2)
+        uploader.submit(volume_name("files.tar.zst", 0))
+        with self.assertRaises(RuntimeError):
+            uploader.wait()
+
+
+class TestCompressIntoVolumes(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.files_dir = os.path.join(self.test_dir, "files")
+        os.mkdir(self.files_dir)
+        self.contents = {f"file{i}.bin": os.urandom(VOLUME_SIZE // 2) for i in range(6)}
+        for name, content in self.contents.items():
+            with open(os.path.join(self.files_dir, name), "wb") as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_volumes_handed_over(self):
+        uploaded = {}
+
+        def on_volume(path):
+            with open(path, "rb") as f:
+                uploaded[os.path.basename(path)] = f.read()
+            os.remove(path)
+
+        compressor = Compressor(
+            "pzstd", engine="native", volume_size=VOLUME_SIZE, seekable=True
+        )
+        manifest_path, tar_size = compressor.compress_folder(
+            self.files_dir,
+            file_ids={f"files/{name}": name for name in self.contents},
+            on_volume=on_volume,
+        )
+        self.assertTrue(manifest_path.endswith(MANIFEST_SUFFIX))
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest["size"], tar_size)
+        self.assertEqual(
+            [volume["name"] for volume in manifest["volumes"]], sorted(uploaded)
+        )
+        self.assertGreater(len(uploaded), 2)
+
+        archive = b"".join(uploaded[name] for name in sorted(uploaded))
+        with tarfile.open(fileobj=io.BytesIO(decompress("zstd", archive))) as tar:
+            self.assertEqual(
+                tar.extractfile("files/file3.bin").read(), self.contents["file3.bin"]
+            )
+
+        # Seekable archives are restored file by file across volumes
+        tar_path = manifest_path.removesuffix(MANIFEST_SUFFIX)
+        with open(f"{tar_path}{INDEX_SUFFIX}") as f:
+            index = json.load(f)
+        for name, content in self.contents.items():
+            restored = read_member(
+                index,
+                name,
+                lambda offset, length: read_range(
+                    manifest,
+                    lambda volume, start, size: uploaded[volume][start : start + size],
+                    offset,
+                    length,
+                ),
+            )
+            self.assertEqual(restored, content)
+
+    def test_failed_compression_removes_volumes(self):
+        for i in range(4):
+            with open(os.path.join(self.files_dir, f"large{i}.bin"), "wb") as f:
+                f.write(os.urandom(3 * 1024 * 1024))
+        compressor = Compressor("pzstd", engine="native", volume_size=1024 * 1024)
+        closed = []
+
+        def fail_after_some_volumes(info, *args):
+            if len(closed) >= 2:
+                raise RuntimeError("Disk full")
+            return info
+
+        with (
+            patch.object(
+                compressor, "member_filter", return_value=fail_after_some_volumes
+            ),
+            self.assertRaises(RuntimeError),
+        ):
+            compressor.compress_folder(self.files_dir, on_volume=closed.append)
+        self.assertGreaterEqual(len(closed), 2)
+        self.assertEqual(os.listdir(self.test_dir), ["files"])
+
+    def test_streaming_archive_into_volumes(self):
+        client = FakeS3Client()
+        with patch("src.aws.s3.boto3.client", return_value=client):
+            s3 = S3("bucket", "key", "secret")
+        executor = ThreadPoolExecutor(max_workers=2)
+        pool = BufferPool(4, MIN_PART_SIZE)
+        volume_size = MIN_PART_SIZE + VOLUME_SIZE
+        archive = StreamingArchive(
+            Compressor("lz4", engine="native"),
+            lambda: VolumeWriter(
+                lambda number: s3.open_multipart_writer(
+                    volume_name("files.tar.lz4", number), pool, executor
+                ),
+                volume_size,
+            ),
+        )
+        content = os.urandom(MIN_PART_SIZE * 2)
+        path = os.path.join(self.files_dir, "large.bin")
+        with open(path, "wb") as f:
+            f.write(content)
+        archive.add(path, "files/large.bin")
+        size = archive.close()
+        executor.shutdown()
+
+        manifest = archive.manifest("files.tar.lz4")
+        self.assertEqual(manifest["size"], size)
+        self.assertEqual(len(manifest["volumes"]), -(-size // volume_size))
+        self.assertGreater(len(manifest["volumes"]), 1)
+        data = b"".join(
+            client.objects[volume["name"]] for volume in manifest["volumes"]
+        )
+        with tarfile.open(fileobj=io.BytesIO(decompress("lz4", data))) as tar:
+            self.assertEqual(tar.extractfile("files/large.bin").read(), content)
+
+
+if __name__ == "__main__":
+    unittest.main()